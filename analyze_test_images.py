@@ -1,5 +1,5 @@
 """
-Script to apply predict_image() to all test images and analyze probability distributions.
+Script to apply predict_batch() to all test images and analyze probability distributions.
 
 This script processes all images in test_data/{seed_number} directories and computes
 the probability distribution across all output classes using the model's predictions.
@@ -18,7 +18,7 @@ import csv
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'backend'))
 
 import params
-from backend.model import predict_image
+from backend.model import predict_batch, predict_image
 
 # Default container dimensions (these don't affect probability calculations)
 CONTAINER_WIDTH = 512
@@ -94,7 +94,7 @@ def analyze_probability_distribution(results):
     Analyze probability distribution across all predictions.
 
     Args:
-        results: List of prediction results from predict_image()
+        results: List of prediction results from predict_batch()
 
     Returns:
         dict: Statistics about the probability distribution
@@ -128,7 +128,7 @@ def calculate_accuracy(results, ground_truth):
     Calculate accuracy by comparing predictions with ground truth labels.
 
     Args:
-        results: List of prediction results from predict_image()
+        results: List of prediction results from predict_batch()
         ground_truth: Dictionary mapping image filename -> class index
 
     Returns:
@@ -197,25 +197,42 @@ def process_images(images, seed_number, ground_truth=None):
     results = []
     print(f"\nProcessing {len(images)} images for seed {seed_number}...")
 
-    for idx, img_path in enumerate(images):
-        try:
-            # Load image
-            image = Image.open(img_path).convert('RGB')
-
-            # Get prediction
-            result = predict_image(image, CONTAINER_WIDTH, CONTAINER_HEIGHT)
+    batch_size = params.INFERENCE_BATCH_SIZE
+    for start in range(0, len(images), batch_size):
+        batch_paths, batch_images = [], []
+        for img_path in images[start:start + batch_size]:
+            try:
+                batch_images.append(Image.open(img_path).convert('RGB'))
+                batch_paths.append(img_path)
+            except Exception as e:
+                print(f"Error loading {img_path}: {e}")
 
+        try:
+            # Get predictions of the whole batch
+            batch_results = predict_batch(
+                batch_images, CONTAINER_WIDTH, CONTAINER_HEIGHT
+            )
+        except Exception as e:
+            # retry image by image so one bad image only skips itself
+            print(f"Error processing batch starting at {batch_paths[:1]}: {e}")
+            batch_results = []
+            for img_path, image in zip(list(batch_paths), batch_images):
+                try:
+                    batch_results.append(
+                        predict_image(image, CONTAINER_WIDTH, CONTAINER_HEIGHT)
+                    )
+                except Exception as e:
+                    print(f"Error processing {img_path}: {e}")
+                    batch_paths.remove(img_path)
+
+        for img_path, result in zip(batch_paths, batch_results):
             # Add metadata
             result['image_path'] = str(img_path)
             result['image_name'] = img_path.name
             results.append(result)
 
-            if (idx + 1) % 10 == 0:
-                print(f"  Processed {idx + 1}/{len(images)} images...")
-
-        except Exception as e:
-            print(f"Error processing {img_path}: {e}")
-            continue
+        done = min(start + batch_size, len(images))
+        print(f"  Processed {done}/{len(images)} images...")
 
     print(f"Successfully processed {len(results)} images")
 
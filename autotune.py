@@ -0,0 +1,251 @@
+"""
+Benchmark CPU inference settings on this host and persist the fastest one.
+
+The backbone (concept layer activations) and the WoE stage, including the
+bootstrap WoE intervals when the model has replicates, are timed across
+batch sizes, torch intra-op thread counts and the channels_last memory format.
+The CPU budget respects cgroup quotas and the process affinity mask, so the
+result is valid inside containers. The winning configuration is written to
+params.RUNTIME_CONFIG_PATH, which params.py loads at import time. It sets the
+inference batch size and thread settings only; the training batch size and
+DataLoader workers are left alone.
+
+Usage:
+    python autotune.py [--batch-sizes 16 32 64 128] [--threads 1 2 4] [--compile]
+                       [--output path]
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# Add backend directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "backend"))
+
+import params
+
+# latency budget of the bootstrap WoE intervals of one request
+WOE_CI_BUDGET_MS = 20
+
+
+def available_cpus():
+    """
+    Number of CPUs this process may use, honouring cgroup quotas and affinity.
+
+    Returns:
+        int: Usable CPU count (at least 1)
+    """
+    cpus = os.cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        cpus = min(cpus, len(os.sched_getaffinity(0)))
+
+    quota = None
+    cpu_max = Path("/sys/fs/cgroup/cpu.max")  # cgroup v2
+    cfs_quota = Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")  # cgroup v1
+    cfs_period = Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    try:
+        if cpu_max.exists():
+            limit, period = cpu_max.read_text().split()[:2]
+            if limit != "max":
+                quota = int(limit) / int(period)
+        elif cfs_quota.exists() and cfs_period.exists():
+            limit = int(cfs_quota.read_text())
+            if limit > 0:
+                quota = limit / int(cfs_period.read_text())
+    except (OSError, ValueError):
+        quota = None
+
+    if quota is not None:
+        cpus = min(cpus, max(1, math.floor(quota)))
+    return max(1, cpus)
+
+
+def default_thread_counts(cpus):
+    counts = {cpus}
+    n = 1
+    while n < cpus:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+
+def benchmark_backbone(
+    model, layer_name, batch_size, channels_last, n_images, repeats, compiled=False
+):
+    """
+    Time the concept layer forward pass.
+
+    Returns:
+        float: Seconds per image (best of repeats), compile time excluded
+    """
+    model.batch_size = batch_size
+    model.channels_last = channels_last
+    model.compiled = compiled
+    n_images = math.ceil(n_images / batch_size) * batch_size  # single input shape
+    x = np.random.rand(n_images, *model.input_size).astype(np.float32)
+
+    model.get_feature(x[:batch_size], layer_name)  # warm up (and compile)
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.get_feature(x, layer_name)
+        best = min(best, time.perf_counter() - start)
+    return best / n_images
+
+
+def benchmark_woe(woeexplainer, repeats):
+    """
+    Time one request worth of WoE explanations (every hypothesis).
+
+    Returns:
+        float: Seconds per request (best of repeats)
+    """
+    x = woeexplainer.woe_model.means.mean(0)
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for hypothesis in range(len(woeexplainer.classes)):
+            woeexplainer.explain_for_human(
+                x=x, hypothesis=hypothesis, units="features", plot=False
+            )
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_woe_intervals(woeexplainer, repeats):
+    """
+    Time the bootstrap WoE intervals of one request (every hypothesis).
+
+    Returns:
+        float: Seconds per request (best of repeats), None without replicates
+    """
+    woe_model = woeexplainer.woe_model
+    if woe_model.bootstrap is None:
+        return None
+    x = woe_model.means.mean(0)
+    woe_model.woe_intervals(x)  # warm up
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        woe_model.woe_intervals(x)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def autotune(batch_sizes, thread_counts, n_images, repeats, try_compile=False):
+    """
+    Benchmark every configuration and pick the fastest per image end to end.
+
+    Returns:
+        tuple: (best configuration dict, list of benchmark rows)
+    """
+    from backend.model import LAYER_NAME, concept_model, woeexplainer
+
+    rows = []
+    for num_threads in thread_counts:
+        torch.set_num_threads(num_threads)
+        woe_time = benchmark_woe(woeexplainer, repeats)
+        ci_time = benchmark_woe_intervals(woeexplainer, repeats)
+        if ci_time is not None:
+            replicates = woeexplainer.woe_model.bootstrap["priors"].shape[0]
+            print(
+                f"threads={num_threads:<3} WoE intervals (B={replicates}): "
+                f"{ci_time * 1000:.2f} ms/req"
+                + (" over budget" if ci_time * 1000 > WOE_CI_BUDGET_MS else "")
+            )
+            woe_time += ci_time
+        modes = [(False, False), (True, False)]
+        if try_compile:
+            modes.append((True, True))
+        for channels_last, compiled in modes:
+            for batch_size in batch_sizes:
+                backbone_time = benchmark_backbone(
+                    concept_model,
+                    LAYER_NAME,
+                    batch_size,
+                    channels_last,
+                    n_images,
+                    repeats,
+                    compiled=compiled,
+                )
+                row = {
+                    "num_threads": num_threads,
+                    "channels_last": channels_last,
+                    "compiled": compiled,
+                    "batch_size": batch_size,
+                    "backbone_ms_per_image": backbone_time * 1000,
+                    "woe_ms_per_request": woe_time * 1000,
+                    "woe_ci_ms_per_request": (
+                        None if ci_time is None else ci_time * 1000
+                    ),
+                    "total_ms_per_image": (backbone_time + woe_time) * 1000,
+                }
+                rows.append(row)
+                print(
+                    "threads={num_threads:<3} channels_last={channels_last!s:<5} "
+                    "compiled={compiled!s:<5} "
+                    "batch={batch_size:<4} backbone={backbone_ms_per_image:8.2f} ms/img "
+                    "woe={woe_ms_per_request:7.2f} ms/req".format(**row)
+                )
+
+    if try_compile:
+        print("\nCompile report:")
+        for shape, stats in concept_model.compile_report().items():
+            print(f"  {shape}: {stats}")
+
+    best = min(rows, key=lambda r: r["total_ms_per_image"])
+    return best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--threads", type=int, nargs="+", default=None)
+    parser.add_argument("--n-images", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--compile", action="store_true", help="also benchmark the torch.compile path"
+    )
+    parser.add_argument("--output", type=Path, default=params.RUNTIME_CONFIG_PATH)
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    thread_counts = args.threads or default_thread_counts(cpus)
+    thread_counts = [t for t in thread_counts if t <= cpus]
+    print(f"Usable CPUs: {cpus}, thread counts: {thread_counts}")
+
+    best, rows = autotune(
+        args.batch_sizes, thread_counts, args.n_images, args.repeats, args.compile
+    )
+
+    config = {
+        "batch_size": best["batch_size"],
+        "num_threads": best["num_threads"],
+        # requests are served concurrently by uvicorn, keep one op in flight
+        "num_interop_threads": 1,
+        "channels_last": best["channels_last"],
+        "compiled": best["compiled"],
+        "cpus": cpus,
+        "host": platform.node(),
+        "torch_version": torch.__version__,
+        "benchmarks": rows,
+    }
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(config, f, indent=2)
+
+    print(f"\nBest: {best}")
+    print(f"Runtime configuration saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,7 @@ from torchvision.transforms import v2
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 import params
+from woe import slim
 
 # ============================================================================
 # MODEL CONFIGURATION AND LOADING
@@ -33,42 +34,25 @@ NORMALIZED_NO_AUGMENTED_TRANS = v2.Compose(
     ]
 )
 
-EXP_PATH = "{}/{}_Exp_{}_ncomp{}_seed{}_{}_{}_clf{}_{}.sav".format(
-    params.SAVE_FOLDER,
-    params.ALGO,
-    params.MODEL,
-    params.NO_CONCEPTS,
-    params.SEED,
-    params.REDUCER,
-    params.FEATURE_TYPE,
-    params.IS_TRAIN_CLF,
-    params.ICE_CLF,
-)
-WOE_EXPLAINER = "{}/{}_woeexplainer_{}_ncomp{}_seed{}_{}_{}_{}.sav".format(
-    params.SAVE_FOLDER,
-    params.ALGO,
-    params.MODEL,
-    params.NO_CONCEPTS,
-    params.SEED,
-    params.REDUCER,
-    params.FEATURE_TYPE,
-    params.WOE_CLF,
-)
-CONCEPT_MODEL = "{}/{}_concept_{}_ncomp{}_seed{}_{}_{}_clf{}_{}.sav".format(
-    params.SAVE_FOLDER,
-    params.ALGO,
-    params.MODEL,
-    params.NO_CONCEPTS,
-    params.SEED,
-    params.REDUCER,
-    params.FEATURE_TYPE,
-    params.IS_TRAIN_CLF,
-    params.ICE_CLF,
-)
+EXP_PATH = params.artifact_path("Exp")
+WOE_EXPLAINER = params.artifact_path("woeexplainer")
+CONCEPT_MODEL = params.artifact_path("concept")
 
 Exp = torch.load(EXP_PATH, map_location=torch.device(params.DEVICE), weights_only=False)
-woeexplainer = torch.load(WOE_EXPLAINER, map_location=torch.device(params.DEVICE), weights_only=False)
+if slim.slim_is_current(WOE_EXPLAINER):
+    # inference-only export (python -m woe.slim), loads without unpickling
+    woeexplainer = slim.load_slim(WOE_EXPLAINER)
+else:
+    woeexplainer = torch.load(WOE_EXPLAINER, map_location=torch.device(params.DEVICE), weights_only=False)
 concept_model = torch.load(CONCEPT_MODEL, map_location=torch.device(params.DEVICE), weights_only=False)
+# runtime settings picked by autotune.py (see params.load_runtime_config)
+concept_model.batch_size = params.INFERENCE_BATCH_SIZE
+concept_model.channels_last = params.CHANNELS_LAST
+concept_model.compiled = params.COMPILE_BACKBONE
+if Exp is not None and hasattr(Exp.reducer, "fast_transform"):
+    Exp.reducer.transform_iter = params.NMF_TRANSFORM_ITER
+# factorise the WoE conditionals once instead of on the first requests
+woeexplainer.woe_model.precompute_conditionals()
 
 class FeatureArea(BaseModel):
     feature_id: int
@@ -96,55 +80,138 @@ def woe_input_image(image):
     return original_x, h, x_feature
 
 
+def woe_input_images(images):
+    # batched woe_input_image: one backbone and reducer pass for all images
+    original_xs = np.stack(
+        [NORMALIZED_NO_AUGMENTED_TRANS(image).numpy() for image in images]
+    )
+    x = concept_model.get_feature(original_xs, layer_name=LAYER_NAME)
+    if Exp is not None:
+        x = Exp.reducer.transform(x)
+    x_features = torch.tensor(x.mean(axis=(1, 2))).to(device=params.DEVICE)
+    return original_xs, x, x_features
+
+
+def feature_areas_on_image(original_x, original_h, container_width, container_height):
+    feature_areas = []
+    for feat_idx in range(original_h.shape[-1]):
+        _, img_test_feat = Exp.get_feature_area_on_image(
+            original_x, original_h, feat_idx
+        )
+        rows = len(img_test_feat)
+        cols = len(img_test_feat[0])
+        min_x, min_y = cols, rows
+        max_x, max_y = -1, -1
+        for y in range(rows):
+            for x in range(cols):
+                if img_test_feat[y][x] == 1:
+                    min_x = min(min_x, x)
+                    max_x = max(max_x, x)
+                    min_y = min(min_y, y)
+                    max_y = max(max_y, y)
+
+        if max_x == -1 or max_y == -1:
+            continue
+
+        min_x = min_x / params.INPUT_RESIZE * container_width
+        max_x = max_x / params.INPUT_RESIZE * container_width
+        min_y = min_y / params.INPUT_RESIZE * container_height
+        max_y = max_y / params.INPUT_RESIZE * container_height
+
+        height = max_y - min_y + 1
+        width = max_x - min_x + 1
+
+        feature_areas.append(
+            {
+                "feature_id": feat_idx,
+                "feature_name": params.FEATURE_ID_TO_LABEL[feat_idx],
+                "area_coordinates": {
+                    "x": min_x,
+                    "y": min_y,
+                    "width": width,
+                    "height": height,
+                },
+            }
+        )
+    return feature_areas
+
+
+def strength_of_evidence(attwoe):
+    if 0 <= abs(attwoe) < params.WOE_THRESHOLDS["Neutral"]:
+        return "Not worth mentioning"
+    elif params.WOE_THRESHOLDS["Neutral"] < abs(attwoe) <= params.WOE_THRESHOLDS["Substantial"]:
+        return "Substantial"
+    elif params.WOE_THRESHOLDS["Substantial"] < abs(attwoe) <= params.WOE_THRESHOLDS["Strong"]:
+        return "Strong"
+    elif abs(attwoe) > params.WOE_THRESHOLDS["Strong"]:
+        return "Decisive"
+
+
+def woe_intervals(x_features):
+    # bootstrap bands of every hypothesis and feature, None without replicates
+    if woeexplainer.woe_model.bootstrap is None:
+        return None
+    return woeexplainer.woe_model.woe_intervals(x_features)
+
+
+def hypothesis_result(hypothesis_index, attwoes, posterior_log_odd, intervals=None):
+    evidence = []
+    for i, attwoe in enumerate(attwoes):
+        evidence_type = "zero"
+        if attwoe < 0:
+            evidence_type = "negative"
+        elif attwoe > 0:
+            evidence_type = "positive"
+
+        evidence.append(
+            {
+                "feature_id": i,
+                "feature_name": params.FEATURE_ID_TO_LABEL[i],
+                "evidence_type": evidence_type,
+                "soe": strength_of_evidence(attwoe),
+            }
+        )
+        if intervals is not None:
+            low, high = intervals[0][i], intervals[1][i]
+            evidence[-1]["woe_interval"] = [float(low), float(high)]
+            evidence[-1]["soe_interval"] = [
+                strength_of_evidence(low), strength_of_evidence(high)
+            ]
+
+    # posterior log odd to probability
+    prob = round(float(1 / (1 + np.exp(-float(posterior_log_odd)))), 2)
+    return {
+        "hypothesis_id": hypothesis_index,
+        "hypothesis_name": "{} ({})".format(
+            params.LABEL_FULLNAMES[hypothesis_index],
+            params.DXLABELS[hypothesis_index],
+        ),
+        "evidence": evidence,
+        "probability": prob,
+    }
+
+
+def prediction_result(hypotheses_woes, feature_areas):
+    probs = [hyp["probability"] for hyp in hypotheses_woes]
+    best_class_index = probs.index(max(probs))
+    return {
+        "recommendation": params.LABEL_FULLNAMES[best_class_index],
+        "hypotheses": hypotheses_woes,
+        "features": feature_areas,
+    }
+
+
 def predict_image(image, container_width, container_height):
     feature_areas = []
+    hypotheses_woes = []
     if image is not None:
         original_x, original_h, x_feature = woe_input_image(image)
-        num_features = x_feature.shape[0]
-
-        for feat_idx in range(num_features):
-            _, img_test_feat = Exp.get_feature_area_on_image(
-                original_x, original_h, feat_idx
-            )
-            rows = len(img_test_feat)
-            cols = len(img_test_feat[0])
-            min_x, min_y = cols, rows
-            max_x, max_y = -1, -1
-            for y in range(rows):
-                for x in range(cols):
-                    if img_test_feat[y][x] == 1:
-                        min_x = min(min_x, x)
-                        max_x = max(max_x, x)
-                        min_y = min(min_y, y)
-                        max_y = max(max_y, y)
-
-            if max_x == -1 or max_y == -1:
-                continue
-
-            min_x = min_x / params.INPUT_RESIZE * container_width
-            max_x = max_x / params.INPUT_RESIZE * container_width
-            min_y = min_y / params.INPUT_RESIZE * container_height
-            max_y = max_y / params.INPUT_RESIZE * container_height
-
-            height = max_y - min_y + 1
-            width = max_x - min_x + 1
-
-            feature_areas.append(
-                {
-                    "feature_id": feat_idx,
-                    "feature_name": params.FEATURE_ID_TO_LABEL[feat_idx],
-                    "area_coordinates": {
-                        "x": min_x,
-                        "y": min_y,
-                        "width": width,
-                        "height": height,
-                    },
-                }
-            )
+        feature_areas = feature_areas_on_image(
+            original_x, original_h, container_width, container_height
+        )
+        intervals = woe_intervals(x_feature)
 
-        hypotheses_woes = []
-        probs = []
-        for hypothesis_index, hypothesis_name in enumerate(params.DXLABELS):
+        for hypothesis_index in range(len(params.DXLABELS)):
             explain = woeexplainer.explain_for_human(
                 x=x_feature,
                 hypothesis=hypothesis_index,
@@ -152,57 +219,52 @@ def predict_image(image, container_width, container_height):
                 show_bayes=False,
                 plot=False,
             )
-
-            evidence = []
-            for i, attwoe in enumerate(explain.attwoes):
-                evidence_type = "zero"
-                if attwoe < 0:
-                    evidence_type = "negative"
-                elif attwoe > 0:
-                    evidence_type = "positive"
-
-                if 0 <= abs(attwoe) < params.WOE_THRESHOLDS["Neutral"]:
-                    soe = "Not worth mentioning"
-                elif params.WOE_THRESHOLDS["Neutral"] < abs(attwoe) <= params.WOE_THRESHOLDS["Substantial"]:
-                    soe = "Substantial"
-                elif params.WOE_THRESHOLDS["Substantial"] < abs(attwoe) <= params.WOE_THRESHOLDS["Strong"]:
-                    soe = "Strong"
-                elif abs(attwoe) > params.WOE_THRESHOLDS["Strong"]:
-                    soe = "Decisive"
-
-                evidence.append(
-                    {
-                        "feature_id": i,
-                        "feature_name": params.FEATURE_ID_TO_LABEL[i],
-                        "evidence_type": evidence_type,
-                        "soe": soe,
-                    }
-                )
-
-            posterior_log_odd = (
-                explain.total_woe + explain.base_lods
-            )  # get posterior log odd
-            post_odd = torch.exp(posterior_log_odd).item()  # get posterior odd
-            prob = post_odd / (1 + post_odd)
-            prob = round(prob, 2)  # convert odd to probability
-            probs.append(prob)
-
             hypotheses_woes.append(
-                {
-                    "hypothesis_id": hypothesis_index,
-                    "hypothesis_name": "{} ({})".format(
-                        params.LABEL_FULLNAMES[hypothesis_index], hypothesis_name
+                hypothesis_result(
+                    hypothesis_index,
+                    explain.attwoes,
+                    explain.total_woe + explain.base_lods,
+                    None
+                    if intervals is None
+                    else (
+                        intervals["low"][0, hypothesis_index],
+                        intervals["high"][0, hypothesis_index],
                     ),
-                    "evidence": evidence,
-                    "probability": prob,
-                }
+                )
             )
-        best_class_index = probs.index(max(probs))
-        best_class_name = params.LABEL_FULLNAMES[best_class_index]
 
-    result = {
-        "recommendation": best_class_name,
-        "hypotheses": hypotheses_woes,
-        "features": feature_areas,
-    }
-    return result
+    return prediction_result(hypotheses_woes, feature_areas)
+
+
+def predict_batch(images, container_width, container_height):
+    """
+    predict_image for many images: the backbone runs on the whole batch and
+    the WoE of every image, hypothesis and feature comes from one vectorized
+    woeexplainer.explain_batch call.
+    """
+    if len(images) == 0:
+        return []
+    original_xs, hs, x_features = woe_input_images(images)
+    hypotheses = list(range(len(params.DXLABELS)))
+    explain = woeexplainer.explain_batch(x_features, hypotheses, units="features")
+    posterior_lods = explain.posterior_lods
+    intervals = woe_intervals(x_features)
+
+    results = []
+    for n in range(len(images)):
+        hypotheses_woes = [
+            hypothesis_result(
+                h,
+                explain.attwoes[n, j],
+                posterior_lods[n, j],
+                None
+                if intervals is None
+                else (intervals["low"][n, j], intervals["high"][n, j]),
+            )
+            for j, h in enumerate(hypotheses)
+        ]
+        feature_areas = feature_areas_on_image(
+            original_xs[n], hs[n], container_width, container_height
+        )
+        results.append(prediction_result(hypotheses_woes, feature_areas))
+    return results
@@ -0,0 +1,152 @@
+"""
+Benchmark TorchNMF against sklearn NMF on concept layer activations.
+
+Fit time and relative reconstruction error ||X - WH|| / ||X|| are reported for
+each solver. The serving-time projection (ChannelDecompositionReducer with
+transform_iter set) is timed against sklearn's NMF.transform, and the script
+fails if its concept maps deviate from sklearn's by more than --transform-tol.
+
+Activations are read from a .npy file of shape [N, H, W, C] or [N, C] (e.g.
+saved layer4 feature maps); without one, a synthetic non-negative low-rank
+matrix of the requested size is used.
+
+Usage:
+    python benchmark_nmf.py [--features acts.npy] [--n-samples 50000] [--n-components 7]
+                            [--transform-tol 0.05]
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.decomposition import NMF
+
+import params
+from ice.channel_reducer import ChannelDecompositionReducer
+from ice.torch_nmf import TorchNMF
+
+
+def synthetic_activations(n_samples, n_features, rank, seed):
+    rng = np.random.default_rng(seed)
+    W = rng.gamma(1.0, 1.0, size=(n_samples, rank))
+    H = rng.gamma(0.3, 1.0, size=(rank, n_features))
+    noise = rng.gamma(0.1, 0.1, size=(n_samples, n_features))
+    return (W @ H + noise).astype(np.float32)
+
+
+def relative_error(X, W, H):
+    return np.linalg.norm(X - W @ H) / np.linalg.norm(X)
+
+
+def benchmark(X, n_components, max_iter, seed):
+    """
+    Fit every solver on X.
+
+    Returns:
+        list: Rows of (name, fit seconds, relative error, iterations)
+    """
+    solvers = {
+        "sklearn NMF (cd)": NMF(
+            n_components=n_components, max_iter=max_iter, random_state=seed
+        ),
+        "sklearn NMF (mu)": NMF(
+            n_components=n_components,
+            max_iter=max_iter,
+            solver="mu",
+            init="random",
+            random_state=seed,
+        ),
+        "TorchNMF (mu)": TorchNMF(
+            n_components=n_components, max_iter=max_iter, random_state=seed
+        ),
+    }
+
+    rows = []
+    for name, solver in solvers.items():
+        start = time.perf_counter()
+        W = solver.fit_transform(X)
+        elapsed = time.perf_counter() - start
+        err = relative_error(X, W, solver.components_)
+        rows.append((name, elapsed, err, solver.n_iter_))
+        print(
+            f"{name:<20} fit {elapsed:8.2f}s  rel. error {err:.4f}  "
+            f"iters {solver.n_iter_}"
+        )
+    return rows
+
+
+def benchmark_transform(X, n_components, seed, n_iters, tol, map_size=7):
+    """
+    Compare the fixed-iteration projection with sklearn's NMF.transform.
+
+    X is split into images of map_size x map_size positions. The exact solver
+    is called once per image, as the backend did; the fast path projects all
+    images in one batch.
+
+    Returns:
+        list: Rows of (n_iter, ms per image, max relative error)
+    """
+    n_images = X.shape[0] // (map_size * map_size)
+    acts = X[: n_images * map_size * map_size].reshape(
+        n_images, map_size, map_size, -1
+    )
+    reducer = ChannelDecompositionReducer(
+        n_components=n_components, reduction_alg="NMF", random_state=seed
+    )
+    reducer.fit(acts)
+
+    start = time.perf_counter()
+    for i in range(n_images):
+        reducer.transform(acts[i : i + 1])
+    exact_ms = (time.perf_counter() - start) / n_images * 1000
+    print(f"\nsklearn NMF.transform: {exact_ms:.3f} ms/image")
+
+    rows = []
+    for n_iter in n_iters:
+        start = time.perf_counter()
+        reducer.fast_transform(acts, n_iter)
+        fast_ms = (time.perf_counter() - start) / n_images * 1000
+        err = reducer.fast_transform_error(acts, n_iter)
+        rows.append((n_iter, fast_ms, err))
+        print(
+            f"projection n_iter={n_iter:<3} {fast_ms:.3f} ms/image  "
+            f"max rel. error {err:.4f}"
+        )
+
+    assert rows[-1][2] <= tol, (
+        f"Concept maps deviate from sklearn by {rows[-1][2]:.4f} > {tol} "
+        f"with n_iter={rows[-1][0]}"
+    )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--features", type=str, default=None)
+    parser.add_argument("--n-samples", type=int, default=50000)
+    parser.add_argument("--n-features", type=int, default=2048)
+    parser.add_argument("--n-components", type=int, default=params.NO_CONCEPTS)
+    parser.add_argument("--max-iter", type=int, default=200)
+    parser.add_argument(
+        "--transform-iters", type=int, nargs="+", default=[2, 5, 10, 20]
+    )
+    parser.add_argument("--transform-tol", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.features:
+        X = np.load(args.features, mmap_mode="r")
+        X = np.asarray(X.reshape(-1, X.shape[-1])[: args.n_samples], dtype=np.float32)
+    else:
+        X = synthetic_activations(
+            args.n_samples, args.n_features, args.n_components, params.SEED
+        )
+    print(f"Activation matrix: {X.shape}")
+
+    benchmark(X, args.n_components, args.max_iter, params.SEED)
+    benchmark_transform(
+        X, args.n_components, params.SEED, args.transform_iters, args.transform_tol
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,18 @@ import sklearn.cluster
 
 from sklearn.base import BaseEstimator
 
+from ice.torch_nmf import TorchNMF, nnls_projection
+
+# estimators implemented in this package, on top of sklearn's
+CUSTOM_DECOMPOSITIONS = {"TorchNMF": TorchNMF}
+
+# estimators whose transform is a non-negative least squares solve
+NMF_ALGORITHMS = (
+    sklearn.decomposition.NMF,
+    sklearn.decomposition.MiniBatchNMF,
+    TorchNMF,
+)
+
 ALGORITHM_NAMES = {}
 for name in dir(sklearn.decomposition):
     obj = sklearn.decomposition.__getattribute__(name)
@@ -36,9 +48,14 @@ for name in dir(sklearn.cluster):
     obj = sklearn.cluster.__getattribute__(name)
     if isinstance(obj, type) and issubclass(obj, BaseEstimator):
         ALGORITHM_NAMES[name] = "cluster"
+for name in CUSTOM_DECOMPOSITIONS:
+    ALGORITHM_NAMES[name] = "decomposition"
 
 
 class ChannelDecompositionReducer(object):
+    # number of projection sweeps used by transform for NMF, None runs the
+    # estimator's own solver (class level so older pickles get the default)
+    transform_iter = None
 
     def __init__(self, n_components=3, reduction_alg="NMF", **kwargs):
 
@@ -51,6 +68,7 @@ class ChannelDecompositionReducer(object):
             obj = sklearn.decomposition.__getattribute__(name)
             if isinstance(obj, type) and issubclass(obj, BaseEstimator):
                 algorithm_map[name] = obj
+        algorithm_map.update(CUSTOM_DECOMPOSITIONS)
         if isinstance(reduction_alg, str):
             if reduction_alg in algorithm_map:
                 reduction_alg = algorithm_map[reduction_alg]
@@ -63,6 +81,10 @@ class ChannelDecompositionReducer(object):
         self._reducer = reduction_alg(n_components=n_components, **kwargs)
         self._is_fit = False
 
+    @property
+    def supports_partial_fit(self):
+        return hasattr(self._reducer, "partial_fit")
+
     def _apply_flat(cls, f, acts):
         orig_shape = acts.shape
         acts_flat = acts.reshape([-1, acts.shape[-1]])
@@ -80,15 +102,40 @@ class ChannelDecompositionReducer(object):
         self._is_fit = True
         return res
 
+    def partial_fit(self, acts):
+        # online update from one batch of activations (e.g. MiniBatchNMF)
+        self._apply_flat(self._reducer.partial_fit, acts)
+        self._is_fit = True
+        return self
+
     def fit_transform(self, acts):
         res = self._apply_flat(self._reducer.fit_transform, acts)
         self._is_fit = True
         return res
 
     def transform(self, acts):
+        if self.transform_iter is not None and isinstance(
+            self._reducer, NMF_ALGORITHMS
+        ):
+            return self.fast_transform(acts, self.transform_iter)
         res = self._apply_flat(self._reducer.transform, acts)
         return res
 
+    def fast_transform(self, acts, n_iter=10):
+        # fixed-iteration batched NNLS against the stored components
+        res = self._apply_flat(
+            lambda a: nnls_projection(a, self._reducer.components_, n_iter=n_iter),
+            acts,
+        )
+        return res
+
+    def fast_transform_error(self, acts, n_iter=10):
+        # max relative deviation of the fast concept maps from the exact solver
+        exact = self._apply_flat(self._reducer.transform, acts)
+        fast = self.fast_transform(acts, n_iter)
+        scale = np.abs(exact).max(axis=tuple(range(exact.ndim - 1))) + 1e-8
+        return (np.abs(fast - exact) / scale).max()
+
     def inverse_transform(self, acts):
         if hasattr(self._reducer, "inverse_transform"):
             res = self._apply_flat(self._reducer.inverse_transform, acts)
@@ -98,8 +145,14 @@ class ChannelDecompositionReducer(object):
 
 
 class ChannelClusterReducer(object):
+    # temperature of the soft assignment in transform, relative to the spread
+    # of the cluster centres; None gives hard one-hot maps (class level so
+    # older pickles get the default)
+    temperature = None
 
-    def __init__(self, n_components=3, reduction_alg="KMeans", **kwargs):
+    def __init__(
+        self, n_components=3, reduction_alg="KMeans", temperature=None, **kwargs
+    ):
 
         if not isinstance(n_components, int):
             raise ValueError("n_components must be an int, not '%s'." % n_components)
@@ -119,48 +172,107 @@ class ChannelClusterReducer(object):
                 )
 
         self.n_components = n_components
+        self.temperature = temperature
         self._reducer = reduction_alg(n_clusters=n_components, **kwargs)
         self._is_fit = False
 
+    @property
+    def supports_partial_fit(self):
+        return hasattr(self._reducer, "partial_fit")
+
     def _apply_flat(self, f, acts):
         """Utility for applying f to inner dimension of acts.
         Flattens acts into a 2D tensor, applies f, then unflattens so that all
-        dimesnions except innermost are unchanged.
+        dimesnions except innermost are unchanged. A 1D result (cluster labels)
+        keeps the shape of acts without the innermost dimension.
         """
         orig_shape = acts.shape
         acts_flat = acts.reshape([-1, acts.shape[-1]])
         new_flat = f(acts_flat)
         if not isinstance(new_flat, np.ndarray):
             return new_flat
+        if new_flat.ndim == 1:
+            return new_flat.reshape(orig_shape[:-1])
         shape = list(orig_shape[:-1]) + [-1]
-        new_flat = new_flat.reshape(shape)
+        return new_flat.reshape(shape)
 
-        if new_flat.shape[-1] == 1:
-            new_flat = new_flat.reshape(-1)
-            t_flat = np.zeros([new_flat.shape[0], self.n_components])
-            t_flat[np.arange(new_flat.shape[0]), new_flat] = 1
-            new_flat = t_flat.reshape(shape)
+    def _one_hot(self, labels):
+        # labels are kept as ints, the dense maps are only built for the output
+        return np.eye(self.n_components, dtype=np.float32)[labels]
 
-        return new_flat
+    def _set_components(self):
+        self._reducer.components_ = self._reducer.cluster_centers_
 
     def fit(self, acts):
         if hasattr(self._reducer, "partial_fit"):
             res = self._apply_flat(self._reducer.partial_fit, acts)
         else:
             res = self._apply_flat(self._reducer.fit, acts)
-        self._reducer.components_ = self._reducer.cluster_centers_
+        self._set_components()
         self._is_fit = True
         return res
 
+    def partial_fit(self, acts):
+        # online update from one batch of activations (MiniBatchKMeans)
+        self._apply_flat(self._reducer.partial_fit, acts)
+        self._set_components()
+        self._is_fit = True
+        return self
+
     def fit_predict(self, acts):
-        res = self._apply_flat(self._reducer.fit_predict, acts)
-        self._reducer.components_ = self._reducer.cluster_centers_
+        labels = self._apply_flat(self._reducer.fit_predict, acts)
+        self._set_components()
         self._is_fit = True
-        return res
+        return self._one_hot(labels)
+
+    def fit_transform(self, acts):
+        labels = self._apply_flat(self._reducer.fit_predict, acts)
+        self._set_components()
+        self._is_fit = True
+        if self.temperature is None:
+            return self._one_hot(labels)
+        return self.soft_transform(acts, self.temperature)
+
+    def predict_labels(self, acts):
+        # int cluster index per position, shape of acts without the channels
+        return self._apply_flat(lambda a: self._sq_distances(a).argmin(axis=1), acts)
 
     def transform(self, acts):
-        res = self._apply_flat(self._reducer.predict, acts)
-        return res
+        if self.temperature is not None:
+            return self.soft_transform(acts, self.temperature)
+        return self._one_hot(self.predict_labels(acts))
+
+    def _sq_distances(self, acts_flat):
+        # ||x||^2 - 2 x.c + ||c||^2, a single matmul against the centres
+        centers = np.asarray(self._reducer.cluster_centers_, dtype=np.float32)
+        acts_flat = np.asarray(acts_flat, dtype=np.float32)
+        d = acts_flat @ centers.T
+        d *= -2
+        d += np.einsum("ij,ij->i", acts_flat, acts_flat)[:, None]
+        d += np.einsum("ij,ij->i", centers, centers)[None, :]
+        return np.maximum(d, 0, out=d)
+
+    def _center_scale(self):
+        # mean squared distance between distinct centres
+        d = self._sq_distances(self._reducer.cluster_centers_)
+        k = d.shape[0]
+        return d.sum() / max(k * (k - 1), 1) + 1e-8
+
+    def soft_transform(self, acts, temperature=1.0):
+        """Soft cluster memberships, a softmax over negative squared distances.
+        Small temperatures approach the hard one-hot assignment.
+        """
+        scale = temperature * self._center_scale()
+
+        def soft(acts_flat):
+            logits = self._sq_distances(acts_flat)
+            logits -= logits.min(axis=1, keepdims=True)
+            logits *= -1.0 / scale
+            np.exp(logits, out=logits)
+            logits /= logits.sum(axis=1, keepdims=True)
+            return logits
+
+        return self._apply_flat(soft, acts)
 
     def inverse_transform(self, acts):
         res = np.dot(acts, self._reducer.components_)
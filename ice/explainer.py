@@ -1,21 +1,125 @@
-import matplotlib.pyplot as plt
 import numpy as np
-import pydotplus
 import torch
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import time
 import pickle
 import os
 import shutil
 
 from ice import channel_reducer
+from ice.graph_render import GraphBatch
 import params
 from preprocessing import initdata
 import classifiers
 
 
+class _RunningMoments:
+    # per-column mean/std/min/max accumulated over batches in float64
+
+    def __init__(self, n):
+        self.count = 0
+        self.sum = np.zeros(n)
+        self.sumsq = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        self.count += X.shape[0]
+        self.sum += X.sum(axis=0)
+        self.sumsq += (X**2).sum(axis=0)
+        self.min = np.minimum(self.min, X.min(axis=0))
+        self.max = np.maximum(self.max, X.max(axis=0))
+
+    def summary(self):
+        mean = self.sum / self.count
+        std = np.sqrt(np.maximum(self.sumsq / self.count - mean**2, 0))
+        return [mean, std, self.min, self.max]
+
+
+class _StreamingTopK:
+    # top-k scores and sample ids of many rankings at once; only ids are kept
+    # while streaming, the samples are gathered once at the end. With groups
+    # (lesion ids) a ranking keeps at most one sample per group.
+
+    def __init__(self, n_rankings, k):
+        self.k = k
+        self.scores = np.full((n_rankings, k), -np.inf, dtype=np.float32)
+        self.ids = np.full((n_rankings, k), -1, dtype=np.int64)
+        self.groups = np.full((n_rankings, k), -1, dtype=np.int64)
+
+    def _broadcast(self, values):
+        return np.broadcast_to(values, (self.ids.shape[0], len(values)))
+
+    def update(self, scores, ids, groups=None):
+        # scores [n_samples, n_rankings], ids and groups [n_samples]
+        if groups is None:
+            groups = np.full(len(ids), -1)
+        scores = np.concatenate([self.scores, np.asarray(scores).T], axis=1)
+        ids = np.concatenate([self.ids, self._broadcast(ids)], axis=1)
+        groups = np.concatenate([self.groups, self._broadcast(groups)], axis=1)
+        if (groups >= 0).any():
+            scores = self._best_per_group(scores, groups)
+        if scores.shape[1] > self.k:
+            keep = np.argpartition(scores, -self.k, axis=1)[:, -self.k :]
+            scores = np.take_along_axis(scores, keep, axis=1)
+            ids = np.take_along_axis(ids, keep, axis=1)
+            groups = np.take_along_axis(groups, keep, axis=1)
+        self.scores, self.ids, self.groups = scores, ids, groups
+
+    def _best_per_group(self, scores, groups):
+        # keep the best score of every (ranking, group), drop the others
+        rows = np.arange(scores.shape[0])[:, None]
+        order = np.argsort(-scores, axis=1, kind="stable")
+        key = rows * (groups.max() + 2) + groups[rows, order] + 1
+        _, first = np.unique(key.ravel(), return_index=True)
+        keep = np.zeros(key.size, dtype=bool)
+        keep[first] = True
+        keep = keep.reshape(key.shape) | (groups[rows, order] < 0)
+        best = np.full_like(scores, -np.inf)
+        best[rows, order] = np.where(keep, scores[rows, order], -np.inf)
+        return best
+
+    def result(self):
+        # ids per ranking in ascending score order, unfilled slots dropped
+        order = np.argsort(self.scores, axis=1, kind="stable")
+        ids = np.take_along_axis(self.ids, order, axis=1)
+        valid = np.take_along_axis(self.scores, order, axis=1) > -np.inf
+        return [row[mask] for row, mask in zip(ids, valid)]
+
+
+def _render_feature(utils, x, h, path, featureimgtopk, filter_args):
+    # prototypes of one concept side by side, with the contour of the largest
+    # region of each concept map; module level so a process pool can run it
+    x, h = utils.img_filter(x, h, **filter_args)
+    img_width, img_height = utils.img_width, utils.img_height
+    combined_img_height = img_height * featureimgtopk
+    # the processing in ImageUtils handles channel last
+    nimg = np.zeros([img_width, combined_img_height, utils.nchannels])
+    nh = np.zeros([img_width, combined_img_height])
+    num_examples = x.shape[0]  # should be equal to featureimgtopk
+    for i in range(num_examples):
+        timg = utils.deprocessing(x[i])
+        if timg.max() > 1:
+            timg = timg / 255.0
+            timg = abs(timg)
+        timg = np.clip(timg, 0, 1)
+        max_h = utils.find_max_area_contour(h[i])
+        nimg[:, i * img_width : (i + 1) * img_height, :] = timg
+        nh[:, i * img_width : (i + 1) * img_height] = max_h
+    # same look as contour_img saved at params.DPI
+    return utils.contour_jpg(nimg, nh, path, scale=params.DPI / 100)
+
+
 class Explainer:
+    # class level defaults so that explainers pickled before these options
+    # existed keep working after torch.load
+    weight_estimator = "analytic"
+    reducer_epochs = 1
+
     def __init__(
         self,
         args=None,
@@ -29,6 +133,8 @@ class Explainer:
         featuretopk=80,
         featureimgtopk=5,
         epsilon=1e-4,
+        weight_estimator="analytic",
+        reducer_epochs=1,
     ):
         self.args = args
         self.title = title
@@ -41,6 +147,8 @@ class Explainer:
         self.featureimgtopk = featureimgtopk  # number of images for a feature
         self.n_components = n_components
         self.epsilon = epsilon
+        self.weight_estimator = weight_estimator
+        self.reducer_epochs = reducer_epochs  # passes for streaming reducers
         self.utils = utils
         self.reducer = None
         self.feature_distribution = None
@@ -80,32 +188,46 @@ class Explainer:
         print("Training reducer:")
 
         if self.reducer is None:
-            if not self.reducer_type in channel_reducer.ALGORITHM_NAMES:
-                print("reducer not exist")
+            if not self._build_reducer():
                 return
 
-            if channel_reducer.ALGORITHM_NAMES[self.reducer_type] == "decomposition":
-                if self.reducer_type == "NMF":
-                    self.reducer = channel_reducer.ChannelDecompositionReducer(
-                        n_components=self.n_components,
-                        reduction_alg=self.reducer_type,
-                        max_iter=2000,
-                    )
-                else:
-                    self.reducer = channel_reducer.ChannelDecompositionReducer(
-                        n_components=self.n_components,
-                        reduction_alg=self.reducer_type,
-                    )
-            else:
-                self.reducer = channel_reducer.ChannelClusterReducer(
-                    n_components=self.n_components, reduction_alg=self.reducer_type
-                )
+        if getattr(self.reducer, "supports_partial_fit", False):
+            return self._train_reducer_streaming(model, loaders)
 
         X_features = []
         for loader in loaders:
             X_features.append(model.get_feature(loader, self.layer_name))
         print("1/5 Feature maps gathered.")
 
+        return self._fit_reducer_on_features(model, X_features)
+
+    def _build_reducer(self):
+        if not self.reducer_type in channel_reducer.ALGORITHM_NAMES:
+            print("reducer not exist")
+            return False
+
+        if channel_reducer.ALGORITHM_NAMES[self.reducer_type] == "decomposition":
+            if self.reducer_type in ["NMF", "TorchNMF"]:
+                self.reducer = channel_reducer.ChannelDecompositionReducer(
+                    n_components=self.n_components,
+                    reduction_alg=self.reducer_type,
+                    max_iter=2000,
+                )
+            else:
+                self.reducer = channel_reducer.ChannelDecompositionReducer(
+                    n_components=self.n_components,
+                    reduction_alg=self.reducer_type,
+                )
+        else:
+            self.reducer = channel_reducer.ChannelClusterReducer(
+                n_components=self.n_components,
+                reduction_alg=self.reducer_type,
+                temperature=params.CLUSTER_TEMPERATURE,
+            )
+        return True
+
+    def _fit_reducer_on_features(self, model, X_features):
+        # X_features: one array of layer activations per class
         if not self.reducer._is_fit:
             nX_feature = np.concatenate(X_features)
             total = np.prod(nX_feature.shape)
@@ -119,8 +241,9 @@ class Explainer:
             print("loading complete, with size of {}".format(nX_feature.shape))
             start_time = time.time()
             nX = self.reducer.fit_transform(nX_feature)
+            self.reducer_fit_time = time.time() - start_time
 
-            print("2/5 Reducer trained, spent {} s.".format(time.time() - start_time))
+            print("2/5 Reducer trained, spent {} s.".format(self.reducer_fit_time))
 
         self.cavs = self.reducer._reducer.components_
         nX = nX.mean(axis=(1, 2))
@@ -165,6 +288,69 @@ class Explainer:
 
         return self.reducer_err
 
+    def _train_reducer_streaming(self, model, loaders):
+        # online fit (e.g. MiniBatchNMF): feature maps are taken batch by batch
+        # from the loaders, so memory does not grow with the dataset
+        if not self.reducer._is_fit:
+            start_time = time.time()
+            for epoch in range(self.reducer_epochs):
+                for loader in loaders:
+                    for X in loader:
+                        self.reducer.partial_fit(
+                            model.get_feature(X[0], self.layer_name)
+                        )
+                print(
+                    "1/5 Streaming pass {}/{} done.".format(
+                        epoch + 1, self.reducer_epochs
+                    )
+                )
+            self.reducer_fit_time = time.time() - start_time
+            print("2/5 Reducer trained, spent {} s.".format(self.reducer_fit_time))
+
+        self.cavs = self.reducer._reducer.components_
+
+        return self._reducer_fidelity(
+            model,
+            [
+                (model.get_feature(X[0], self.layer_name) for X in loader)
+                for loader in loaders
+            ],
+        )
+
+    def _reducer_fidelity(self, model, class_batches):
+        # concept distributions and reconstruction error of the fitted reducer,
+        # from batches of layer activations (one iterable per class)
+        overall = _RunningMoments(self.n_components)
+        self.feature_distribution = {"classes": []}
+        err = []
+        for i, batches in enumerate(class_batches):
+            class_moments = _RunningMoments(self.n_components)
+            abs_dif, res_sum, count = 0.0, 0.0, 0
+            for X_feature in batches:
+                t_feature = self.reducer.transform(X_feature)
+                overall.update(t_feature.mean(axis=(1, 2)))
+                class_moments.update(self._feature_filter(t_feature))
+
+                res_true = model.feature_predict(X_feature, layer_name=self.layer_name)[
+                    :, i
+                ]
+                res_recon = model.feature_predict(
+                    self.reducer.inverse_transform(t_feature), layer_name=self.layer_name
+                )[:, i]
+                abs_dif += abs(res_true - res_recon).sum()
+                res_sum += res_true.sum()
+                count += res_true.shape[0]
+
+            self.feature_distribution["classes"].append(class_moments.summary())
+            err.append(abs_dif / count / (abs(res_sum / count) + self.epsilon))
+
+        self.feature_distribution["overall"] = list(zip(*overall.summary()))
+        self.reducer_err = np.array(err)
+
+        print("3/5 Error estimated, fidelity: {}.".format(self.reducer_err))
+
+        return self.reducer_err
+
     def _estimate_weight(self, model, loaders):
         if self.reducer is None:
             return
@@ -179,7 +365,19 @@ class Explainer:
 
         print("4/5 Weight estimator initialized.")
 
-        self.test_weight = []
+        if self.weight_estimator == "analytic":
+            self.test_weight = self._analytic_weight(model, X_feature)
+        else:
+            self.test_weight = self._finite_difference_weight(model, X_feature)
+
+        print("5/5 Weight estimated.")
+
+        if getattr(self.args, "check_weight", False):
+            self.check_weight_agreement(model, X_feature)
+
+    def _finite_difference_weight(self, model, X_feature):
+        # central difference along each cav, 2 x n_components forward passes
+        test_weight = []
         for i in range(self.n_components):
             cav = self.cavs[i, :]
 
@@ -194,11 +392,32 @@ class Explainer:
             dif = res_dif.mean(axis=0) / (2 * self.epsilon)
             if type(dif) is not np.ndarray:
                 dif = np.array([dif])
-            self.test_weight.append(dif)
-
-        print("5/5 Weight estimated.")
-
-        self.test_weight = np.array(self.test_weight)
+            test_weight.append(dif)
+
+        return np.array(test_weight)
+
+    def _analytic_weight(self, model, X_feature):
+        # the cav is added at every spatial position, so the directional
+        # derivative is the spatially summed gradient projected on the cav
+        grads = model.feature_gradient(X_feature, layer_name=self.layer_name)
+        grads = grads.sum(axis=(1, 2)) / X_feature.shape[0]  # [n_out, channels]
+        return np.dot(self.cavs, grads.T)  # [n_components, n_out]
+
+    def check_weight_agreement(self, model, X_feature, n_samples=256, rtol=1e-2):
+        if X_feature.shape[0] > n_samples:
+            idx = np.random.choice(X_feature.shape[0], n_samples, replace=False)
+            X_feature = X_feature[np.sort(idx)]
+
+        w_analytic = self._analytic_weight(model, X_feature)
+        w_fd = self._finite_difference_weight(model, X_feature)
+        err = abs(w_analytic - w_fd).max() / (abs(w_fd).max() + self.epsilon)
+        if err > rtol:
+            raise ValueError(
+                "Analytic and finite difference weights disagree, "
+                "relative error {:.2e} > {:.0e}".format(err, rtol)
+            )
+        print("Weight agreement check passed, relative error {:.2e}".format(err))
+        return err
 
     def _train_concepts_on_classifier(self, model, processed_data):
         if self.reducer is None:
@@ -215,6 +434,12 @@ class Explainer:
             X_test_features = self.reducer.transform(
                 model.get_feature(processed_data.X_test, layer_name=self.layer_name)
             )
+        return self._classify_concepts(
+            X_features, processed_data.balanced_y, X_test_features
+        )
+
+    def _classify_concepts(self, X_features, y, X_test_features):
+        # fit the concept classifier on concept maps, weights become test_weight
         if self.args.feature_type == "mean":
             X_features = X_features.mean(axis=(1, 2))
             X_test_features = X_test_features.mean(axis=(1, 2))
@@ -227,17 +452,21 @@ class Explainer:
             X_features = np.delete(X_features, remove_concepts, axis=1)
             X_test_features = np.delete(X_test_features, remove_concepts, axis=1)
         classifier = classifiers.factory(model_type=self.args.ice_clf)
-        classifier.fit(X_features, processed_data.balanced_y)
+        classifier.fit(X_features, y)
+        self._set_test_weight(classifier)
+        y_test_pred = classifier.predict(X_test_features)
+        y_preds = y_test_pred.tolist()
+        self.clf_y_preds = y_preds
+        return self.clf_y_preds
+
+    def _set_test_weight(self, classifier):
+        # concept weights [n_components, n_classes] of a fitted concept classifier
         if self.args.ice_clf in ["lda", "logistic"]:
             self.test_weight = np.transpose(classifier.coef_)
         elif self.args.ice_clf == "gnb":
             self.test_weight = np.transpose(classifier.theta_)
         elif self.args.ice_clf == "mlp":
             self.test_weight = classifier.coefs_[0]
-        y_test_pred = classifier.predict(X_test_features)
-        y_preds = y_test_pred.tolist()
-        self.clf_y_preds = y_preds
-        return self.clf_y_preds
 
     def generate_features(self, model, loaders, threshold):
         self._visualise_features(model, loaders)
@@ -256,23 +485,7 @@ class Explainer:
             res = -abs(res - threshold)
         return res
 
-    def _update_feature_dict(self, x, h, nx, nh, threshold=None):
-
-        if type(x) == type(None):
-            return nx, nh
-        else:
-            x = np.concatenate([x, nx])
-            h = np.concatenate([h, nh])
-
-            nidx = self._feature_filter(h, threshold=threshold).argsort()[
-                -self.featureimgtopk :
-            ]
-            x = x[nidx, ...]
-            h = h[nidx, ...]
-            return x, h
-
     def _visualise_features(self, model, loaders, featureIdx=None, inter_dict=None):
-        path_lesion_dict = initdata.get_lesion_by_path()
         featuretopk = min(self.featuretopk, self.n_components)
         imgTopk = self.featureimgtopk
         if featureIdx is None:
@@ -295,68 +508,71 @@ class Explainer:
         print("visualising features:")
         print(featureIdx)
 
-        features = {}
-        for No in featureIdx:
-            features[No] = [None, None]
-
-        if inter_dict is not None:
-            for k in inter_dict.keys():
-                inter_dict[k] = [[None, None] for No in featureIdx]
+        # one ranking per feature, plus one per feature and inter_dict level
+        # (closest to that quantile of the feature range)
+        levels = list(inter_dict.keys()) if inter_dict is not None else []
+        targets = []
+        for k in levels:
+            overall = [self.feature_distribution["overall"][No] for No in featureIdx]
+            vmin = np.array([v[2] for v in overall])
+            vmax = np.array([v[3] for v in overall])
+            targets.append((vmax - vmin) * k + vmin)
+        topk = _StreamingTopK(len(featureIdx) * (1 + len(levels)), imgTopk)
+        offsets = np.cumsum([0] + [len(loader.dataset) for loader in loaders])
 
         print("loading training data")
         for i, loader in enumerate(loaders):
 
+            seen = offsets[i]
             for X in loader:
                 X_data, X_paths = X[0], X[2]
 
-                X_unique = []  # select images not from the same lesion
-                lesion_used = set()
-                for ix, x in enumerate(X_data):
-                    base_name = os.path.basename(X_paths[ix])
-                    image_id = os.path.splitext(base_name)[0]
-                    lesion = path_lesion_dict[image_id]
-                    if lesion not in lesion_used:
-                        X_unique.append(x)
-                        lesion_used.add(lesion)
-
-                X_unique = torch.stack(X_unique)
+                # prototypes of a feature come from distinct lesions
+                lesions = initdata.get_lesion_ids(X_paths)
+
                 featureMaps = self.reducer.transform(
-                    model.get_feature(X_unique, self.layer_name)
+                    model.get_feature(X_data, self.layer_name)
                 )
-
-                X_feature = self._feature_filter(featureMaps)
-
-                for No in featureIdx:
-                    samples, heatmap = features[No]
-                    idx = X_feature[:, No].argsort()[-imgTopk:]
-
-                    nheatmap = featureMaps[idx, :, :, No]
-                    nsamples = X_unique[idx, ...]
-
-                    samples, heatmap = self._update_feature_dict(
-                        samples, heatmap, nsamples, nheatmap
-                    )
-
-                    features[No] = [samples, heatmap]
-
-                    if inter_dict is not None:
-                        for k in inter_dict.keys():
-                            vmin = self.feature_distribution["overall"][No][2]
-                            vmax = self.feature_distribution["overall"][No][3]
-                            temp_v = (vmax - vmin) * k + vmin
-                            inter_dict[k][No] = self._update_feature_dict(
-                                inter_dict[k][No][0],
-                                inter_dict[k][No][1],
-                                X_unique,
-                                featureMaps[:, :, :, No],
-                                threshold=temp_v,
-                            )
+                X_feature = self._feature_filter(featureMaps)[:, featureIdx]
+                scores = [X_feature] + [-abs(X_feature - t) for t in targets]
+                topk.update(
+                    np.concatenate(scores, axis=1),
+                    seen + np.arange(len(X_data)),
+                    lesions,
+                )
+                seen += len(X_data)
 
             print(
                 "Done with class: {}, {}/{}".format(
                     self.class_names[i], i + 1, len(loaders)
                 )
             )
+
+        # gather the selected images once and recompute their concept maps
+        ranked_ids = topk.result()
+        selected = np.unique(np.concatenate(ranked_ids))
+        samples = []
+        for sid in selected:
+            i = np.searchsorted(offsets, sid, side="right") - 1
+            samples.append(loaders[i].dataset[sid - offsets[i]][0])
+        samples = torch.stack([torch.as_tensor(x) for x in samples])
+        featureMaps = self.reducer.transform(
+            model.get_feature(samples, self.layer_name)
+        )
+        samples = samples.numpy()
+
+        def gather(ids, No):
+            rows = np.searchsorted(selected, ids)
+            return [samples[rows], featureMaps[rows, :, :, No]]
+
+        n = len(featureIdx)
+        features = {No: gather(ranked_ids[j], No) for j, No in enumerate(featureIdx)}
+        for level, k in enumerate(levels):
+            inter_dict[k] = {
+                No: gather(ranked_ids[(level + 1) * n + j], No)
+                for j, No in enumerate(featureIdx)
+            }
+
         # create repeat prototypes in case lack of samples
         for no, (x, h) in features.items():
             idx = h.mean(axis=(1, 2)).argmax()
@@ -378,55 +594,48 @@ class Explainer:
         if not os.path.exists(feature_path):
             os.mkdir(feature_path)
 
-        for idx in self.features.keys():
-
-            x, h = self.features[idx]
-            # x = self.gen_masked_imgs(x,h,threshold=threshold,background = background,smooth = smooth)
-            minmax = False
-            if self.reducer_type == "PCA":
-                minmax = True
-            x, h = self.utils.img_filter(
+        minmax = False
+        if self.reducer_type == "PCA":
+            minmax = True
+        jobs = [
+            (
+                self.utils,
                 x,
                 h,
-                threshold=threshold,
-                background=background,
-                smooth=smooth,
-                minmax=minmax,
-            )
-            img_width, img_height = self.utils.img_width, self.utils.img_height
-            combined_img_height = img_height * self.featureimgtopk
-            img_channels = self.utils.nchannels
-            # the processing in ImageUtils handles channel last
-            img_size_processing = [img_width, combined_img_height, img_channels]
-            nimg = np.zeros(img_size_processing)
-            nh = np.zeros([img_width, combined_img_height])
-            num_examples = x.shape[0]  # should be equal to featureimgtopk
-            for i in range(num_examples):
-                timg = self.utils.deprocessing(x[i])
-                if timg.max() > 1:
-                    timg = timg / 255.0
-                    timg = abs(timg)
-                timg = np.clip(timg, 0, 1)
-                max_h = self.utils.find_max_area_contour(h[i])
-                nimg[:, i * img_width : (i + 1) * img_height, :] = timg
-                nh[:, i * img_width : (i + 1) * img_height] = max_h
-            fig = self.utils.contour_img(nimg, nh)
-            fig.savefig(
                 feature_path / (str(idx) + ".jpg"),
-                bbox_inches="tight",
-                pad_inches=0,
-                format="jpg",
-                dpi=params.DPI,
+                self.featureimgtopk,
+                dict(
+                    threshold=threshold,
+                    background=background,
+                    smooth=smooth,
+                    minmax=minmax,
+                ),
             )
-            plt.close(fig)
-
-    def global_explanations(self, concept_names=None, feature_only=True):
+            for idx, (x, h) in self.features.items()
+        ]
+        n_jobs = min(params.RENDER_JOBS or os.cpu_count() or 1, len(jobs))
+        if n_jobs <= 1:
+            for job in jobs:
+                _render_feature(*job)
+        else:
+            # spawned, not forked: the pipeline calls this from a worker thread
+            # while other threads run torch
+            with ProcessPoolExecutor(
+                max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                for _ in pool.map(_render_feature, *zip(*jobs)):
+                    pass
+
+    def global_explanations(
+        self, concept_names=None, feature_only=True, classes=None, batch=None
+    ):
+        # graphs are queued on batch; without one they are rendered here
         title = self.title
         fpath = (self.exp_location / self.title / "feature_imgs").absolute()
         feature_topk = min(self.featuretopk, self.n_components)
         feature_weight = self.test_weight
         class_names = self.class_names
-        Nos = range(self.class_nos)
+        Nos = range(self.class_nos) if classes is None else classes
 
         font = self.font
 
@@ -485,48 +694,36 @@ class Explainer:
 
             return resstr
 
-        if not os.path.exists(self.exp_location / title / "GE"):
-            os.mkdir(self.exp_location / title / "GE")
-
-        if not os.path.exists(params.EXAMPLE_PATH / "global"):
-            os.mkdir(params.EXAMPLE_PATH / "global")
+        # exist_ok: per-class graphs may be written from several threads
+        os.makedirs(self.exp_location / title / "GE", exist_ok=True)
+        os.makedirs(params.EXAMPLE_PATH / "global", exist_ok=True)
 
         print("Generate explanations with fullset condition")
+        graphs = GraphBatch() if batch is None else batch
         if feature_only:
             wlist = [
                 (k, v) for k, v in enumerate(feature_weight[:, 0])
             ]  # Fixed wlist - quick fix
-            graph = pydotplus.graph_from_dot_data(
-                LR_graph(wlist, No=None, feature_only=feature_only)
-            )
             if self.args.example:
-                graph.write_jpg(
-                    str(params.EXAMPLE_PATH / "global" / ("{}.jpg".format(title)))
+                graphs.add(
+                    LR_graph(wlist, No=None, feature_only=feature_only),
+                    params.EXAMPLE_PATH / "global" / ("{}.jpg".format(title)),
                 )
         else:
             for i in Nos:
                 # wlist = [(j, feature_weight[j][i]) for j in feature_weight[:, i].argsort()[-feature_topk:]]
                 wlist = [(k, v) for k, v in enumerate(feature_weight[:, i])]
-                graph = pydotplus.graph_from_dot_data(LR_graph(wlist, i))
-                graph.write_jpg(
-                    str(
-                        self.exp_location
-                        / title
-                        / "GE"
-                        / ("{}.jpg".format(class_names[i]))
-                    )
+                graph_path = self.exp_location / title / "GE"
+                graphs.add(
+                    LR_graph(wlist, i, feature_only),
+                    graph_path / ("{}.jpg".format(class_names[i])),
                 )
+        if batch is None:
+            graphs.render()
 
     def segment_concept_image(self, x, h, feature_id, img_path, background=0.7):
         x1, max_h = self.get_feature_area_on_image(x, h, feature_id, background)
-        fig = self.utils.contour_img(x1[0], max_h)
-        fig.savefig(
-            img_path,
-            format="jpg",
-            dpi=params.DPI,
-        )
-        plt.close(fig)
-        return img_path
+        return self.utils.contour_jpg(x1[0], max_h, img_path, scale=params.DPI / 100)
 
     def get_feature_area_on_image(self, x, h, feature_id, background=0.7):
         minmax = False
@@ -551,7 +748,10 @@ class Explainer:
         display_value=True,
         plot_img=True,
         concept_names=None,
+        batch=None,
     ):
+        # graphs are queued on batch (see local_explanations_batch), without
+        # one they are rendered before returning
         font = self.font
         featuretopk = min(self.featuretopk, self.n_components)
         target_classes = list(range(self.class_nos))
@@ -643,6 +843,7 @@ class Explainer:
             nodestr += "</table>  \n"
             return nodestr
 
+        graphs = GraphBatch() if batch is None else batch
         for cidx in target_classes:
             tw = w[:, cidx]
             # tw_idx = tw.argsort()[::-1][:featuretopk]
@@ -663,11 +864,19 @@ class Explainer:
             resstr += "</table> \n >];\n"
             resstr += "}"
 
-            graph = pydotplus.graph_from_dot_data(resstr)
-            graph.write_jpg(str(fpath / ("explanation_{}.jpg".format(cidx))))
-            graph.write_jpg(str(afpath / ("{}_{}.jpg".format(instance_name, cidx))))
+            # rendered once, copied to the "all" folder
+            graphs.add(
+                resstr,
+                fpath / ("explanation_{}.jpg".format(cidx)),
+                copies=[afpath / ("{}_{}.jpg".format(instance_name, cidx))],
+            )
+        if batch is None:
+            graphs.render()
 
         if self.args.example:
+            # matplotlib is only loaded for example figures, not when serving
+            import matplotlib.pyplot as plt
+
             final_fig = plt.figure(
                 layout="constrained", figsize=(16, len(feature_idx) * 2)
             )
@@ -709,3 +918,17 @@ class Explainer:
             plt.close()
 
         return concept_contributions, s
+
+    def local_explanations_batch(self, xs, model, instance_names=None, **kwargs):
+        # local explanations of many images, all graphs laid out together
+        batch = GraphBatch()
+        results = []
+        for i, x in enumerate(xs):
+            name = instance_names[i] if instance_names is not None else None
+            results.append(
+                self.local_explanations(
+                    x, model, instance_name=name, batch=batch, **kwargs
+                )
+            )
+        batch.render()
+        return results
@@ -5,6 +5,8 @@
 @Description: file content
 """
 
+import time
+
 import numpy as np
 import torch
 from torch.utils.data import TensorDataset, DataLoader
@@ -13,6 +15,14 @@ import params
 
 
 class PytorchModelWrapper:
+    # class level defaults so that wrappers pickled before these options
+    # existed keep working after torch.load
+    channels_last = False
+    compiled = False
+    _memory_format = torch.contiguous_format
+    _compiled = None
+    _compile_stats = None
+
     def __init__(
         self,
         model,
@@ -22,7 +32,9 @@ class PytorchModelWrapper:
         model_channel_first=True,  # True if model use channel first
         numpy_out=True,
         input_size=[3, 224, 224],  # model's input size
-        batch_size=128,
+        batch_size=None,
+        channels_last=None,
+        compiled=None,  # torch.compile the truncated forward pass
     ):
         self.model = model
         self.layer_dict = layer_dict
@@ -32,9 +44,22 @@ class PytorchModelWrapper:
         self.model_channel = "f" if model_channel_first else "l"
         self.numpy_out = numpy_out
         self.input_size = list(input_size)
-        self.batch_size = batch_size
+        self.batch_size = (
+            batch_size if batch_size is not None else params.INFERENCE_BATCH_SIZE
+        )
+        self.channels_last = (
+            channels_last if channels_last is not None else params.CHANNELS_LAST
+        )
+        self.compiled = compiled if compiled is not None else params.COMPILE_BACKBONE
         self.non_negative = False
 
+    def __getstate__(self):
+        # compiled graphs cannot be pickled, they are rebuilt on first use
+        state = self.__dict__.copy()
+        state.pop("_compiled", None)
+        state.pop("_compile_stats", None)
+        return state
+
     def _to_tensor(self, x):
         if type(x) == np.ndarray:
             x = torch.from_numpy(x)
@@ -76,6 +101,79 @@ class PytorchModelWrapper:
             x = self._switch_channel_l_to_f(x)
         return x
 
+    def _prepare_model(self):
+        # convert conv weights once whenever the memory format option changes,
+        # the compiled path always runs channels_last
+        if self.channels_last or self.compiled:
+            memory_format = torch.channels_last
+        else:
+            memory_format = torch.contiguous_format
+        if self._memory_format != memory_format:
+            self.model.to(memory_format=memory_format)
+            self._memory_format = memory_format
+        return memory_format
+
+    def _truncated_model(self, layer_out):
+        # children up to layer_out, valid for sequential backbones (ResNet family)
+        layers = []
+        for name, module in self.model.named_children():
+            layers.append(module)
+            if name == layer_out:
+                return torch.nn.Sequential(*layers)
+        return None
+
+    def _compiled_forward(self, nx, layer_out):
+        # one compiled graph per (layer, input shape), None marks eager fallback
+        if self._compiled is None:
+            self._compiled = {}
+            self._compile_stats = {}
+        key = (layer_out, tuple(nx.shape))
+
+        if key not in self._compiled:
+            trunk = self._truncated_model(layer_out)
+            if trunk is None or not hasattr(torch, "compile"):
+                self._compiled[key] = None
+                return None
+            try:
+                fn = torch.compile(trunk, dynamic=False)
+                start = time.perf_counter()
+                with torch.no_grad():
+                    out = fn(nx)
+                self._compile_stats[key] = {
+                    "compile_s": time.perf_counter() - start,
+                    "calls": 0,
+                    "total_s": 0.0,
+                }
+                self._compiled[key] = fn
+                return out
+            except Exception as e:
+                print("Compilation failed, falling back to eager mode: {}".format(e))
+                self._compiled[key] = None
+                return None
+
+        fn = self._compiled[key]
+        if fn is None:
+            return None
+        start = time.perf_counter()
+        with torch.no_grad():
+            out = fn(nx)
+        stats = self._compile_stats[key]
+        stats["calls"] += 1
+        stats["total_s"] += time.perf_counter() - start
+        return out
+
+    def compile_report(self):
+        # compile time and steady-state latency per compiled input shape
+        report = {}
+        for (layer_out, shape), stats in (self._compile_stats or {}).items():
+            calls = stats["calls"]
+            report["{} {}".format(layer_out, list(shape))] = {
+                "compile_s": stats["compile_s"],
+                "steady_state_ms": stats["total_s"] / calls * 1000 if calls else None,
+                "calls": calls,
+            }
+        return report
+
     def _input_to_output(self, x, layer_in="input", layer_out="output"):
         # tensor cpu in cpu out
 
@@ -94,6 +192,16 @@ class PytorchModelWrapper:
 
         if layer_in == "input":
             nx = x
+            if self.compiled and not layer_out == "output":
+                nx = nx.to(params.DEVICE)
+                memory_format = self._prepare_model()
+                nx = nx.contiguous(memory_format=memory_format)
+                out = self._compiled_forward(nx, layer_out)
+                if out is not None:
+                    out = out.cpu()
+                    if self.non_negative:
+                        out = torch.relu(out)
+                    return out
         else:
             handles.append(self.layer_dict[layer_in].register_forward_hook(hook_in))
             nx = torch.zeros([x.size()[0]] + self.input_size)
@@ -102,6 +210,9 @@ class PytorchModelWrapper:
             handles.append(self.layer_dict[layer_out].register_forward_hook(hook_out))
 
         nx = nx.to(params.DEVICE)
+        memory_format = self._prepare_model()
+        if nx.ndim == 4:
+            nx = nx.contiguous(memory_format=memory_format)
         with torch.no_grad():
             ny = self.model(nx)
 
@@ -120,14 +231,62 @@ class PytorchModelWrapper:
 
         return data_out
 
-    def _batch_fn(self, x, layer_in="input", layer_out="output"):
-        # numpy in numpy out
+    def _input_to_grad(self, x, layer_in):
+        # tensor cpu in cpu out, d(output)/d(layer_in) summed over the batch
+
+        x = x.type(torch.FloatTensor)
+        data_in = x.clone()
+        data_in = data_in.to(params.DEVICE).requires_grad_(True)
+
+        def hook_in(m, i, o):
+            return data_in
 
+        handle = self.layer_dict[layer_in].register_forward_hook(hook_in)
+        nx = torch.zeros([x.size()[0]] + self.input_size)
+        nx = nx.to(params.DEVICE)
+        # the graph before layer_in is dropped when the hook replaces its output,
+        # only the head from data_in is kept for autograd
+        with torch.enable_grad():
+            try:
+                ny = self.model(nx)
+            finally:
+                handle.remove()
+
+            if self.non_negative:
+                ny = torch.relu(ny)
+            if self.predict_target is not None:
+                ny = ny[:, self.predict_target]
+            if ny.ndim == 1:
+                ny = ny.unsqueeze(1)
+
+            grads = []
+            n_out = ny.shape[1]
+            for j in range(n_out):
+                (g,) = torch.autograd.grad(
+                    ny[:, j].sum(), data_in, retain_graph=j < n_out - 1
+                )
+                grads.append(g.sum(0))
+
+        return torch.stack(grads).cpu()
+
+    def _to_loader(self, x):
+        if isinstance(x, np.memmap):
+            # read an on-disk array batch by batch instead of copying it whole
+            return (
+                (torch.from_numpy(np.array(x[i : i + self.batch_size])),)
+                for i in range(0, len(x), self.batch_size)
+            )
         if type(x) == torch.Tensor or type(x) == np.ndarray:
             x = self._to_tensor(x)
 
             dataset = TensorDataset(x)
             x = DataLoader(dataset, batch_size=self.batch_size)
+        return x
+
+    def _batch_fn(self, x, layer_in="input", layer_out="output"):
+        # numpy in numpy out
+
+        x = self._to_loader(x)
 
         out = []
 
@@ -166,6 +325,25 @@ class PytorchModelWrapper:
             out = out[:, self.predict_target]
         return out
 
+    def feature_gradient(self, feature, layer_name=None):
+        # gradient of every output w.r.t. the layer activation, summed over
+        # samples: [n_outputs] + activation shape (channel last)
+        if layer_name not in self.layer_dict:
+            print("Target layer not exists")
+            return None
+
+        total = None
+        for nx in self._to_loader(feature):
+            nx = nx[0]
+            nx = self._switch_channel(nx, layer_in=layer_name, to_model=True)
+            g = self._input_to_grad(nx, layer_name)
+            total = g if total is None else total + g
+
+        res = self._switch_channel(total, layer_in=layer_name, to_model=False)
+        if self.numpy_out:
+            res = res.detach().numpy()
+        return res
+
     def predict(self, x):
         out = self._batch_fn(x)
         if self.predict_target is not None:
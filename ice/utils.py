@@ -6,7 +6,8 @@
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
+from PIL import Image
+from scipy import ndimage
 from skimage.transform import resize
 
 EPSILON = 1e-8
@@ -29,17 +30,6 @@ class ImageUtils:
         self.std = std
         self.mean = mean
         self.mode = mode
-        # 8 directions: horizontally, vertically and diagnonally
-        self.directions = [
-            (-1, 0),
-            (1, 0),
-            (0, -1),
-            (0, 1),
-            (-1, -1),
-            (-1, 1),
-            (1, -1),
-            (1, 1),
-        ]
 
     def deprocessing(self, x):
         x = np.array(x)
@@ -97,6 +87,8 @@ class ImageUtils:
         save_path=None,
         is_show=True,
     ):
+        import matplotlib.pyplot as plt
+
         X = np.array(X)
         if not heatmaps is None:
             heatmaps = np.array(heatmaps)
@@ -172,53 +164,20 @@ class ImageUtils:
 
         return x, h
 
-    def DFS(self, grid, rows, cols, cr, cc, visited):
-        """
-        cr: current row
-        cc: current column
-        """
-        # Stack for DFS
-        stack = [(cr, cc)]
-        island = []
-
-        while stack:
-            x, y = stack.pop()
-
-            if visited[x][y]:
-                continue
-
-            visited[x][y] = True
-            island.append((x, y))
-            for d in self.directions:
-                nr = x + d[0]
-                nc = y + d[1]
-                if 0 <= nr < rows and 0 <= nc < cols:
-                    if not visited[nr][nc] and grid[nr][nc] > 0:
-                        stack.append((nr, nc))
-
-        return island
-
     def find_max_area_contour(self, grid):
-        rows = len(grid)
-        cols = len(grid[0])
-        visited = [[False for _ in range(cols)] for _ in range(rows)]
-        max_area = 0
-        max_island = []
-        for r in range(rows):
-            for c in range(cols):
-                if not visited[r][c] and grid[r][c] > 0:
-                    island = self.DFS(grid, rows, cols, r, c, visited)
-                    if len(island) > max_area:
-                        max_island = island
-                        max_area = len(island)
-        result = np.zeros_like(grid, dtype=int)
-        
-        # Set 1 for elements in the largest island
-        for x, y in max_island:
-            result[x, y] = 1
+        # largest 8-connected region of positive cells (first one on ties)
+        grid = np.asarray(grid)
+        labels, n = ndimage.label(grid > 0, structure=np.ones((3, 3)))
+        result = np.zeros(grid.shape, dtype=int)
+        if n == 0:
+            return result
+        areas = np.bincount(labels.ravel())[1:]
+        result[labels == areas.argmax() + 1] = 1
         return result
 
     def contour_img(self, x, h, dpi=100):
+        import matplotlib.pyplot as plt
+
         dpi = float(dpi)
         size = x.shape
         if x.max() > 1:
@@ -237,3 +196,39 @@ class ImageUtils:
             ax.imshow(x)
         ax.contour(X, Y, h, colors="r")
         return fig
+
+    def contour_array(self, x, h, scale=1, line_width=None):
+        """Draw the contour of mask h onto image x, as a uint8 RGB array.
+        Matches contour_img saved at dpi = 100 * scale: the image is upscaled
+        by scale and the red line is matplotlib's default 1.5 points wide.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.max() > 1:
+            x = x / x.max()
+        x = np.clip(x, 0, 1)
+        if x.ndim == 2 or x.shape[-1] == 1:
+            # "Greys" colour map: 0 is white
+            x = np.repeat(1 - x.reshape(x.shape[:2] + (1,)), 3, axis=-1)
+        height, width = x.shape[:2]
+        size = (int(round(width * scale)), int(round(height * scale)))
+
+        img = Image.fromarray((x * 255).round().astype(np.uint8))
+        img = np.array(img.resize(size, Image.Resampling.NEAREST))
+        mask = Image.fromarray(np.asarray(h, dtype=np.float32))
+        mask = np.asarray(mask.resize(size, Image.Resampling.BILINEAR)) > 0.5
+
+        if line_width is None:
+            line_width = 1.5 / 72 * 100 * scale
+        # inner boundary of the mask, not drawn along the image border
+        edge = mask & ~ndimage.binary_erosion(mask, border_value=1)
+        radius = int(round(line_width / 2))
+        if radius > 0 and edge.any():
+            edge = ndimage.binary_dilation(edge, iterations=radius)
+        img[edge] = (255, 0, 0)
+        return img
+
+    def contour_jpg(self, x, h, path, scale=1, quality=95):
+        Image.fromarray(self.contour_array(x, h, scale)).save(
+            path, format="JPEG", quality=quality
+        )
+        return path
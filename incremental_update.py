@@ -0,0 +1,270 @@
+"""
+Add newly labelled images to a trained model without a full retrain.
+
+Only the new images go through the backbone. Their concept features update
+the WoE Gaussian priors, means and covariances through running sufficient
+statistics, and the concept classifier is updated with partial_fit when it
+supports it (refit on the stored concept features otherwise).
+
+With --update-reducer the reducer is also updated online when the algorithm
+has partial_fit (MiniBatchNMF, MiniBatchKMeans). This moves the concept
+basis, so the features the artifacts were built from no longer match it:
+the images of that training set must be given with --stored-csv, their
+concept features are re-extracted in the new basis and the concept
+classifier, concept weights and distributions and the WoE statistics are
+refitted on them together with the new images.
+
+The result is saved as a new version of the Exp and woeexplainer artifacts
+(params.artifact_path(kind, version)); serve it with
+EVASKAN_ARTIFACT_VERSION=<version>.
+
+Usage:
+    python incremental_update.py --csv new_cases.csv
+                                 [--update-reducer --stored-csv train.csv]
+                                 [--version N] [--refit-clf]
+
+The CSVs have an image_path column and a label column holding either the dx
+code (e.g. "mel") or the class index.
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, Subset
+
+import params
+from preprocessing import data_utils
+from woe import slim
+
+LAYER_NAME = params.ICE_CONCEPT_LAYER[params.MODEL]
+
+
+def read_cases(path):
+    """
+    Read the new cases.
+
+    Returns:
+        tuple: (image paths, class indices)
+    """
+    df = pd.read_csv(path)
+    to_idx = {k: i for i, k in enumerate(params.LESION_TYPE_DICT.keys())}
+    labels = [
+        to_idx[label] if label in to_idx else int(label) for label in df["label"]
+    ]
+    return np.array(df["image_path"].to_list()), np.array(labels)
+
+
+def image_loader(paths, ys):
+    return DataLoader(
+        data_utils.SkinCancerDataset(
+            paths, ys, data_utils.NORMALIZED_NO_AUGMENTED_TRANS
+        ),
+        batch_size=params.BATCH_SIZE,
+        num_workers=params.NUM_WORKERS,
+    )
+
+
+def next_version():
+    version = 1
+    while params.artifact_path("woeexplainer", version).exists():
+        version += 1
+    return version
+
+
+def load_artifacts(version):
+    def load(kind, version=None):
+        return torch.load(
+            params.artifact_path(kind, version),
+            map_location=torch.device(params.DEVICE),
+            weights_only=False,
+        )
+
+    return load("Exp", version), load("woeexplainer", version), load("concept")
+
+
+def update_reducer(Exp, model, loader):
+    """
+    Update the reducer online with the activations of the new images.
+
+    Returns:
+        float: Relative change of the concept vectors
+    """
+    if not getattr(Exp.reducer, "supports_partial_fit", False):
+        print(f"Reducer {Exp.reducer_type} has no partial_fit, kept unchanged")
+        return 0.0
+    old_cavs = np.array(Exp.cavs, copy=True)
+    for X, _, _ in loader:
+        Exp.reducer.partial_fit(model.get_feature(X, LAYER_NAME))
+    Exp.cavs = Exp.reducer._reducer.components_
+    drift = np.linalg.norm(Exp.cavs - old_cavs) / np.linalg.norm(old_cavs)
+    print(f"Reducer updated, concept drift: {drift:.4f}")
+    if drift > 0.05:
+        print(
+            "Warning: the concept basis moved noticeably; the concept images "
+            "still show the old basis, consider a full retrain."
+        )
+    return drift
+
+
+def concept_features(Exp, model, loader):
+    """
+    Concept features of the new images, as the concept classifier sees them.
+
+    Returns:
+        np.ndarray: Features [n_images, n_features]
+    """
+    features = []
+    for X, _, _ in loader:
+        featureMaps = Exp.reducer.transform(model.get_feature(X, LAYER_NAME))
+        features.append(Exp._feature_filter(featureMaps))
+    features = np.concatenate(features)
+    remove_concepts = [int(feat) for feat in Exp.args.remove_concepts]
+    if remove_concepts:
+        features = np.delete(features, remove_concepts, axis=1)
+    return features
+
+
+def refit_in_new_basis(Exp, woeexplainer, model, stored_loader, X_new, y_new):
+    """
+    Refit everything that depends on the concept basis after a reducer update.
+
+    The concept features of the stored training images are re-extracted with
+    the updated reducer and joined with the new images. The concept classifier,
+    the concept weights and distributions and the WoE statistics are refitted
+    on them, so the saved artifacts refer to a single basis.
+    """
+    dataset = stored_loader.dataset
+    X = np.concatenate([concept_features(Exp, model, stored_loader), X_new])
+    y = np.concatenate([np.asarray(dataset.ys), y_new])
+
+    woe_model = woeexplainer.woe_model
+    classifier = woe_model.model
+    classifier.fit(X, y)
+    print("Concept classifier refitted on {} samples".format(len(y)))
+    if getattr(Exp.args, "train_clf", True):
+        Exp._set_test_weight(classifier)
+    else:
+        Exp._estimate_weight(model, [stored_loader])
+
+    # distributions of the concept maps per class, in class order
+    ys = np.asarray(dataset.ys)
+    Exp._reducer_fidelity(
+        model,
+        [
+            (
+                model.get_feature(batch[0], LAYER_NAME)
+                for batch in DataLoader(
+                    Subset(dataset, np.flatnonzero(ys == c).tolist()),
+                    batch_size=params.BATCH_SIZE,
+                    num_workers=params.NUM_WORKERS,
+                )
+            )
+            for c in range(len(Exp.class_names))
+        ],
+    )
+
+    # as WoEGaussian.__init__: true labels or the classifier's predictions
+    labels = y if woe_model.woe_clf == "original" else classifier.predict(X)
+    woe_model.fit(X, labels)
+    if woe_model.X is not None:
+        woe_model.X, woe_model.y = X, y
+    if woe_model.bootstrap is not None:
+        if woe_model.X is None:
+            print("No stored features to refit the bootstrap, bands dropped")
+            woe_model.bootstrap = None
+        else:
+            woe_model.fit_bootstrap(woe_model.bootstrap["priors"].shape[0])
+    print("WoE statistics refitted on {} samples".format(len(y)))
+
+
+def update_classifier(Exp, woe_model, X_new, y_new, refit=False):
+    classifier = woe_model.model
+    if woe_model.X is None and not hasattr(classifier, "partial_fit"):
+        # models fitted from sufficient statistics do not keep the data
+        print("No stored features to refit the concept classifier, kept unchanged")
+    elif woe_model.X is None or (not refit and hasattr(classifier, "partial_fit")):
+        classifier.partial_fit(X_new, y_new)
+        print("Concept classifier updated with partial_fit")
+    else:
+        # woe_model.X / y already include the new samples
+        classifier.fit(np.asarray(woe_model.X), np.asarray(woe_model.y))
+        print("Concept classifier refitted on {} samples".format(len(woe_model.y)))
+    if getattr(Exp.args, "train_clf", True):
+        Exp._set_test_weight(classifier)
+    # otherwise the weights were estimated from the model head in a basis the
+    # update did not move, they stay valid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", required=True, help="image_path,label file")
+    parser.add_argument(
+        "--base-version", type=int, default=None, help="version to update from"
+    )
+    parser.add_argument("--version", type=int, default=None, help="version to write")
+    parser.add_argument("--update-reducer", action="store_true")
+    parser.add_argument(
+        "--stored-csv",
+        default=None,
+        help="image_path,label file of the training set, needed by --update-reducer",
+    )
+    parser.add_argument(
+        "--refit-clf", action="store_true", help="refit instead of partial_fit"
+    )
+    args = parser.parse_args()
+
+    if args.update_reducer and args.stored_csv is None:
+        sys.exit(
+            "--update-reducer moves the concept basis, pass the training images "
+            "with --stored-csv so their features can be re-extracted"
+        )
+
+    start = time.time()
+    version = args.version or next_version()
+    if params.artifact_path("woeexplainer", version).exists():
+        sys.exit(f"Version {version} already exists")
+
+    Exp, woeexplainer, model = load_artifacts(args.base_version)
+    paths, y_new = read_cases(args.csv)
+    print(f"{len(paths)} new images")
+    loader = image_loader(paths, y_new)
+
+    drift = update_reducer(Exp, model, loader) if args.update_reducer else 0.0
+    X_new = concept_features(Exp, model, loader)
+    if drift > 0:
+        stored_paths, y_stored = read_cases(args.stored_csv)
+        print(f"Re-extracting features of {len(stored_paths)} stored images")
+        refit_in_new_basis(
+            Exp,
+            woeexplainer,
+            model,
+            image_loader(stored_paths, y_stored),
+            X_new,
+            y_new,
+        )
+    else:
+        woe_model = woeexplainer.woe_model
+        # labels for the non-"original" WoE come from the classifier it was fit with
+        woe_model.update(X_new, y_new)
+        update_classifier(Exp, woe_model, X_new, y_new, refit=args.refit_clf)
+
+    for kind, obj in [("Exp", Exp), ("woeexplainer", woeexplainer)]:
+        path = params.artifact_path(kind, version)
+        torch.save(obj, path)
+        print(f"Saved: {path}")
+    try:
+        # path is the woeexplainer artifact, the slim export goes next to it
+        for written in slim.export_slim(woeexplainer, path):
+            print(f"Saved: {written}")
+    except ValueError as e:
+        print(f"Slim WoE artifact not written: {e}")
+    print(f"Version {version} ready in {time.time() - start:.1f}s")
+    print(f"Serve it with EVASKAN_ARTIFACT_VERSION={version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import torch
 import numpy as np
 from pathlib import Path
+import json
+import os
 import random
 
 # ============================================================================
@@ -12,9 +14,12 @@ MODEL = "resnext50"
 NO_CONCEPTS = 7
 SEED = 445
 REDUCER = "NMF"
+CLUSTER_TEMPERATURE = None  # soft assignment for cluster reducers, None = one-hot
 FEATURE_TYPE = "mean"
 ICE_CLF= "gnb"
 WOE_CLF= "original"
+WOE_DENSITY = "gaussian"  # class conditionals behind WoE: "gaussian", "gmm", "kde"
+# ("kde" costs O(n_ref * d) per class and request, keep it for offline analysis)
 IS_TRAIN_CLF = True
 
 # ============================================================================
@@ -30,6 +35,9 @@ DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 INPUT_RESIZE = 224
 INPUT_MEAN = [0.76303977, 0.5456458, 0.57004434]
 INPUT_STD = [0.14092788, 0.1526127, 0.1699702]
+# side of the images in the preprocessed uint8 cache (preprocessing/image_cache.py)
+IMAGE_CACHE_SIZE = INPUT_RESIZE
+USE_IMAGE_CACHE = True  # read training images from the cache when it is built
 
 # ============================================================================
 # MODEL LAYERS
@@ -57,6 +65,7 @@ DATA_PATH = Path("../datasets/HAM10000")
 EXP_PATH = Path("ExplainersLight")
 EXAMPLE_PATH = Path("Example_Image")
 RESULT_PATH = Path("results")
+IMAGE_CACHE_PATH = SAVE_FOLDER / "image_cache"
 
 # ============================================================================
 # LABELS AND FEATURES
@@ -102,6 +111,26 @@ NUM_WORKERS = 8 if torch.cuda.is_available() else 0
 NUM_TEST_PER_CLASS = 20
 NUM_VAL_PER_CLASS = 20
 NUM_SAMPLES_TRAIN_EACH_CLASS = 1000
+# dtype of the on-disk balanced training set, "float16" halves its size
+BALANCED_X_DTYPE = "float32"
+
+# ============================================================================
+# RUNTIME CONFIGURATION (overridden by autotune.py output)
+# ============================================================================
+
+RUNTIME_CONFIG_PATH = Path(
+    os.environ.get("EVASKAN_RUNTIME_CONFIG", SAVE_FOLDER / "runtime_config.json")
+)
+# version of the Exp / woeexplainer artifacts to serve, None = original training
+ARTIFACT_VERSION = os.environ.get("EVASKAN_ARTIFACT_VERSION")
+INFERENCE_BATCH_SIZE = 128
+CHANNELS_LAST = False
+COMPILE_BACKBONE = False
+# projection sweeps at serving time, None = exact solver; set a number of sweeps
+# in the runtime config to opt in (see tests/test_channel_reducer.py)
+NMF_TRANSFORM_ITER = None
+NUM_THREADS = None
+NUM_INTEROP_THREADS = None
 
 # ============================================================================
 # VISUALIZATION AND PROCESSING
@@ -109,6 +138,8 @@ NUM_SAMPLES_TRAIN_EACH_CLASS = 1000
 
 FONT_SIZE = 70
 DPI = 500
+RENDER_JOBS = None  # processes rendering concept images, None = all CPUs
+GRAPH_DATA_ONLY = False  # write explanation graphs as DOT, without rendering
 CALC_LIMIT = 1e9
 SLEEP_TIME_PARALLEL = 0
 
@@ -122,6 +153,11 @@ WOE_THRESHOLDS = {
     "Strong": 4.61,
     "Decisive": np.inf,
 }
+# conditionals of all 2^d concept subsets are precomputed up to this many concepts
+WOE_LATTICE_MAX_D = 10
+# bootstrap replicates behind the WoE confidence intervals, 0 = no intervals
+WOE_BOOTSTRAP_REPLICATES = 0
+WOE_CI_LEVEL = 0.9
 
 
 # ============================================================================
@@ -134,3 +170,56 @@ def set_seed(seed):
     np.random.seed(seed)
     random.seed(seed)
     torch.backends.cudnn.deterministic = True
+
+
+def artifact_path(kind, version=None):
+    """Path of a saved model artifact, kind is "Exp", "concept" or "woeexplainer".
+
+    version selects an incremental update (incremental_update.py), it defaults
+    to ARTIFACT_VERSION. The concept model is never updated, so is unversioned.
+    """
+    if kind == "woeexplainer":
+        suffix = WOE_CLF
+    else:
+        suffix = "clf{}_{}".format(IS_TRAIN_CLF, ICE_CLF)
+    if version is None:
+        version = ARTIFACT_VERSION
+    if version and kind != "concept":
+        suffix += ".v{}".format(version)
+    return SAVE_FOLDER / "{}_{}_{}_ncomp{}_seed{}_{}_{}_{}.sav".format(
+        ALGO, kind, MODEL, NO_CONCEPTS, SEED, REDUCER, FEATURE_TYPE, suffix
+    )
+
+
+def load_runtime_config(path=RUNTIME_CONFIG_PATH):
+    # inference settings only, training batching (BATCH_SIZE, NUM_WORKERS) is
+    # not benchmarked and stays as configured above
+    global INFERENCE_BATCH_SIZE
+    global CHANNELS_LAST, COMPILE_BACKBONE, NMF_TRANSFORM_ITER
+    global NUM_THREADS, NUM_INTEROP_THREADS
+
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        config = json.load(f)
+
+    INFERENCE_BATCH_SIZE = config.get("batch_size", INFERENCE_BATCH_SIZE)
+    CHANNELS_LAST = config.get("channels_last", CHANNELS_LAST)
+    COMPILE_BACKBONE = config.get("compiled", COMPILE_BACKBONE)
+    NMF_TRANSFORM_ITER = config.get("nmf_transform_iter", NMF_TRANSFORM_ITER)
+    NUM_THREADS = config.get("num_threads", NUM_THREADS)
+    NUM_INTEROP_THREADS = config.get("num_interop_threads", NUM_INTEROP_THREADS)
+
+    if NUM_THREADS:
+        torch.set_num_threads(NUM_THREADS)
+    if NUM_INTEROP_THREADS:
+        try:
+            torch.set_num_interop_threads(NUM_INTEROP_THREADS)
+        except RuntimeError:
+            # can only be set before the first inter-op parallel work
+            pass
+    return config
+
+
+load_runtime_config()
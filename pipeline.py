@@ -0,0 +1,480 @@
+"""
+Checkpointed training pipeline with stage-level artifact reuse.
+
+The training flow is split into named stages:
+
+    data            initdata.data_starter
+    train           Explainer.train_model            -> Exp artifact
+    features        concept prototype images (generate_features)
+    woe             concept classifier + WoEGaussian -> woeexplainer artifact
+    graph_<class>   per-class global explanation graph
+
+Each stage is identified by a hash of its configuration and of the hashes of
+the stages it depends on. Finished stages are recorded in
+save_model/pipeline/manifest.json; a stage whose hash is unchanged, whose
+outputs still exist and none of whose dependencies reran is skipped, so a
+crashed run resumes after the last finished stage. Stages whose dependencies
+are done run concurrently (the WoE fit next to prototype rendering, and the
+per-class graphs); backbone forward passes are serialised because the model
+wrapper uses forward hooks.
+
+Usage:
+    python pipeline.py [--reducer NMF] [--n-concepts 7] [--n-jobs 4]
+                       [--force train woe] [--list]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+import classifiers
+import params
+from ice.explainer import Explainer
+from ice.utils import ImageUtils
+from preprocessing import initdata
+from woe import slim
+from woe.explainers import WoEExplainer
+from woe.woe import WoEGaussian
+
+PIPELINE_FOLDER = params.SAVE_FOLDER / "pipeline"
+MANIFEST_PATH = PIPELINE_FOLDER / "manifest.json"
+
+ProcessedData = namedtuple(
+    "ProcessedData",
+    [
+        "original_per_class",
+        "balanced_per_class",
+        "balanced_X",
+        "balanced_y",
+        "X_test",
+        "y_test",
+        "X_test_path",
+    ],
+)
+
+# name, upstream stage names, configuration, produced paths, run(pipeline),
+# load(pipeline) to get the result of a skipped stage
+Stage = namedtuple("Stage", ["name", "deps", "config", "outputs", "run", "load"])
+
+
+def fingerprint(path):
+    path = Path(path)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return [str(path), stat.st_size, int(stat.st_mtime)]
+
+
+def atomic_save(obj, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+class Pipeline:
+    def __init__(self, stages, manifest_path=MANIFEST_PATH, force=()):
+        self.stages = {stage.name: stage for stage in stages}
+        self.manifest_path = Path(manifest_path)
+        self.force = set(force)
+        self.manifest = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self.hashes = {}
+        self.results = {}
+        self.executed = set()
+        self._lock = threading.Lock()
+        self._stage_locks = {name: threading.Lock() for name in self.stages}
+        # the model wrapper registers forward hooks, one forward pass at a time
+        self.model_lock = threading.Lock()
+
+    def stage_hash(self, stage):
+        payload = {
+            "config": stage.config,
+            "deps": {dep: self.hashes[dep] for dep in stage.deps},
+        }
+        data = json.dumps(payload, sort_keys=True, default=str).encode()
+        return hashlib.sha256(data).hexdigest()[:16]
+
+    def is_current(self, stage, stage_hash):
+        entry = self.manifest.get(stage.name)
+        return (
+            stage.name not in self.force
+            and not self.executed.intersection(stage.deps)
+            and entry is not None
+            and entry["hash"] == stage_hash
+            and all(Path(p).exists() for p in stage.outputs)
+        )
+
+    def get(self, name):
+        """Result of a finished stage, loaded from its outputs if it was skipped."""
+        with self._stage_locks[name]:
+            if name not in self.results:
+                self.results[name] = self.stages[name].load(self)
+            return self.results[name]
+
+    def _write_manifest(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def _run_stage(self, stage, stage_hash):
+        if self.is_current(stage, stage_hash):
+            print(f"[{stage.name}] up to date, skipped")
+            return
+        print(f"[{stage.name}] running")
+        start = time.time()
+        result = stage.run(self)
+        with self._stage_locks[stage.name]:
+            self.results[stage.name] = result
+        with self._lock:
+            self.executed.add(stage.name)
+            self.manifest[stage.name] = {
+                "hash": stage_hash,
+                "outputs": [str(p) for p in stage.outputs],
+                "seconds": round(time.time() - start, 2),
+                "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self._write_manifest()
+        print(f"[{stage.name}] done in {time.time() - start:.1f}s")
+
+    def status(self):
+        for name, stage in self._ordered():
+            self.hashes[name] = self.stage_hash(stage)
+            state = "current" if self.is_current(stage, self.hashes[name]) else "stale"
+            print(f"{name:<24}{self.hashes[name]}  {state}")
+
+    def _ordered(self):
+        done, order = set(), []
+        while len(order) < len(self.stages):
+            ready = [
+                (name, stage)
+                for name, stage in self.stages.items()
+                if name not in done and all(dep in done for dep in stage.deps)
+            ]
+            if not ready:
+                raise ValueError("Cycle in pipeline stages")
+            order += ready
+            done.update(name for name, _ in ready)
+        return order
+
+    def run(self, n_jobs=1):
+        done = set()
+        pending = dict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dep in done for dep in stage.deps):
+                        self.hashes[name] = self.stage_hash(stage)
+                        future = pool.submit(self._run_stage, stage, self.hashes[name])
+                        running[future] = name
+                        del pending[name]
+                if not running:
+                    raise ValueError("Cycle in pipeline stages")
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    # re-raise; finished stages stay recorded for the next run
+                    future.result()
+                    done.add(name)
+
+
+def _dataset_of(loaders):
+    return [loader.dataset for loader in loaders]
+
+
+def _loaders_of(datasets):
+    return [
+        DataLoader(
+            dataset, batch_size=params.BATCH_SIZE, num_workers=params.NUM_WORKERS
+        )
+        for dataset in datasets
+    ]
+
+
+def _array_of(X):
+    # the on-disk balanced set is stored by path, pickling would copy it
+    return Path(X.filename) if isinstance(X, np.memmap) else X
+
+
+def _memmap_of(X):
+    return np.load(X, mmap_mode="r") if isinstance(X, Path) else X
+
+
+def apply_config(args):
+    """Set the params the artifact paths are named after to the CLI config."""
+    params.SEED = args.seed
+    params.MODEL = args.model
+    params.REDUCER = args.reducer
+    params.NO_CONCEPTS = args.n_concepts
+    params.FEATURE_TYPE = args.feature_type
+    params.ICE_CLF = args.ice_clf
+    params.WOE_CLF = args.woe_clf
+    params.IS_TRAIN_CLF = args.train_clf
+
+
+def build_stages(args, model):
+    layer_name = params.ICE_CONCEPT_LAYER[args.model]
+    data_path = PIPELINE_FOLDER / "data.pt"
+    exp_path = params.artifact_path("Exp")
+    woe_path = params.artifact_path("woeexplainer")
+    title = exp_path.stem
+    exp_folder = params.EXP_PATH / title
+    concept_model = fingerprint(params.artifact_path("concept"))
+
+    def run_data(p):
+        data = initdata.data_starter(args)
+        state = data._asdict()
+        state["original_per_class"] = _dataset_of(data.original_per_class)
+        state["balanced_per_class"] = _dataset_of(data.balanced_per_class)
+        state["balanced_X"] = _array_of(data.balanced_X)
+        atomic_save(state, data_path)
+        return ProcessedData(**data._asdict())
+
+    def load_data(p):
+        state = torch.load(data_path, weights_only=False)
+        state["original_per_class"] = _loaders_of(state["original_per_class"])
+        state["balanced_per_class"] = _loaders_of(state["balanced_per_class"])
+        state["balanced_X"] = _memmap_of(state["balanced_X"])
+        return ProcessedData(**state)
+
+    def run_train(p):
+        Exp = Explainer(
+            args=args,
+            title=title,
+            layer_name=layer_name,
+            class_names=params.DXLABELS,
+            utils=ImageUtils(
+                img_size=(params.INPUT_RESIZE, params.INPUT_RESIZE),
+                nchannels=3,
+                img_format="channels_first",
+                mode="ham10000",
+                std=params.INPUT_STD,
+                mean=params.INPUT_MEAN,
+            ),
+            reducer_type=args.reducer,
+            n_components=args.n_concepts,
+            featuretopk=args.n_concepts,
+            featureimgtopk=args.featureimgtopk,
+            weight_estimator=args.weight_estimator,
+            reducer_epochs=args.reducer_epochs,
+        )
+        data = p.get("data")
+        with p.model_lock:
+            Exp.train_model(model, data)
+        atomic_save(Exp, exp_path)
+        return Exp
+
+    def load_train(p):
+        return torch.load(
+            exp_path, map_location=torch.device(params.DEVICE), weights_only=False
+        )
+
+    def run_features(p):
+        Exp = p.get("train")
+        data = p.get("data")
+        with p.model_lock:
+            Exp._visualise_features(model, data.balanced_per_class)
+        os.makedirs(Exp.exp_location, exist_ok=True)
+        Exp._save_features(threshold=args.threshold)
+        if not Exp.keep_feature_images:
+            Exp.features = {}
+
+    def run_woe(p):
+        Exp = p.get("train")
+        data = p.get("data")
+        X = []
+        with p.model_lock:
+            for i in range(0, len(data.balanced_X), params.BATCH_SIZE):
+                featureMaps = Exp.reducer.transform(
+                    model.get_feature(
+                        data.balanced_X[i : i + params.BATCH_SIZE], layer_name
+                    )
+                )
+                X.append(Exp._feature_filter(featureMaps))
+        X = np.concatenate(X)
+        remove_concepts = [int(feat) for feat in args.remove_concepts]
+        if remove_concepts:
+            X = np.delete(X, remove_concepts, axis=1)
+        y = np.asarray(data.balanced_y)
+
+        classifier = classifiers.factory(model_type=args.ice_clf, seed=args.seed)
+        classifier.fit(X, y)
+        woe_model = WoEGaussian(
+            classifier,
+            X,
+            y,
+            no_features=X.shape[1],
+            woe_clf=args.woe_clf,
+            class_indices=list(range(len(params.DXLABELS))),
+        )
+        if params.WOE_BOOTSTRAP_REPLICATES:
+            woe_model.fit_bootstrap(params.WOE_BOOTSTRAP_REPLICATES, seed=args.seed)
+        woeexplainer = WoEExplainer(
+            woe_model,
+            classes=params.DXLABELS,
+            features=[
+                params.FEATURE_ID_TO_LABEL.get(i, str(i)) for i in range(X.shape[1])
+            ],
+        )
+        atomic_save(woeexplainer, woe_path)
+        try:
+            slim.export_slim(woeexplainer, woe_path)
+        except ValueError as e:
+            print(f"Slim WoE artifact not written: {e}")
+        return woeexplainer
+
+    def load_woe(p):
+        return torch.load(
+            woe_path, map_location=torch.device(params.DEVICE), weights_only=False
+        )
+
+    def run_graph(i):
+        def run(p):
+            p.get("train").global_explanations(feature_only=False, classes=[i])
+
+        return run
+
+    stages = [
+        Stage(
+            "data",
+            [],
+            {
+                "seed": args.seed,
+                "model": args.model,
+                "metadata": fingerprint(params.DATA_PATH / "HAM10000_metadata.csv"),
+                "num_test": params.NUM_TEST_PER_CLASS,
+                "num_val": params.NUM_VAL_PER_CLASS,
+                "resize": params.INPUT_RESIZE,
+                "balanced_dtype": params.BALANCED_X_DTYPE,
+            },
+            [data_path, initdata.balanced_path(args)],
+            run_data,
+            load_data,
+        ),
+        Stage(
+            "train",
+            ["data"],
+            {
+                "concept_model": concept_model,
+                "reducer": args.reducer,
+                "n_concepts": args.n_concepts,
+                "ice_clf": args.ice_clf,
+                "feature_type": args.feature_type,
+                "train_clf": args.train_clf,
+                "remove_concepts": args.remove_concepts,
+                "weight_estimator": args.weight_estimator,
+                "reducer_epochs": args.reducer_epochs,
+            },
+            [exp_path],
+            run_train,
+            load_train,
+        ),
+        Stage(
+            "features",
+            ["data", "train"],
+            {"threshold": args.threshold, "featureimgtopk": args.featureimgtopk},
+            [exp_folder / "feature_imgs"],
+            run_features,
+            lambda p: None,
+        ),
+        Stage(
+            "woe",
+            ["data", "train"],
+            {
+                "woe_clf": args.woe_clf,
+                "ice_clf": args.ice_clf,
+                "woe_density": params.WOE_DENSITY,
+                "bootstrap": params.WOE_BOOTSTRAP_REPLICATES,
+                "seed": args.seed,
+            },
+            [woe_path],
+            run_woe,
+            load_woe,
+        ),
+    ]
+    for i, class_name in enumerate(params.DXLABELS):
+        stages.append(
+            Stage(
+                f"graph_{class_name}",
+                ["train", "features"],
+                {"class": class_name},
+                [exp_folder / "GE" / f"{class_name}.jpg"],
+                run_graph(i),
+                lambda p: None,
+            )
+        )
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seed", type=int, default=params.SEED)
+    parser.add_argument("--model", default=params.MODEL)
+    parser.add_argument("--reducer", default=params.REDUCER)
+    parser.add_argument("--n-concepts", type=int, default=params.NO_CONCEPTS)
+    parser.add_argument("--feature-type", default=params.FEATURE_TYPE)
+    parser.add_argument("--ice-clf", default=params.ICE_CLF)
+    parser.add_argument("--woe-clf", default=params.WOE_CLF)
+    parser.add_argument("--no-train-clf", dest="train_clf", action="store_false")
+    parser.add_argument("--remove-concepts", nargs="*", default=[])
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--featureimgtopk", type=int, default=5)
+    parser.add_argument(
+        "--weight-estimator",
+        choices=["analytic", "finite_difference"],
+        default="analytic",
+        help="how concept weights are estimated when not training the classifier",
+    )
+    parser.add_argument(
+        "--reducer-epochs",
+        type=int,
+        default=1,
+        help="passes over the data for partial_fit reducers",
+    )
+    parser.add_argument(
+        "--check-weight",
+        action="store_true",
+        help="check analytic concept weights against finite differences",
+    )
+    parser.add_argument("--n-jobs", type=int, default=4)
+    parser.add_argument("--force", nargs="*", default=[], help="stages to rerun")
+    parser.add_argument("--list", action="store_true", help="show stage status")
+    args = parser.parse_args()
+    args.example = False
+
+    # artifact paths are named after params, not after the stage hashes
+    apply_config(args)
+    params.set_seed(args.seed)
+    model = torch.load(
+        params.artifact_path("concept"),
+        map_location=torch.device(params.DEVICE),
+        weights_only=False,
+    )
+    pipeline = Pipeline(build_stages(args, model), force=args.force)
+    if args.list:
+        pipeline.status()
+        return
+
+    start = time.time()
+    pipeline.run(n_jobs=args.n_jobs)
+    print(f"Pipeline finished in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
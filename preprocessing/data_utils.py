@@ -1,12 +1,18 @@
+import json
+import math
+import os
+from pathlib import Path
+
 import numpy as np
 import torch
 from torchvision.transforms import v2
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, Subset
 from PIL import Image
 
 from collections import defaultdict
 
 import params
+from preprocessing import image_cache
 
 NORMALIZED_AUGMENTED_TRANS = v2.Compose(
     [
@@ -79,6 +85,72 @@ class SkinCancerDataset(Dataset):
         return x, y, path
 
 
+class CachedSkinCancerDataset(Dataset):
+    """SkinCancerDataset reading decoded, resized images from the image cache."""
+
+    def __init__(self, img_paths, ys, transform=None, cache=None):
+        self.img_paths = img_paths
+        self.ys = ys
+        self.transform = transform
+        self.cache = image_cache.open_cache() if cache is None else cache
+        self.rows = self.cache.rows(img_paths)
+
+    def __len__(self):
+        return len(self.img_paths)
+
+    def __getitem__(self, index):
+        path = self.img_paths[index]
+        # uint8 HWC -> CHW, the v2 transforms treat it as an image
+        x = torch.from_numpy(self.cache[self.rows[index]]).permute(2, 0, 1)
+        y = self.ys[index]
+        if self.transform:
+            x = self.transform(x)
+        return x, y, path
+
+
+def source_size(transform):
+    """
+    Side of the smallest square source image the transform does not upsample,
+    None if it does not resize.
+
+    A random resized crop can keep only scale[0] of the area, so its source
+    needs size / sqrt(scale[0]) pixels per side.
+    """
+    sizes = []
+    for t in getattr(transform, "transforms", [transform]):
+        if isinstance(t, v2.Compose):
+            size = source_size(t)
+        elif isinstance(t, v2.RandomResizedCrop):
+            size = math.ceil(max(t.size) / math.sqrt(t.scale[0]))
+        elif isinstance(t, v2.Resize):
+            size = max(t.size) if isinstance(t.size, (list, tuple)) else t.size
+        else:
+            size = None
+        if size is not None:
+            sizes.append(size)
+    return max(sizes) if sizes else None
+
+
+def make_dataset(img_paths, ys, transform=None):
+    """
+    Dataset of the images, from the image cache when a store large enough for
+    the transform (source_size) is built and holds all of them
+    (params.USE_IMAGE_CACHE), decoding the image files otherwise.
+    """
+    cache = None
+    if params.USE_IMAGE_CACHE:
+        min_size = source_size(transform)
+        cache = image_cache.open_cache_at_least(min_size)
+        if cache is None and image_cache.built_sizes():
+            print(f"No image cache of at least {min_size} px, decoding the image files")
+    if cache is not None:
+        try:
+            return CachedSkinCancerDataset(img_paths, ys, transform, cache)
+        except KeyError as e:
+            print(f"Image {e} not in the image cache, decoding the image files")
+    return SkinCancerDataset(img_paths, ys, transform)
+
+
 class BasicDataset(Dataset):
     def __init__(self, xs, ys, paths):
         self.xs = xs
@@ -95,6 +167,28 @@ class BasicDataset(Dataset):
         return x, y, path
 
 
+class SeededSubset(Subset):
+    """
+    Subset of a dataset whose samples are reproducible.
+
+    Sample i is drawn with torch seed seed + i, so random augmentations give
+    the same image every time it is accessed, as when the samples were kept
+    in memory, while nothing is decoded before it is needed.
+    """
+
+    def __init__(self, dataset, indices, seed):
+        super().__init__(dataset, indices)
+        self.seed = seed
+
+    def __getitem__(self, idx):
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(self.seed + int(idx))
+            return self.dataset[self.indices[idx]]
+
+    def __getitems__(self, indices):
+        return [self[idx] for idx in indices]
+
+
 def loader_to_numpy(loader):
     X = []
     y = []
@@ -109,24 +203,81 @@ def loader_to_numpy(loader):
     return X, y, X_paths
 
 
+def loader_to_memmap(loader, path, dtype=np.float32, key=None):
+    """
+    loader_to_numpy writing the images into an on-disk .npy array.
+
+    The array is pre-sized from the loader's sampler (num_samples of a
+    WeightedRandomSampler) and every batch is written in place, so peak memory
+    is one batch. Labels and paths go to a companion .npz. If both files exist
+    and were written with the same key, they are returned without running
+    the loader.
+
+    Returns:
+        tuple: (X as a read-only np.memmap, y, paths)
+    """
+    path = Path(path)
+    labels_path = path.with_name(path.stem + "_labels.npz")
+    key = json.dumps(
+        {"key": key, "dtype": np.dtype(dtype).name}, sort_keys=True, default=str
+    )
+    if path.exists() and labels_path.exists():
+        labels = np.load(labels_path)
+        if str(labels["key"]) == key:
+            print(f"Reusing {path}")
+            return np.load(path, mmap_mode="r"), labels["y"], labels["paths"]
+
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.stem + ".tmp.npy")
+    n = len(loader.sampler)
+    X = None
+    y = []
+    X_paths = []
+    start = 0
+    for tx, ty, xpath in loader:
+        if X is None:
+            X = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=dtype, shape=(n,) + tuple(tx.shape[1:])
+            )
+        X[start : start + len(tx)] = tx.cpu().numpy()
+        start += len(tx)
+        y.append(ty.cpu().numpy())
+        X_paths.append(xpath)
+    if start != n:
+        raise ValueError(f"Loader yielded {start} samples, expected {n}")
+    X.flush()
+    del X
+    os.replace(tmp_path, path)
+
+    y = np.concatenate(y)
+    X_paths = np.concatenate(X_paths)
+    np.savez(labels_path, y=y, paths=X_paths, key=np.array(key))
+    return np.load(path, mmap_mode="r"), y, X_paths
+
+
 def get_loader_per_class(data_dl: DataLoader):
-    data_per_class = defaultdict(list)
-    paths_per_class = defaultdict(list)
-    for batch_idx, (data, target, path) in enumerate(data_dl):
-        ys = target.numpy()
-        for i, y in enumerate(ys):
-            data_per_class[y].append(data[i])
-            paths_per_class[y].append(path[i])
+    """
+    One loader per class over the samples data_dl would yield.
+
+    The sampler of data_dl is drawn once (e.g. the weighted over-sampling)
+    and the drawn indices are split by label, read from the dataset without
+    loading any image. Each class loader reads a SeededSubset of the same
+    dataset, so images are decoded and augmented batch by batch.
+    """
+    dataset = data_dl.dataset
+    indices = np.fromiter(iter(data_dl.sampler), dtype=np.int64)
+    labels = np.asarray(dataset.ys)[indices]
 
     loader_per_class = []
-    for y in data_per_class:
-        print(y, len(data_per_class[y]))
-        n = len(data_per_class[y])
-        ys = [y for _ in range(n)]
-        assert len(ys) == len(data_per_class[y])
+    # classes in order of first appearance, as the loader yields them
+    _, first = np.unique(labels, return_index=True)
+    for y in labels[np.sort(first)]:
+        class_indices = indices[labels == y]
+        print(y, len(class_indices))
+        seed = int(torch.randint(2**31 - 1, (1,)))
         loader_per_class.append(
             DataLoader(
-                BasicDataset(data_per_class[y], ys, paths_per_class[y]),
+                SeededSubset(dataset, class_indices.tolist(), seed),
                 batch_size=params.BATCH_SIZE,
                 num_workers=params.NUM_WORKERS,
                 # shuffle=True
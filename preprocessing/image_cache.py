@@ -0,0 +1,198 @@
+"""
+Decode and resize the HAM10000 images once into a memory-mapped uint8 store.
+
+Every image is decoded, converted to RGB and resized to
+IMAGE_CACHE_SIZE x IMAGE_CACHE_SIZE (the v2.Resize of the non-augmented
+transforms) and written as one row of an N x H x W x 3 uint8 .npy file in
+params.IMAGE_CACHE_PATH. A companion index holds the sorted image ids and
+the source paths. data_utils.CachedSkinCancerDataset reads rows from the
+memory map, so loaders pay no JPEG decode or resize; augmentations still run
+on top of the cached image.
+
+A loader only reads a store whose images are at least as large as its
+transform needs (data_utils.source_size), so nothing is upsampled: the 224
+store serves the non-augmented transforms, the Inception transforms need
+--size 350 and random resized crops a store of size / sqrt(min scale).
+Several sizes can be built side by side.
+
+Usage:
+    python -m preprocessing.image_cache [--size 224] [--n-jobs N] [--force]
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import params
+
+
+def cache_paths(size=None, folder=None):
+    """
+    Paths of the image array and of its index for a given image size.
+
+    Returns:
+        tuple: (.npy path, .json path)
+    """
+    size = params.IMAGE_CACHE_SIZE if size is None else size
+    folder = Path(params.IMAGE_CACHE_PATH if folder is None else folder)
+    return (
+        folder / "ham10000_{}.npy".format(size),
+        folder / "ham10000_{}.json".format(size),
+    )
+
+
+def image_id(path):
+    return os.path.splitext(os.path.basename(str(path)))[0]
+
+
+def load_image(path, size):
+    with Image.open(path) as img:
+        img = img.convert("RGB").resize((size, size), Image.BILINEAR)
+        return np.asarray(img, dtype=np.uint8)
+
+
+def build_cache(paths, size=None, folder=None, n_jobs=None):
+    """
+    Decode, resize and write all images to the memory-mapped store.
+
+    The array is written under a temporary name and renamed when complete,
+    so an interrupted run never leaves a truncated cache behind.
+
+    Returns:
+        tuple: Written (.npy path, .json path)
+    """
+    size = params.IMAGE_CACHE_SIZE if size is None else size
+    npy_path, index_path = cache_paths(size, folder)
+    os.makedirs(npy_path.parent, exist_ok=True)
+
+    paths = sorted((str(p) for p in paths), key=image_id)
+    image_ids = [image_id(p) for p in paths]
+    if len(set(image_ids)) != len(image_ids):
+        raise ValueError("Duplicate image ids in the images to cache")
+
+    tmp_path = npy_path.with_name(npy_path.stem + ".tmp.npy")
+    images = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.uint8, shape=(len(paths), size, size, 3)
+    )
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    def write(row):
+        images[row] = load_image(paths[row], size)
+
+    # PIL releases the GIL while decoding, threads are enough
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        list(pool.map(write, range(len(paths))))
+    images.flush()
+    del images
+    os.replace(tmp_path, npy_path)
+
+    with open(index_path, "w") as f:
+        json.dump({"size": size, "image_ids": image_ids, "paths": paths}, f)
+    return npy_path, index_path
+
+
+class ImageCache:
+    """
+    Read-only view of the image store.
+
+    The memory map is opened on first access, and dropped when pickled, so
+    every DataLoader worker maps the file itself instead of receiving a copy
+    of the array.
+    """
+
+    def __init__(self, size=None, folder=None):
+        self.npy_path, self.index_path = cache_paths(size, folder)
+        with open(self.index_path) as f:
+            index = json.load(f)
+        self.size = index["size"]
+        self.image_ids = np.array(index["image_ids"])
+        self._images = None
+
+    def __len__(self):
+        return len(self.image_ids)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"] = None
+        return state
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = np.load(self.npy_path, mmap_mode="r")
+        return self._images
+
+    def rows(self, paths):
+        """Row of every image path (matched by image id) in the store."""
+        ids = np.array([image_id(p) for p in paths])
+        pos = np.searchsorted(self.image_ids, ids)
+        pos = np.clip(pos, 0, len(self.image_ids) - 1)
+        missing = self.image_ids[pos] != ids
+        if missing.any():
+            raise KeyError(ids[missing][0])
+        return pos
+
+    def __getitem__(self, row):
+        # copy out of the read-only map, transforms may work in place
+        return np.array(self.images[row])
+
+
+def open_cache(size=None, folder=None):
+    """Open the image store, or return None if it has not been built."""
+    npy_path, index_path = cache_paths(size, folder)
+    if not (npy_path.exists() and index_path.exists()):
+        return None
+    return ImageCache(size, folder)
+
+
+def built_sizes(folder=None):
+    """Image sizes of the stores built in folder, ascending."""
+    folder = Path(params.IMAGE_CACHE_PATH if folder is None else folder)
+    sizes = []
+    for index_path in folder.glob("ham10000_*.json"):
+        size = index_path.stem.split("_")[-1]
+        if size.isdigit() and cache_paths(int(size), folder)[0].exists():
+            sizes.append(int(size))
+    return sorted(sizes)
+
+
+def open_cache_at_least(min_size, folder=None):
+    """
+    Open the smallest built store whose images are at least min_size pixels
+    per side (any store if min_size is None), or return None.
+    """
+    for size in built_sizes(folder):
+        if min_size is None or size >= min_size:
+            return ImageCache(size, folder)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the HAM10000 image cache")
+    parser.add_argument("--size", type=int, default=params.IMAGE_CACHE_SIZE)
+    parser.add_argument("--folder", default=params.IMAGE_CACHE_PATH)
+    parser.add_argument("--n-jobs", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="rebuild if present")
+    args = parser.parse_args()
+
+    if open_cache(args.size, args.folder) is not None and not args.force:
+        print("Image cache already built, use --force to rebuild")
+        return
+
+    paths = glob(os.path.join(params.DATA_PATH, "*", "*.jpg"))
+    print(f"Caching {len(paths)} images at {args.size}x{args.size}")
+    start = time.time()
+    for written in build_cache(paths, args.size, args.folder, args.n_jobs):
+        print(f"Saved: {written}")
+    print(f"Done in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
+import hashlib
 from glob import glob
 import numpy as np
 import os
 import pandas as pd
 from collections import Counter, namedtuple
+from functools import lru_cache
 import params
 from sklearn.model_selection import train_test_split
 
@@ -17,6 +19,45 @@ def get_lesion_by_path():
     return path_lesion_dict
 
 
+@lru_cache(maxsize=1)
+def get_lesion_index():
+    """
+    Sorted image ids of HAM10000 and the integer lesion id of each.
+
+    The index is built once from the metadata csv and kept as arrays in
+    SAVE_FOLDER/lesion_index.npz, rebuilt when the csv is newer.
+    """
+    csv_path = params.DATA_PATH / "HAM10000_metadata.csv"
+    index_path = params.SAVE_FOLDER / "lesion_index.npz"
+    if (
+        index_path.exists()
+        and index_path.stat().st_mtime >= os.path.getmtime(csv_path)
+    ):
+        index = np.load(index_path)
+        return index["image_ids"], index["lesion_ids"]
+
+    ham_df = pd.read_csv(csv_path, sep=",")
+    image_ids = ham_df["image_id"].to_numpy(dtype=str)
+    lesion_ids = pd.factorize(ham_df["lesion_id"])[0]
+    order = np.argsort(image_ids)
+    image_ids, lesion_ids = image_ids[order], lesion_ids[order]
+    os.makedirs(params.SAVE_FOLDER, exist_ok=True)
+    np.savez(index_path, image_ids=image_ids, lesion_ids=lesion_ids)
+    return image_ids, lesion_ids
+
+
+def get_lesion_ids(paths):
+    """Integer lesion id of every image path, looked up in the lesion index."""
+    image_ids, lesion_ids = get_lesion_index()
+    names = pd.Series(np.asarray(paths)).map(os.path.basename).str.rsplit(".", n=1)
+    names = names.str[0].to_numpy(dtype=str)
+    pos = np.clip(np.searchsorted(image_ids, names), 0, len(image_ids) - 1)
+    missing = image_ids[pos] != names
+    if missing.any():
+        raise KeyError(names[missing][0])
+    return lesion_ids[pos]
+
+
 def train_test_equal_test_split(X, y, n_per_class, random_state=None):
     sampled = X.groupby(y, sort=False).apply(
         lambda frame: frame.sample(n_per_class)  # random_state=random_state
@@ -94,7 +135,7 @@ def weighted_random_sampler(args, X, y, augment=True, normalize=True):
         print("Not normalized here...")
         if augment:
             train_dl = DataLoader(
-                data_utils.SkinCancerDataset(
+                data_utils.make_dataset(
                     X, y, data_utils.NO_NORMALIZED_AUGMENTED_TRANS
                 ),
                 sampler=weighted_sampler,
@@ -103,7 +144,7 @@ def weighted_random_sampler(args, X, y, augment=True, normalize=True):
             )
         else:
             train_dl = DataLoader(
-                data_utils.SkinCancerDataset(
+                data_utils.make_dataset(
                     X, y, data_utils.NO_NORMALIZED_NO_AUGMENTED_TRANS
                 ),
                 sampler=weighted_sampler,
@@ -114,7 +155,7 @@ def weighted_random_sampler(args, X, y, augment=True, normalize=True):
         if augment:
             if args.model == "inception":
                 train_dl = DataLoader(
-                    data_utils.SkinCancerDataset(
+                    data_utils.make_dataset(
                         X, y, data_utils.INCEPTION_TRAIN_TRANS
                     ),
                     sampler=weighted_sampler,
@@ -123,7 +164,7 @@ def weighted_random_sampler(args, X, y, augment=True, normalize=True):
                 )
             else:
                 train_dl = DataLoader(
-                    data_utils.SkinCancerDataset(
+                    data_utils.make_dataset(
                         X, y, data_utils.NORMALIZED_AUGMENTED_TRANS
                     ),
                     sampler=weighted_sampler,
@@ -133,14 +174,14 @@ def weighted_random_sampler(args, X, y, augment=True, normalize=True):
         else:
             if args.model == "inception":
                 train_dl = DataLoader(
-                    data_utils.SkinCancerDataset(X, y, data_utils.INCEPTION_VAL_TRANS),
+                    data_utils.make_dataset(X, y, data_utils.INCEPTION_VAL_TRANS),
                     sampler=weighted_sampler,
                     batch_size=params.BATCH_SIZE,
                     num_workers=params.NUM_WORKERS,
                 )
             else:
                 train_dl = DataLoader(
-                    data_utils.SkinCancerDataset(
+                    data_utils.make_dataset(
                         X, y, data_utils.NORMALIZED_NO_AUGMENTED_TRANS
                     ),
                     sampler=weighted_sampler,
@@ -151,6 +192,41 @@ def weighted_random_sampler(args, X, y, augment=True, normalize=True):
     return train_dl
 
 
+def balanced_path(args):
+    """Path of the on-disk augmented, over-sampled training set."""
+    return params.IMAGE_CACHE_PATH / "balanced_X_{}_seed{}.npy".format(
+        args.model, args.seed
+    )
+
+
+def balanced_key(args, loader, X, y):
+    """
+    What the on-disk balanced set depends on: the training split, the sampler
+    and its weights, the dataset (and image cache) and the transform, including
+    the normalisation constants.
+    """
+    dataset = loader.dataset
+    sampler = loader.sampler
+    weights = getattr(sampler, "weights", None)
+    cache = getattr(dataset, "cache", None)
+    return {
+        "train": hashlib.sha1(
+            "\n".join(map(str, X)).encode() + np.asarray(y).tobytes()
+        ).hexdigest(),
+        "seed": args.seed,
+        "num_samples": len(sampler),
+        "sampler_weights": None
+        if weights is None
+        else hashlib.sha1(weights.cpu().numpy().tobytes()).hexdigest(),
+        "dataset": type(dataset).__name__,
+        "cache_size": None if cache is None else cache.size,
+        "transform": repr(dataset.transform),
+        "mean": params.INPUT_MEAN,
+        "std": params.INPUT_STD,
+        "resize": params.INPUT_RESIZE,
+    }
+
+
 def data_starter(args):
     ProcessedData = namedtuple(
         "ProcessedData",
@@ -167,7 +243,7 @@ def data_starter(args):
     # Get the data
     X_train, y_train, X_test, y_test, X_val, y_val = dataloader(args)
     original_train_dl = DataLoader(
-        data_utils.SkinCancerDataset(
+        data_utils.make_dataset(
             X_train, y_train, data_utils.NORMALIZED_NO_AUGMENTED_TRANS
         ),
         batch_size=params.BATCH_SIZE,
@@ -181,12 +257,17 @@ def data_starter(args):
     original_train_dl_per_class = data_utils.get_loader_per_class(original_train_dl)
     print("-" * 30)
     weighted_train_dl_per_class = data_utils.get_loader_per_class(weighted_nomarlize_dl)
-    weighted_X_train, weighted_y_train, _ = data_utils.loader_to_numpy(
-        weighted_nomarlize_dl
+    # the augmented, over-sampled set is streamed to disk and reused while
+    # the training split and sampling are unchanged
+    weighted_X_train, weighted_y_train, _ = data_utils.loader_to_memmap(
+        weighted_nomarlize_dl,
+        balanced_path(args),
+        dtype=params.BALANCED_X_DTYPE,
+        key=balanced_key(args, weighted_nomarlize_dl, X_train, y_train),
     )
 
     test_dl = DataLoader(
-        data_utils.SkinCancerDataset(
+        data_utils.make_dataset(
             X_test, y_test, data_utils.NORMALIZED_NO_AUGMENTED_TRANS
         ),
         batch_size=params.BATCH_SIZE,
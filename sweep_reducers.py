@@ -0,0 +1,350 @@
+"""
+Sweep reducer / concept-count / feature-type configurations on shared activations.
+
+Concept layer activations are extracted once (per class for reducer training,
+plus the balanced training set and the test set for the concept classifier)
+and written to .npy files. Worker processes memory-map them and fit one
+ChannelDecompositionReducer / ChannelClusterReducer configuration each,
+running the same fidelity computation as Explainer._train_reducer and the
+same concept classifier as Explainer._train_concepts_on_classifier.
+
+The result table (fit time, transform latency, reducer_err, accuracy) is
+printed and saved to results/reducer_sweep.csv, together with the cheapest
+configuration that meets --accuracy-bar.
+
+Usage:
+    python sweep_reducers.py --reducers NMF TorchNMF PCA KMeans --n-concepts 5 7 10
+                             [--feature-types mean max] [--n-jobs 4] [--reuse]
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+import params
+from ice.explainer import Explainer
+from preprocessing import initdata
+
+LAYER_NAME = params.ICE_CONCEPT_LAYER[params.MODEL]
+
+# per-process state, filled by _init_worker
+_MODEL = None
+_ACTS = None
+
+
+def _save_activations(model, sources, path, batch_size):
+    """
+    Stream concept layer activations of loaders or arrays into one .npy file.
+
+    Returns:
+        np.ndarray: Row offset of every source in the file
+    """
+    out = None
+    start = 0
+    sizes = [
+        x.shape[0] if isinstance(x, np.ndarray) else len(x.dataset) for x in sources
+    ]
+
+    for x in sources:
+        if isinstance(x, np.ndarray):
+            batches = (x[i : i + batch_size] for i in range(0, len(x), batch_size))
+        else:
+            batches = (batch[0] for batch in x)
+        for batch in batches:
+            acts = model.get_feature(batch, LAYER_NAME)
+            if out is None:
+                out = np.lib.format.open_memmap(
+                    path,
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(sum(sizes),) + acts.shape[1:],
+                )
+            out[start : start + acts.shape[0]] = acts
+            start += acts.shape[0]
+    out.flush()
+    return np.cumsum([0] + sizes)
+
+
+def extract_activations(model, data, workdir):
+    """
+    Extract activations once and save them with their labels under workdir.
+
+    Returns:
+        int: Number of classes
+    """
+    workdir.mkdir(parents=True, exist_ok=True)
+    n_classes = len(data.balanced_per_class)
+    batch_size = params.BATCH_SIZE
+
+    start = time.time()
+    # the classes share one file, so reducers fit on it without a concatenation
+    offsets = _save_activations(
+        model, data.balanced_per_class, workdir / "classes.npy", batch_size
+    )
+    np.save(workdir / "class_offsets.npy", offsets)
+    _save_activations(model, [data.balanced_X], workdir / "balanced.npy", batch_size)
+    _save_activations(model, [data.X_test], workdir / "test.npy", batch_size)
+    np.save(workdir / "balanced_y.npy", np.asarray(data.balanced_y))
+    np.save(workdir / "test_y.npy", np.asarray(data.y_test))
+    print(f"Activations extracted in {time.time() - start:.1f}s")
+    return n_classes
+
+
+def _init_worker(workdir, n_classes, n_threads):
+    global _MODEL, _ACTS
+    torch.set_num_threads(n_threads)
+    _MODEL = torch.load(
+        params.artifact_path("concept"),
+        map_location=torch.device(params.DEVICE),
+        weights_only=False,
+    )
+    names = ["classes", "balanced", "test"]
+    _ACTS = {name: np.load(workdir / f"{name}.npy", mmap_mode="r") for name in names}
+    _ACTS["class_offsets"] = np.load(workdir / "class_offsets.npy")
+    _ACTS["balanced_y"] = np.load(workdir / "balanced_y.npy")
+    _ACTS["test_y"] = np.load(workdir / "test_y.npy")
+
+
+def _chunks(acts, chunk=256):
+    return (np.array(acts[i : i + chunk]) for i in range(0, len(acts), chunk))
+
+
+def _transform_chunked(reducer, acts, chunk=256):
+    return np.concatenate([reducer.transform(batch) for batch in _chunks(acts, chunk)])
+
+
+def _fit_reducer_shared(exp, n_classes, chunk=256):
+    """
+    Fit the reducer on the shared activations without copying them per worker.
+
+    Reducers with partial_fit get chunks of the memmap; the others fit on the
+    memmap itself, and only a CALC_LIMIT subsample is copied. The fidelity is
+    computed chunk by chunk (Explainer._reducer_fidelity).
+
+    Returns:
+        np.ndarray: reducer_err per class
+    """
+    train = _ACTS["classes"]
+    offsets = _ACTS["class_offsets"]
+    start = time.time()
+    if exp.reducer.supports_partial_fit:
+        for _ in range(exp.reducer_epochs):
+            for batch in _chunks(train, chunk):
+                exp.reducer.partial_fit(batch)
+    else:
+        total = np.prod(train.shape)
+        if total > params.CALC_LIMIT:
+            n = int(len(train) * params.CALC_LIMIT / total)
+            train = train[np.sort(np.random.choice(len(train), n, replace=False))]
+        exp.reducer.fit(train)
+    exp.reducer_fit_time = time.time() - start
+    exp.cavs = exp.reducer._reducer.components_
+
+    # views of the memmap, read chunk by chunk
+    acts = _ACTS["classes"]
+    return exp._reducer_fidelity(
+        _MODEL,
+        [
+            _chunks(acts[offsets[i] : offsets[i + 1]], chunk)
+            for i in range(n_classes)
+        ],
+    )
+
+
+def run_config(
+    reducer_type, n_components, feature_types, clf, n_classes, transform_iter
+):
+    """
+    Fit one reducer configuration in a worker and evaluate it.
+
+    Returns:
+        list: One result row per feature type
+    """
+    args = SimpleNamespace(
+        reducer=reducer_type,
+        feature_type=feature_types[0],
+        remove_concepts=[],
+        ice_clf=clf,
+        train_clf=True,
+        example=False,
+    )
+    exp = Explainer(
+        args=args,
+        layer_name=LAYER_NAME,
+        class_names=params.DXLABELS[:n_classes],
+        reducer_type=reducer_type,
+        n_components=n_components,
+    )
+    base = {"reducer": reducer_type, "n_concepts": n_components}
+    try:
+        if not exp._build_reducer():
+            raise ValueError(f"Unknown reducer {reducer_type}")
+        reducer_err = _fit_reducer_shared(exp, n_classes)
+        if transform_iter is not None and hasattr(exp.reducer, "fast_transform"):
+            exp.reducer.transform_iter = transform_iter
+
+        test = _ACTS["test"]
+        n_latency = min(20, len(test))
+        start = time.perf_counter()
+        for i in range(n_latency):
+            exp.reducer.transform(np.asarray(test[i : i + 1]))
+        latency_ms = (time.perf_counter() - start) / n_latency * 1000
+
+        X_balanced = _transform_chunked(exp.reducer, _ACTS["balanced"])
+        X_test = _transform_chunked(exp.reducer, test)
+    except Exception as e:
+        return [dict(base, feature_type=ft, error=repr(e)) for ft in feature_types]
+
+    rows = []
+    for feature_type in feature_types:
+        exp.args.feature_type = feature_type
+        y_pred = exp._classify_concepts(X_balanced, _ACTS["balanced_y"], X_test)
+        accuracy = float(np.mean(np.array(y_pred) == _ACTS["test_y"]))
+        rows.append(
+            dict(
+                base,
+                feature_type=feature_type,
+                fit_time_s=exp.reducer_fit_time,
+                transform_ms=latency_ms,
+                reducer_err=float(np.mean(reducer_err)),
+                accuracy=accuracy,
+                error="",
+            )
+        )
+    return rows
+
+
+def save_table(rows, path):
+    fields = [
+        "reducer",
+        "n_concepts",
+        "feature_type",
+        "fit_time_s",
+        "transform_ms",
+        "reducer_err",
+        "accuracy",
+        "error",
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nSweep results saved to: {path}")
+
+
+def print_table(rows, accuracy_bar):
+    print("\n" + "=" * 96)
+    print(
+        f"{'reducer':<16}{'concepts':>9}{'feature':>9}{'fit (s)':>10}"
+        f"{'transform (ms)':>16}{'reducer_err':>13}{'accuracy':>10}"
+    )
+    print("=" * 96)
+    for r in rows:
+        if r.get("error"):
+            print(
+                f"{r['reducer']:<16}{r['n_concepts']:>9}{r['feature_type']:>9}"
+                f"  failed: {r['error']}"
+            )
+            continue
+        print(
+            f"{r['reducer']:<16}{r['n_concepts']:>9}{r['feature_type']:>9}"
+            f"{r['fit_time_s']:>10.2f}{r['transform_ms']:>16.3f}"
+            f"{r['reducer_err']:>13.4f}{r['accuracy']:>10.3f}"
+        )
+
+    passing = [r for r in rows if not r.get("error") and r["accuracy"] >= accuracy_bar]
+    if passing:
+        best = min(passing, key=lambda r: (r["transform_ms"], r["fit_time_s"]))
+        print(
+            f"\nCheapest configuration with accuracy >= {accuracy_bar}: "
+            f"REDUCER={best['reducer']!r}, NO_CONCEPTS={best['n_concepts']}, "
+            f"FEATURE_TYPE={best['feature_type']!r}"
+        )
+    else:
+        print(f"\nNo configuration reached accuracy {accuracy_bar}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--reducers", nargs="+", default=[params.REDUCER])
+    parser.add_argument(
+        "--n-concepts", type=int, nargs="+", default=[params.NO_CONCEPTS]
+    )
+    parser.add_argument("--feature-types", nargs="+", default=["mean", "max"])
+    parser.add_argument("--clf", default=params.ICE_CLF)
+    parser.add_argument(
+        "--n-jobs", type=int, default=max(1, (os.cpu_count() or 1) // 4)
+    )
+    parser.add_argument("--transform-iter", type=int, default=None)
+    parser.add_argument("--accuracy-bar", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=params.SEED)
+    parser.add_argument("--model", default=params.MODEL)
+    parser.add_argument("--workdir", type=Path, default=params.SAVE_FOLDER / "sweep")
+    parser.add_argument("--reuse", action="store_true", help="reuse saved activations")
+    parser.add_argument(
+        "--output", type=Path, default=params.RESULT_PATH / "reducer_sweep.csv"
+    )
+    args = parser.parse_args()
+
+    params.set_seed(args.seed)
+    offsets_path = args.workdir / "class_offsets.npy"
+    if args.reuse and offsets_path.exists() and (args.workdir / "test.npy").exists():
+        n_classes = len(np.load(offsets_path)) - 1
+    else:
+        data = initdata.data_starter(args)
+        model = torch.load(
+            params.artifact_path("concept"),
+            map_location=torch.device(params.DEVICE),
+            weights_only=False,
+        )
+        n_classes = extract_activations(model, data, args.workdir)
+        del data, model
+
+    configs = list(product(args.reducers, args.n_concepts))
+    n_threads = max(1, (os.cpu_count() or 1) // args.n_jobs)
+    print(f"Fitting {len(configs)} configurations on {args.n_jobs} workers")
+
+    rows = []
+    with ProcessPoolExecutor(
+        max_workers=args.n_jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(args.workdir, n_classes, n_threads),
+    ) as pool:
+        futures = [
+            pool.submit(
+                run_config,
+                reducer_type,
+                n_components,
+                args.feature_types,
+                args.clf,
+                n_classes,
+                args.transform_iter,
+            )
+            for reducer_type, n_components in configs
+        ]
+        for future in as_completed(futures):
+            for row in future.result():
+                rows.append(row)
+                print(
+                    f"Done: {row['reducer']} n={row['n_concepts']} "
+                    f"{row['feature_type']}"
+                )
+
+    rows.sort(key=lambda r: (r["reducer"], r["n_concepts"], r["feature_type"]))
+    save_table(rows, args.output)
+    print_table(rows, args.accuracy_bar)
+
+
+if __name__ == "__main__":
+    main()
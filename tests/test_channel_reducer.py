@@ -0,0 +1,38 @@
+"""Fast NMF projection against sklearn's NMF.transform."""
+
+import numpy as np
+import pytest
+
+from ice.channel_reducer import ChannelDecompositionReducer
+
+# max deviation of the fast concept maps, relative to each concept's range
+TRANSFORM_TOL = 1e-2
+
+
+@pytest.fixture(scope="module")
+def fitted():
+    rng = np.random.default_rng(0)
+    W = rng.gamma(1.0, 1.0, size=(20 * 7 * 7, 5))
+    H = rng.gamma(0.3, 1.0, size=(5, 64))
+    noise = rng.gamma(0.1, 0.1, size=(20 * 7 * 7, 64))
+    acts = (W @ H + noise).astype(np.float32).reshape(20, 7, 7, 64)
+    reducer = ChannelDecompositionReducer(
+        n_components=5, reduction_alg="NMF", random_state=0, max_iter=1000
+    )
+    reducer.fit(acts)
+    return reducer, acts
+
+
+@pytest.mark.parametrize("n_iter", [10, 20])
+def test_fast_transform_within_tolerance(fitted, n_iter):
+    reducer, acts = fitted
+    assert reducer.fast_transform_error(acts, n_iter) < TRANSFORM_TOL
+
+
+def test_transform_uses_exact_solver_by_default(fitted):
+    reducer, acts = fitted
+    assert reducer.transform_iter is None
+    exact = reducer._reducer.transform(acts.reshape(-1, acts.shape[-1]))
+    np.testing.assert_allclose(
+        reducer.transform(acts).reshape(exact.shape), exact, rtol=1e-6
+    )
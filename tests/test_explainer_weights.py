@@ -0,0 +1,49 @@
+"""Analytic concept weights against central finite differences."""
+
+import numpy as np
+import torch
+from torch import nn
+
+from ice.explainer import Explainer
+from ice.model_wrapper import PytorchModelWrapper
+
+
+class TinyModel(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 4, 3, padding=1)
+        self.layer4 = nn.Conv2d(4, 6, 3, padding=1)
+        self.head = nn.Linear(6, 3)
+
+    def forward(self, x):
+        x = self.layer4(torch.relu(self.conv(x)))
+        return torch.tanh(self.head(x.mean(dim=(2, 3))))
+
+
+def make_explainer(n_components=2, epsilon=1e-2):
+    torch.manual_seed(0)
+    model = PytorchModelWrapper(
+        TinyModel().eval(), input_size=[3, 8, 8], batch_size=4
+    )
+    exp = Explainer(
+        layer_name="layer4",
+        class_names=["a", "b", "c"],
+        n_components=n_components,
+        epsilon=epsilon,
+    )
+    exp.cavs = np.random.default_rng(0).random((n_components, 6))
+    X = torch.rand(10, 3, 8, 8).numpy()
+    return exp, model, model.get_feature(X, "layer4")
+
+
+def test_analytic_weight_matches_finite_difference():
+    exp, model, X_feature = make_explainer()
+    w_analytic = exp._analytic_weight(model, X_feature)
+    w_fd = exp._finite_difference_weight(model, X_feature)
+    assert w_analytic.shape == w_fd.shape == (2, 3)
+    np.testing.assert_allclose(w_analytic, w_fd, rtol=1e-2, atol=1e-4)
+
+
+def test_check_weight_agreement():
+    exp, model, X_feature = make_explainer()
+    assert exp.check_weight_agreement(model, X_feature, rtol=1e-2) <= 1e-2
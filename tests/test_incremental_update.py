@@ -0,0 +1,36 @@
+"""Concept weights after an incremental classifier update."""
+
+from types import SimpleNamespace
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from ice.explainer import Explainer
+from incremental_update import update_classifier
+
+
+def make_update(train_clf):
+    rng = np.random.default_rng(0)
+    X = rng.random((30, 4))
+    y = np.arange(30) % 3
+    exp = Explainer(
+        args=SimpleNamespace(ice_clf="logistic", train_clf=train_clf),
+        class_names=["a", "b", "c"],
+        n_components=4,
+    )
+    exp.test_weight = rng.random((4, 3))
+    woe_model = SimpleNamespace(model=LogisticRegression().fit(X, y), X=X, y=y)
+    return exp, woe_model, X[:6], y[:6]
+
+
+def test_update_keeps_estimated_weights_without_train_clf():
+    exp, woe_model, X_new, y_new = make_update(train_clf=False)
+    estimated = exp.test_weight.copy()
+    update_classifier(exp, woe_model, X_new, y_new, refit=True)
+    np.testing.assert_array_equal(exp.test_weight, estimated)
+
+
+def test_update_takes_classifier_weights_with_train_clf():
+    exp, woe_model, X_new, y_new = make_update(train_clf=True)
+    update_classifier(exp, woe_model, X_new, y_new, refit=True)
+    np.testing.assert_array_equal(exp.test_weight, woe_model.model.coef_.T)
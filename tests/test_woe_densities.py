@@ -0,0 +1,52 @@
+"""KDE conditionals against sklearn and the per-unit WoE."""
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.neighbors import KernelDensity
+
+from woe.densities import KernelDensityEstimate
+from woe.woe import WoEGaussian
+
+
+def make_data(n=600, d=4, n_classes=3):
+    rng = np.random.default_rng(0)
+    y = np.arange(n) % n_classes
+    return rng.normal(size=(n, d)) + 0.5 * y[:, None], y
+
+
+def test_kde_units_match_sklearn():
+    X, y = make_data()
+    kde = KernelDensityEstimate().fit(X, y, [0, 1, 2])
+    features = np.arange(X.shape[1])
+    units = [(np.array([i]), np.delete(features, i)) for i in features]
+    log_densities = kde.log_densities(X[:20], units).numpy()
+
+    Z = X[:20] / kde.scale
+    for k in range(3):
+        tree = KernelDensity(bandwidth=kde.bandwidths[k])
+        full = tree.fit(kde.data[k]).score_samples(Z)
+        for u, (S, T) in enumerate(units):
+            rest = tree.fit(kde.data[k][:, T]).score_samples(Z[:, T])
+            expected = full - rest - np.log(kde.scale[S]).sum()
+            np.testing.assert_allclose(log_densities[:, k, u], expected, atol=1e-8)
+
+
+def test_woe_units_match_woe():
+    X, y = make_data()
+    classifier = LogisticRegression().fit(X, y)
+    woe_model = WoEGaussian(
+        classifier, X, y, X.shape[1], "original", [0, 1, 2], density="kde"
+    )
+    features = np.arange(X.shape[1])
+    units = [(np.array([i]), np.delete(features, i)) for i in features]
+    woes = woe_model.woe_units(X[0], [1], [0, 2], units)
+    expected = [
+        woe_model.conditionals.log_density(X[:1], S, T)[0] for S, T in units
+    ]
+    log_priors = np.log(woe_model.priors.double().numpy())
+    for u, log_density in enumerate(expected):
+        log_density = log_density.numpy()
+        denom = np.logaddexp(
+            log_priors[0] + log_density[0], log_priors[2] + log_density[2]
+        )
+        assert np.isclose(woes[u], log_density[1] - denom)
@@ -0,0 +1,54 @@
+"""Chain units under the total WoE correction."""
+
+import numpy as np
+import torch
+from sklearn.linear_model import LogisticRegression
+
+from woe.explainers import WoEExplainer
+from woe.woe import WoEGaussian
+
+
+def make_explainer(total_woe_correction=True, d=5):
+    rng = np.random.default_rng(0)
+    y = np.arange(300) % 3
+    X = rng.normal(size=(300, d)) + 0.5 * y[:, None]
+    classifier = LogisticRegression().fit(X, y)
+    woe_model = WoEGaussian(
+        classifier, X, y, d, "original", [0, 1, 2], density="gaussian"
+    )
+    woeexplainer = WoEExplainer(
+        woe_model,
+        classes=["a", "b", "c"],
+        features=["f{}".format(i) for i in range(d)],
+        total_woe_correction=total_woe_correction,
+    )
+    return woeexplainer, X
+
+
+def test_corrected_chain_sums_to_classifier_woe():
+    woeexplainer, X = make_explainer()
+    batch = woeexplainer.explain_batch(X[:20], units="chain")
+    np.testing.assert_allclose(
+        batch.total_woe, woeexplainer.woe_model.model_woe_batch(X[:20], [0, 1, 2])
+    )
+
+    x = torch.as_tensor(X[0])
+    result = woeexplainer.explain_for_human(x, 1, units="chain", plot=False)
+    np.testing.assert_allclose(result.total_woe, batch.total_woe[0, 1])
+
+
+def test_uncorrected_chain_sums_to_gaussian_woe():
+    woeexplainer, X = make_explainer(total_woe_correction=False)
+    chain = woeexplainer.explain_batch(X[:20], units="chain").total_woe
+    woe_model = woeexplainer.woe_model
+    # log p(x | h) - log p(x | null), null the prior weighted mixture
+    log_density = woe_model.conditionals.log_density(
+        X[:20], np.arange(woe_model.d), []
+    ).numpy()
+    log_priors = np.log(woe_model.priors.double().numpy())
+    for h in range(3):
+        null = [k for k in range(3) if k != h]
+        log_null = np.logaddexp.reduce(
+            log_priors[null] + log_density[:, null], axis=1
+        ) - np.logaddexp.reduce(log_priors[null])
+        np.testing.assert_allclose(chain[:, h], log_density[:, h] - log_null)
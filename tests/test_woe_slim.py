@@ -0,0 +1,41 @@
+"""Slim WoE export round trip."""
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from woe import slim
+from woe.explainers import WoEExplainer
+from woe.woe import WoEGaussian
+
+
+def make_explainer(d=10, n_classes=3):
+    rng = np.random.default_rng(0)
+    y = np.arange(300) % n_classes
+    X = rng.normal(size=(300, d)) + 0.5 * y[:, None]
+    classifier = LogisticRegression().fit(X, y)
+    woe_model = WoEGaussian(
+        classifier, X, y, d, "original", list(range(n_classes)), density="gaussian"
+    )
+    woeexplainer = WoEExplainer(
+        woe_model,
+        classes=["a", "b", "c"],
+        features=["f{}".format(i) for i in range(d)],
+        featgroup_idxs=[[0, 1, 2], [3, 4, 5, 6], [7, 8, 9]],
+        featgroup_names=["g0", "g1", "g2"],
+    )
+    return woeexplainer, X
+
+
+def test_slim_exports_only_queried_units(tmp_path):
+    woeexplainer, X = make_explainer()
+    path = tmp_path / "woeexplainer.pt"
+    slim.export_slim(woeexplainer, path)
+
+    loaded = slim.load_slim(path, device="cpu")
+    # d per-feature units, 3 groups and the chain instead of the 2^d lattice
+    assert len(loaded.woe_model.conditionals) == 10 + 3 + 1
+    for units in ["features", "group", "chain"]:
+        np.testing.assert_allclose(
+            loaded.explain_batch(X[:20], units=units).attwoes,
+            woeexplainer.explain_batch(X[:20], units=units).attwoes,
+        )
@@ -0,0 +1,362 @@
+"""Class-conditional density backends for Weight of Evidence.
+
+WoE only needs log p_k(x_S | x_T) for every class k, so any density that can
+evaluate its conditionals can sit behind the WoE engine. The full-covariance
+Gaussian of WoEGaussian is the default (woe.ConditionalCache); this module
+adds a per-class Gaussian mixture and a kernel density estimate.
+"""
+
+import numpy as np
+import torch
+from typing import Optional, Union, List, Tuple, Any, Iterable
+
+import params
+
+
+def _as_array(X: Union[np.ndarray, torch.Tensor], d: int = -1) -> np.ndarray:
+    if isinstance(X, torch.Tensor):
+        X = X.detach().cpu().numpy()
+    X = np.asarray(X, dtype=np.float64)
+    return X.reshape(-1, X.shape[-1] if d == -1 else d)
+
+
+def _as_indices(idx: Iterable[int]) -> np.ndarray:
+    return np.array(sorted(set(np.asarray(idx).ravel().tolist())), dtype=np.int64)
+
+
+class ClassConditionalDensity:
+    """Interface of the class-conditional densities behind the WoE engine.
+
+    Subclasses implement fit and log_density; log_densities and
+    chain_log_densities fall back to one conditional per unit or step.
+    """
+
+    d = None
+
+    def fit(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        y: Union[np.ndarray, torch.Tensor],
+        class_indices: List[int],
+    ) -> "ClassConditionalDensity":
+        """Fit one density per class.
+
+        Args:
+            X: Training features [n_samples, n_features]
+            y: Training labels
+            class_indices: Class indices
+
+        Returns:
+            The fitted density
+        """
+        raise NotImplementedError
+
+    def log_density(
+        self, X: torch.Tensor, S: Iterable[int], T: Iterable[int]
+    ) -> torch.Tensor:
+        """Log conditional density of x_S given x_T under every class.
+
+        Args:
+            X: Input data [n_samples, n_features]
+            S: Selected feature indices
+            T: Conditioning feature indices
+
+        Returns:
+            Log densities [n_samples, n_classes]
+        """
+        raise NotImplementedError
+
+    def log_densities(
+        self, X: torch.Tensor, units: List[Tuple[Iterable[int], Iterable[int]]]
+    ) -> torch.Tensor:
+        """Log conditional densities of several (S, T) units at once.
+
+        Args:
+            X: Input data [n_samples, n_features]
+            units: (S, T) index pairs
+
+        Returns:
+            Log densities [n_samples, n_classes, n_units]
+        """
+        return torch.stack([self.log_density(X, S, T) for S, T in units], dim=-1)
+
+    def precompute(self) -> None:
+        """Prepare everything per-feature explanations need before serving."""
+
+    def chain_log_densities(
+        self, X: torch.Tensor, order: Iterable[int]
+    ) -> torch.Tensor:
+        """Log p_k(x_j | features before j in the chain) for every step.
+
+        Args:
+            X: Input data [n_samples, n_features]
+            order: Order in which the features enter the chain
+
+        Returns:
+            Log densities [n_samples, n_classes, n_features], in chain order
+        """
+        order = [int(i) for i in order]
+        return torch.stack(
+            [self.log_density(X, [j], order[:i]) for i, j in enumerate(order)],
+            dim=-1,
+        )
+
+    def _to_tensor(self, log_density: np.ndarray) -> torch.Tensor:
+        return torch.as_tensor(log_density, dtype=torch.float64, device=params.DEVICE)
+
+
+class GaussianMixtureDensity(ClassConditionalDensity):
+    """Per-class Gaussian mixture with full covariances.
+
+    The conditional of a mixture is again a mixture: every component keeps its
+    Gaussian conditional and is reweighted by how well it explains x_T,
+    p(x_S | x_T) = sum_m a_m N_m(x_T) N_m(x_S | x_T) / sum_m a_m N_m(x_T).
+    The component conditionals share the factor cache of the Gaussian model.
+    """
+
+    def __init__(
+        self,
+        n_components: int = 3,
+        reg_covar: float = 1e-6,
+        random_state: Optional[int] = None,
+    ) -> None:
+        """Initialize the mixture backend.
+
+        Args:
+            n_components: Components per class (capped by the class size)
+            reg_covar: Non-negative regularisation added to the covariances
+            random_state: Seed of the mixture initialisation
+        """
+        self.n_components = n_components
+        self.reg_covar = reg_covar
+        self.random_state = params.SEED if random_state is None else random_state
+
+    def fit(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        y: Union[np.ndarray, torch.Tensor],
+        class_indices: List[int],
+    ) -> "GaussianMixtureDensity":
+        from sklearn.mixture import GaussianMixture
+
+        from .woe import ConditionalCache
+
+        X = _as_array(X)
+        y = np.asarray(y).ravel()
+        self.d = X.shape[1]
+        n_max = self.n_components
+        weights = np.zeros((len(class_indices), n_max))
+        means = np.zeros((len(class_indices), n_max, self.d))
+        covs = np.tile(np.eye(self.d), (len(class_indices), n_max, 1, 1))
+        for k, c in enumerate(class_indices):
+            X_k = X[y == c]
+            gmm = GaussianMixture(
+                n_components=min(n_max, len(X_k)),
+                covariance_type="full",
+                reg_covar=self.reg_covar,
+                random_state=self.random_state,
+            ).fit(X_k)
+            m = gmm.n_components
+            weights[k, :m] = gmm.weights_
+            means[k, :m] = gmm.means_
+            covs[k, :m] = gmm.covariances_
+
+        # unused slots of small classes get zero weight
+        with np.errstate(divide="ignore"):
+            self.log_weights = np.log(weights)
+        self.components = ConditionalCache(
+            torch.as_tensor(means.reshape(-1, self.d), device=params.DEVICE),
+            torch.as_tensor(covs.reshape(-1, self.d, self.d), device=params.DEVICE),
+            is_independent=False,
+        )
+        return self
+
+    def log_density(
+        self, X: torch.Tensor, S: Iterable[int], T: Iterable[int]
+    ) -> torch.Tensor:
+        n_classes, n_max = self.log_weights.shape
+        log_weights = torch.as_tensor(self.log_weights, device=params.DEVICE)
+        conditional = self.components.log_density(X, S, T)
+        conditional = conditional.reshape(-1, n_classes, n_max)
+        if len(_as_indices(T)) == 0:
+            log_resp = log_weights[None]
+        else:
+            marginal = self.components.log_density(X, T, [])
+            log_resp = log_weights[None] + marginal.reshape(-1, n_classes, n_max)
+        return torch.logsumexp(log_resp + conditional, dim=-1) - torch.logsumexp(
+            log_resp, dim=-1
+        )
+
+    def precompute(self) -> None:
+        features = np.arange(self.d)
+        for i in features:
+            rest = np.delete(features, i)
+            self.components.get([i], rest)
+            self.components.get(rest, [])
+
+
+class KernelDensityEstimate(ClassConditionalDensity):
+    """Per-class Gaussian kernel density estimate.
+
+    Features are scaled by their standard deviation and one isotropic
+    bandwidth is chosen per class at fit time. The product kernel marginalises
+    to the same kernel on fewer dimensions, so
+    log p(x_S | x_T) = log p(x_{S+T}) - log p(x_T).
+
+    A query costs O(n_ref * d) per class, n_ref the reference points of the
+    class: the squared differences to the reference points are computed once
+    per request and every marginal the units need is summed from them, so all
+    units of a request share one pass over the data. max_samples bounds n_ref
+    and so the latency; even so KDE is far slower than the Gaussian model and
+    is meant for offline analysis rather than serving.
+    """
+
+    # class level default so estimates pickled before it was added still load
+    max_samples = None
+
+    def __init__(
+        self,
+        bandwidth: Union[float, str] = "scott",
+        max_samples: Optional[int] = 2000,
+        cv_folds: int = 5,
+        random_state: Optional[int] = None,
+    ) -> None:
+        """Initialize the KDE backend.
+
+        Args:
+            bandwidth: Bandwidth on scaled features, or "scott", "silverman" or
+                "cv" (cross-validated likelihood) to choose it per class
+            max_samples: Reference points kept per class (random subsample),
+                None to keep them all
+            cv_folds: Folds of the cross-validated bandwidth search
+            random_state: Seed of the subsample
+        """
+        self.bandwidth = bandwidth
+        self.max_samples = max_samples
+        self.cv_folds = cv_folds
+        self.random_state = params.SEED if random_state is None else random_state
+
+    def _choose_bandwidth(self, Z: np.ndarray) -> float:
+        n, d = Z.shape
+        if not isinstance(self.bandwidth, str):
+            return float(self.bandwidth)
+        sigma = max(float(Z.std(axis=0).mean()), 1e-3)
+        if self.bandwidth == "scott":
+            return sigma * n ** (-1.0 / (d + 4))
+        if self.bandwidth == "silverman":
+            return sigma * (n * (d + 2) / 4.0) ** (-1.0 / (d + 4))
+        if self.bandwidth == "cv":
+            from sklearn.model_selection import GridSearchCV
+            from sklearn.neighbors import KernelDensity
+
+            search = GridSearchCV(
+                KernelDensity(),
+                {"bandwidth": sigma * np.logspace(-1.5, 0.5, 20)},
+                cv=min(self.cv_folds, n),
+            ).fit(Z)
+            return float(search.best_params_["bandwidth"])
+        raise ValueError(f"Unknown bandwidth rule: {self.bandwidth}")
+
+    def fit(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        y: Union[np.ndarray, torch.Tensor],
+        class_indices: List[int],
+    ) -> "KernelDensityEstimate":
+        X = _as_array(X)
+        y = np.asarray(y).ravel()
+        self.d = X.shape[1]
+        self.scale = np.maximum(X.std(axis=0), 1e-12)
+        Z = X / self.scale
+        rng = np.random.default_rng(self.random_state)
+        self.data = []
+        for c in class_indices:
+            Z_k = Z[y == c]
+            if self.max_samples is not None and len(Z_k) > self.max_samples:
+                Z_k = Z_k[np.sort(rng.choice(len(Z_k), self.max_samples, False))]
+            self.data.append(Z_k)
+        self.bandwidths = [self._choose_bandwidth(Z_k) for Z_k in self.data]
+        return self
+
+    def _log_marginals(
+        self, Z: np.ndarray, dim_sets: List[Tuple[int, ...]]
+    ) -> np.ndarray:
+        """Log kernel densities of Z on several dimension subsets.
+
+        Returns:
+            Log densities [n_subsets, n_samples, n_classes]
+        """
+        # column j of mask selects the dimensions of subset j
+        mask = np.zeros((self.d, len(dim_sets)))
+        for j, dims in enumerate(dim_sets):
+            mask[list(dims), j] = 1.0
+        sizes = mask.sum(axis=0)
+        out = np.empty((len(dim_sets), len(Z), len(self.data)))
+        for k, (Z_k, h) in enumerate(zip(self.data, self.bandwidths)):
+            # queries per chunk so that the differences stay around 32 MB
+            chunk = max(1, (1 << 22) // max(1, Z_k.size))
+            for i in range(0, len(Z), chunk):
+                sq = (Z[i : i + chunk, None, :] - Z_k[None]) ** 2
+                logits = sq @ (mask / (-2 * h * h))
+                peak = logits.max(axis=1, keepdims=True)
+                log_sum = peak[:, 0] + np.log(np.exp(logits - peak).sum(axis=1))
+                out[:, i : i + chunk, k] = log_sum.T
+            out[..., k] -= (
+                np.log(len(Z_k)) + sizes * 0.5 * np.log(2 * np.pi * h * h)
+            )[:, None]
+        return out
+
+    def log_densities(
+        self, X: torch.Tensor, units: List[Tuple[Iterable[int], Iterable[int]]]
+    ) -> torch.Tensor:
+        Z = _as_array(X, self.d) / self.scale
+        units = [(_as_indices(S), _as_indices(T)) for S, T in units]
+        dim_sets = sorted(
+            {tuple(np.union1d(S, T).tolist()) for S, T in units}
+            | {tuple(T.tolist()) for _, T in units if len(T)}
+        )
+        marginals = dict(zip(dim_sets, self._log_marginals(Z, dim_sets)))
+        log_densities = []
+        for S, T in units:
+            log_density = marginals[tuple(np.union1d(S, T).tolist())]
+            if len(T):
+                log_density = log_density - marginals[tuple(T.tolist())]
+            # densities are over x, not over the scaled features
+            log_densities.append(log_density - np.log(self.scale[S]).sum())
+        return self._to_tensor(np.stack(log_densities, axis=-1))
+
+    def log_density(
+        self, X: torch.Tensor, S: Iterable[int], T: Iterable[int]
+    ) -> torch.Tensor:
+        return self.log_densities(X, [(S, T)])[..., 0]
+
+    def chain_log_densities(
+        self, X: torch.Tensor, order: Iterable[int]
+    ) -> torch.Tensor:
+        order = [int(i) for i in order]
+        return self.log_densities(
+            X, [([j], order[:i]) for i, j in enumerate(order)]
+        )
+
+
+DENSITIES = {
+    "gmm": GaussianMixtureDensity,
+    "kde": KernelDensityEstimate,
+}
+
+
+def make_density(name: str, **kwargs) -> Optional[ClassConditionalDensity]:
+    """Create a density backend by name.
+
+    Args:
+        name: "gaussian" (None, the WoEGaussian moments), "gmm" or "kde"
+        **kwargs: Arguments of the backend
+
+    Returns:
+        Unfitted backend, or None for the Gaussian model
+    """
+    if name in (None, "gaussian"):
+        return None
+    if name not in DENSITIES:
+        raise ValueError(f"Unknown WoE density: {name}")
+    return DENSITIES[name](**kwargs)
@@ -1,29 +1,51 @@
-"""Weight of Evidence (WoE) visualization and explanation utilities.
+"""Weight of Evidence (WoE) explanation utilities.
 
-This module provides classes for visualizing and explaining Weight of Evidence
-results, including plotting functions and explanation generation.
+This module provides the WoE explainer and its array-backed results. Plots
+are drawn by woe.visualisation.WoEVisualisation, built from a result only
+when a plot is requested, so explaining does not import seaborn/matplotlib.
 """
 
-import os
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-from typing import List, Optional, Union, Tuple, Any
+from typing import List, Optional, Union, Tuple, Any, NamedTuple, TYPE_CHECKING
 
 # Local imports
-from .woe_utils import annotate_group
 import params
-from ice.explainer import Explainer
 
+if TYPE_CHECKING:
+    from ice.explainer import Explainer
+    from .visualisation import WoEVisualisation
 
-class WoEVisualisation:
-    """Class for visualizing Weight of Evidence results.
 
-    This class provides methods for plotting WoE values, including bar charts
-    and Bayesian decomposition visualizations.
+def __getattr__(name: str) -> Any:
+    # WoEVisualisation used to live here, import it (and matplotlib) on demand
+    if name == "WoEVisualisation":
+        from .visualisation import WoEVisualisation
+
+        return WoEVisualisation
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class WoEResult:
+    """Explanation of one example for one hypothesis.
+
+    Holds the WoE vector, total WoE and base log odds, plus references to the
+    names needed to draw it. The WoEVisualisation is built on first use of
+    visualisation() or of any of its attributes (pos_woes, plot, ...).
     """
 
+    __slots__ = (
+        "pred_y",
+        "h_entailed",
+        "h_contrast",
+        "base_lods",
+        "total_woe",
+        "attwoes",
+        "attrib_names",
+        "class_names",
+        "show_significant",
+        "_visualisation",
+    )
+
     def __init__(
         self,
         pred_y: int,
@@ -34,10 +56,9 @@ class WoEVisualisation:
         attwoes: np.ndarray,
         attrib_names: List[str],
         class_names: List[str],
-        woe_order: str = "index",
         show_significant: bool = False,
     ) -> None:
-        """Initialize the WoE visualization.
+        """Initialize the result.
 
         Args:
             pred_y: Predicted class index
@@ -45,404 +66,73 @@ class WoEVisualisation:
             h_contrast: Contrast hypothesis indices
             base_lods: Base log odds
             total_woe: Total Weight of Evidence
-            attwoes: WoE values for each attribute
+            attwoes: WoE values for each attribute (all of them, show_significant
+                only filters the visualisation)
             attrib_names: Attribute names
             class_names: Class names
-            woe_order: Sort the woe based on ("index" or "value")
+            show_significant: Whether the visualisation keeps significant WoEs only
         """
-        # Define color schemes
-        self.prnt_colors = {"pos": "green", "neu": "grey_50", "neg": "red"}
-        self.plot_colors = {"pos": "#3C8ABE", "neu": "#808080", "neg": "#CF5246"}
-
-        # Store input parameters
-        self.base_lods = base_lods
-        self.attrib_names = attrib_names
         self.pred_y = pred_y
-        self.attwoes = attwoes
-        self.woe_indices = list(range(len(self.attwoes)))
-        self.total_woe = total_woe
         self.h_entailed = h_entailed
         self.h_contrast = h_contrast
+        self.base_lods = base_lods
+        self.total_woe = total_woe
+        self.attwoes = attwoes
+        self.attrib_names = attrib_names
         self.class_names = class_names
-        self.woe_order = woe_order
-        self.woe_thresholds = params.WOE_THRESHOLDS
+        self.show_significant = show_significant
+        self._visualisation = None
 
-        if show_significant:
-            filtered_woes = []
-            filtered_woe_indices = []
-            filtered_woe_names = []
-            for i, val in enumerate(self.attwoes):
-                if abs(val) > self.woe_thresholds["Neutral"]:
-                    filtered_woes.append(val)
-                    filtered_woe_indices.append(i)
-                    filtered_woe_names.append(self.attrib_names[i])
-            self.attrib_names = filtered_woe_names
-            self.attwoes = filtered_woes
-            self.woe_indices = filtered_woe_indices
-
-        # Sort WoE values for visualization
-        self.sorted_attwoes = [
-            (i, x)
-            for x, i in sorted(
-                zip(attwoes, range(len(self.attrib_names))), reverse=True
-            )
-        ]
-
-        # Categorize WoE values by sign
-        self._categorize_woes()
-
-        # Create color map based on WoE thresholds
-        self.cmap = sns.color_palette("RdBu_r", len(params.WOE_THRESHOLDS) * 2)[::-1]
-
-    def _set_color_bars(self, values_to_bin):
-        v = np.fromiter(self.woe_thresholds.values(), dtype="float")
-        thresholds = np.sort(np.concatenate([-v, v, np.array([0])]))
-        thresholds = thresholds[(thresholds < 10) & (thresholds > -10)]
-        bar_colors = [self.cmap[i] for i in np.digitize(values_to_bin, thresholds)]
-        return bar_colors
-
-    def _categorize_woes(self) -> None:
-        """Categorize WoE values into positive, negative, and neutral groups."""
-        self.neg_woes = []
-        self.neu_woes = []
-        self.pos_woes = []
-
-        for i, val in enumerate(self.attwoes):
-            if val < 0:
-                self.neg_woes.append((self.woe_indices[i], val))
-            elif val == 0:
-                self.neu_woes.append((self.woe_indices[i], val))
-            else:
-                self.pos_woes.append((self.woe_indices[i], val))
-
-        if self.woe_order == "index":
-            key_index = 0
-        elif self.woe_order == "value":
-            key_index = 1
-
-        self.neg_woes = sorted(self.neg_woes, key=lambda k: k[key_index], reverse=True)
-        self.pos_woes = sorted(self.pos_woes, key=lambda k: k[key_index], reverse=True)
-
-    def plot_bayes(
-        self,
-        figsize: Tuple[int, int] = (8, 4),
-        ax: Optional[plt.Axes] = None,
-        show: bool = True,
-        save_path: Optional[str] = None,
-    ) -> plt.Axes:
-        """Plot Bayesian decomposition of log odds.
-
-        Args:
-            figsize: Figure size (width, height)
-            ax: Matplotlib axes to plot on (created if None)
-            show: Whether to display the plot
-            save_path: Path to save the figure
+    def visualisation(self) -> "WoEVisualisation":
+        """WoEVisualisation of this result, built once.
 
         Returns:
-            Matplotlib axes with the plot
-        """
-        if not ax:
-            fig, ax = plt.subplots(figsize=figsize)
-
-        # Define data to plot
-        lods = [self.base_lods, self.total_woe, 0, self.total_woe + self.base_lods]
-        cats = ["PRIOR LOG-ODDS", "TOTAL WOE", "", "POST. LOG-ODDS"]
-        ypos = range(len(cats))
-
-        # Color bars based on their value
-        bar_colors = self._set_color_bars(values_to_bin=lods)
-        ax.barh(ypos, lods, align="center", color=bar_colors)
-
-        # Set axis labels and ticks
-        ax.set_yticks(ypos)
-        ax.set_yticklabels(cats)
-        ax.invert_yaxis()  # labels read top-to-bottom
-
-        # Add reference line and set axis limits
-        ax.axvline(0, alpha=1, color="k", linestyle="-")
-        ax.set_xlim(
-            -1 + min(np.min(self.attwoes), -6), max(6, np.max(self.attwoes)) + 1
-        )
-
-        # Add horizontal separator and title
-        ax.axhline(2, alpha=0.5, color="black", linestyle="-")
-        ax.set_title("Bayes Posterior Log-Odds Decomposition")
-
-        return ax
-
-    def _shorter_annotation(self, level: str, evidence_type: str) -> str:
-        """Generate shorter annotation for significance levels.
-
-        Args:
-            level: Significance level (e.g., "Decisive", "Strong")
-            evidence_type: Direction of evidence ("positive" or "negative")
-
-        Returns:
-            Short annotation string
-        """
-        if evidence_type == "negative":
-            annotation = "-"
-        elif evidence_type == "positive":
-            annotation = "+"
-
-        if level == "Decisive":
-            annotation = annotation * 3
-        elif level == "Strong":
-            annotation = annotation * 2
-        elif level == "Substantial":
-            annotation = annotation * 1
-
-        return annotation
-
-    def plot(
-        self,
-        figsize: Tuple[int, int] = (8, 4),
-        ax: Optional[plt.Axes] = None,
-        include_lods: bool = False,
-        attrib_ord: List = [],
-        woe: List = [],
-    ) -> plt.Axes:
-        """Plot Weight of Evidence values as a horizontal bar chart.
-
-        Args:
-            figsize: Figure size (width, height)
-            ax: Matplotlib axes to plot on (created if None)
-            include_lods: Whether to include log odds in the plot
-            evidence_type: Evidence type ("negative", "positive" or "all")
-
-        Returns:
-            Matplotlib axes with the plot
-        """
-        if not ax:
-            fig, ax = plt.subplots(figsize=figsize)
-
-        # Prepare data for plotting
-        vals = list(woe)
-        cats = [self.attrib_names[i] for i in attrib_ord]
-
-        # Add log odds information if requested
-        if include_lods:
-            vals += [self.base_lods, 0, self.total_woe + self.base_lods]
-            cats += ["PRIOR LOG-ODDS", "", "POST. LOG-ODDS"]
-
-        vals = np.array(vals)
-        ypos = np.arange(len(cats))
-
-        # Plot bars with colors based on value
-        bar_colors = self._set_color_bars(values_to_bin=vals)
-        ax.barh(ypos, vals, align="center", color=bar_colors, zorder=2, height=0.5)
-
-        # Set axis labels and ticks
-        ax.set_yticks(ypos)
-        ax.set_yticklabels(cats, fontsize=17)
-        ax.invert_yaxis()  # labels read top-to-bottom
-
-        # Set limits
-        ax.set_xlim(
-            -1 + min(np.min(self.attwoes), -6), max(6, np.max(self.attwoes)) + 1
-        )
-
-        # Add horizontal separators
-        ax.axhline(len(self.attrib_names), alpha=0.5, color="black", linestyle="-")
-        if include_lods:
-            ax.axhline(len(ypos) - 1.5, alpha=0.5, color="black", linestyle=":")
-
-        # Add group annotation
-        annotate_group(
-            "Individual WoE Scores",
-            (-0.5, len(self.attrib_names) - 0.5),
-            ax,
-            orient="v",
-            rot=90,
-        )
-
-        # Draw vertical threshold lines
-        self._draw_threshold_lines(ax)
-
-        return ax
-
-    def _draw_threshold_lines(
-        self,
-        ax: plt.Axes,
-        pad: float = -0.2,
-        shift: float = 0.5,
-        rot: float = 0,
-        evidence_type: str = "all",
-        text_size: int = 30,
-    ) -> None:
-        """Draw vertical lines to mark WoE thresholds.
-
-        Args:
-            ax: Matplotlib axes to draw on
+            WoEVisualisation object
         """
-        # Draw zero line
-        ax.axvline(0, alpha=1, color="k", linestyle="-")
-
-        # Draw threshold lines
-        prev_threshold = 0
-
-        for i, (level, threshold) in enumerate(self.woe_thresholds.items()):
-            # Draw negative threshold line if within limits
-            if -threshold > ax.get_xlim()[0]:
-                ax.axvline(
-                    -threshold,
-                    alpha=1,
-                    color=self.cmap[int(len(self.cmap) / 2) - i - 1],
-                    linestyle="--",
-                    zorder=1,
-                )
+        if self._visualisation is None:
+            from .visualisation import WoEVisualisation
+
+            self._visualisation = WoEVisualisation(
+                pred_y=self.pred_y,
+                h_entailed=self.h_entailed,
+                h_contrast=self.h_contrast,
+                base_lods=self.base_lods,
+                total_woe=self.total_woe,
+                attwoes=self.attwoes,
+                attrib_names=self.attrib_names,
+                class_names=self.class_names,
+                show_significant=self.show_significant,
+            )
+        return self._visualisation
 
-            # Draw positive threshold line if within limits
-            if threshold < ax.get_xlim()[1]:
-                ax.axvline(
-                    threshold,
-                    alpha=1,
-                    color=self.cmap[i + int(len(self.cmap) / 2)],
-                    linestyle="--",
-                    zorder=1,
-                )
+    def __getattr__(self, name: str) -> Any:
+        # only reached for names that are not slots, e.g. plotting attributes
+        if name in WoEResult.__slots__ or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.visualisation(), name)
 
-            # Add annotations
-            if level == "Neutral":
-                annotate_group(
-                    "N",
-                    (-threshold, threshold),
-                    ax,
-                    pad=pad,
-                    shift=shift,
-                    text_size=text_size,
-                )
-            else:
-                if evidence_type == "all":
-                    pos_annotation = self._shorter_annotation(level, "positive")
-                    neg_annotation = self._shorter_annotation(level, "negative")
-
-                    # Add positive annotation if within limits
-                    annotate_group(
-                        f"{pos_annotation}",
-                        span=(prev_threshold, min(threshold, ax.get_xlim()[1])),
-                        ax=ax,
-                        pad=pad,
-                        shift=shift,
-                        rot=rot,
-                        text_size=text_size,
-                    )
-
-                    # Add negative annotation if within limits
-                    annotate_group(
-                        f"{neg_annotation}",
-                        span=(max(-threshold, ax.get_xlim()[0]), -prev_threshold),
-                        ax=ax,
-                        pad=pad,
-                        shift=shift,
-                        rot=rot,
-                        text_size=text_size,
-                    )
-                else:  # either positive or negative
-                    if evidence_type == "positive":
-                        span = (prev_threshold, min(threshold, ax.get_xlim()[1]))
-                        text_color = "blue"
-                    else:
-                        span = (max(-threshold, ax.get_xlim()[0]), -prev_threshold)
-                        text_color = "red"
-                    annotation = self._shorter_annotation(level, evidence_type)
-                    annotation = "{}\n({})".format(level, annotation)
-                    annotate_group(
-                        f"{annotation}",
-                        color=text_color,
-                        span=span,
-                        ax=ax,
-                        pad=pad,
-                        shift=shift,
-                        rot=rot,
-                        text_size=text_size,
-                    )
-
-            prev_threshold = threshold
-
-    def plot_for_images(
-        self,
-        original_x: Optional[Any],
-        original_h: Optional[Any],
-        Exp: Optional[Explainer],
-        axsLeft: plt.Axes,
-        axsRight: plt.Axes,
-        evidence_type: str = "negative",
-        min_xlim: int = -9,
-        max_xlim: int = 9,
-        woe_values: List = [],
-        woe_indices: List = [],
-        concept_algo: str = "ice",
-        img_evidence_path: str = None,
-        feature_path: str = None,
-    ):
-        num_selected_features = rows = len(woe_values)
-        if num_selected_features == 0:
-            return plt.figure()  # empty figure
-
-        bar_colors = self._set_color_bars(values_to_bin=woe_values)
-        rot = 45
-        if evidence_type == "positive":
-            axsLeft.set_xlim([0, max_xlim])
-        elif evidence_type == "negative":
-            axsLeft.set_xlim([min_xlim, 0])
-        else:
-            rot = 0
-            axsLeft.set_xlim([min_xlim, max_xlim])
-
-        axsLeft.barh(
-            np.arange(num_selected_features),
-            woe_values,
-            align="center",
-            color=bar_colors,
-        )
 
-        if concept_algo == "ice":
-            axsLeft.set_yticks(
-                np.arange(num_selected_features),
-                labels=[
-                    "{}".format(params.SKIN_FEATURE_ID_TO_LABEL[f]) for f in woe_indices
-                ],
-            )
-        else:
-            axsLeft.set_yticks(
-                np.arange(num_selected_features),
-                labels=[params.SKIN_PCBM_CONCEPT_NAMES[f] for f in woe_indices],
-            )
-        axsLeft.set_xticks([])
-        axsLeft.set_xticklabels([])
-
-        self._draw_threshold_lines(
-            ax=axsLeft,
-            pad=0,
-            shift=0,
-            rot=rot,
-            evidence_type=evidence_type,
-            text_size=13,
-        )
+class BatchExplanation(NamedTuple):
+    """One-vs-rest explanations of many examples, as arrays.
 
-        if axsRight.ndim == 1:
-            axsRight = axsRight.reshape(1, -1)
-        for i, feat in enumerate(woe_indices[::-1]):
-            img_test_feat = img_evidence_path / ("feature_{}.jpg".format(feat))
-            if not os.path.exists(img_test_feat):
-                img_test_feat = Exp.segment_concept_image(
-                    original_x, original_h, feat, img_test_feat
-                )
-            img_test = plt.imread(img_test_feat)
-            axsRight[i][0].imshow(img_test, interpolation="none")
-            axsRight[i][0].get_xaxis().set_ticks([])
-            axsRight[i][0].get_yaxis().set_ticks([])
+    Attributes:
+        hypotheses: Hypothesis classes [n_hypotheses]
+        attwoes: WoE per unit [n_samples, n_hypotheses, n_units]
+        total_woe: Sum of the unit WoEs [n_samples, n_hypotheses]
+        base_lods: Prior log odds [n_hypotheses]
+        attrib_names: Unit names
+    """
 
-            img_feat = feature_path / ("{}.jpg".format(feat))
-            img = plt.imread(img_feat)
-            axsRight[i][1].imshow(img, interpolation="none")
-            axsRight[i][1].get_xaxis().set_ticks([])
-            axsRight[i][1].get_yaxis().set_ticks([])
+    hypotheses: np.ndarray
+    attwoes: np.ndarray
+    total_woe: np.ndarray
+    base_lods: np.ndarray
+    attrib_names: List[str]
 
-        axsRight[rows - 1][0].set_xlabel("Test image")
-        axsRight[rows - 1][1].set_xlabel("Training images")
-        return axsLeft, axsRight
+    @property
+    def posterior_lods(self) -> np.ndarray:
+        """Posterior log odds [n_samples, n_hypotheses]."""
+        return self.total_woe + self.base_lods
 
 
 class WoEExplainer:
@@ -452,6 +142,10 @@ class WoEExplainer:
     explanations for classification results.
     """
 
+    # (S, T) index pairs per unit type, built on first use
+    _units = None
+    chain_order = None
+
     def __init__(
         self,
         woe_model: Any,
@@ -460,6 +154,7 @@ class WoEExplainer:
         total_woe_correction: bool = False,
         featgroup_idxs: Optional[List[List[int]]] = None,
         featgroup_names: Optional[List[str]] = None,
+        chain_order: Optional[List[int]] = None,
     ) -> None:
         """Initialize the WoE explainer.
 
@@ -467,9 +162,12 @@ class WoEExplainer:
             woe_model: Weight of Evidence model
             classes: Class names
             features: Feature names
-            total_woe_correction: Whether to correct total WoE
+            total_woe_correction: Whether to rescale the unit WoEs (chain
+                units included) so they sum to the classifier's WoE instead of
+                the Gaussian model's
             featgroup_idxs: Feature group indices
             featgroup_names: Feature group names
+            chain_order: Feature order of the "chain" units (index order)
         """
         self.classes = classes
         self.features = features
@@ -477,6 +175,7 @@ class WoEExplainer:
         self.total_woe_correction = total_woe_correction
         self.featgroup_idxs = featgroup_idxs
         self.featgroup_names = featgroup_names
+        self.chain_order = chain_order
         self.woe_thresholds = params.WOE_THRESHOLDS
 
     def _get_explanation(
@@ -487,7 +186,7 @@ class WoEExplainer:
         null_hyp: Union[List[int], np.ndarray],
         units: str = "features",
         show_significant: bool = False,
-    ) -> WoEVisualisation:
+    ) -> WoEResult:
         """Compute explanation for a single example.
 
         Args:
@@ -495,10 +194,10 @@ class WoEExplainer:
             hypothesis: Hypothesis class
             hyp: Hypothesis indices
             null_hyp: Null hypothesis indices
-            units: Units for explanation ("group" or "features")
+            units: Units for explanation ("group", "features" or "chain")
 
         Returns:
-            WoEVisualisation object
+            WoEResult
         """
         assert x.ndim == 1, "Input must be a single example (1D array)"
         assert isinstance(hyp, (np.ndarray, list)), "Hypothesis must be array or list"
@@ -511,26 +210,20 @@ class WoEExplainer:
         # Calculate prior log odds
         prior_lodds = self.woe_model.prior_lodds(hyp, null_hyp)
 
-        # Compute WoE scores based on units
-        if "group" in units:
-            # Compute per-attribute WoE scores
-            woes = []
-            for i, idxs in enumerate(self.featgroup_idxs):
-                S = idxs
-                T = np.array([feats for feats in self.featgroup_idxs if feats != idxs])
-                woes.append(self.woe_model.woe(x, hyp, null_hyp, S=S, T=T))
-            woes = np.array(woes).T
-            woe_names = self.featgroup_names
-
-        elif units == "features":
-            # Compute per-feature WoE scores
-            woes = []
-            for i in range(num_features):
-                S = np.array([i])
-                T = np.array(list(set(range(num_features)) - {i}))
-                woes.append(self.woe_model.woe(x, hyp, null_hyp, S=S, T=T))
-            woes = np.array(woes).T
+        if units == "chain":
+            # Sequential decomposition, sums to the Gaussian model's total WoE
+            # by construction, corrected below like the other units
+            if len(hyp) != 1:
+                raise ValueError("Chain units need a single hypothesis class")
+            woes = self.woe_model.chain_woe_batch(
+                x, hyp, order=self.chain_order, null_hypotheses=[null_hyp]
+            )[0, 0]
             woe_names = self.features
+        else:
+            # Compute WoE scores based on units, conditionals come from the
+            # woe model's cache so only the first request factorises them
+            pairs, woe_names = self._unit_pairs(units, num_features)
+            woes = self.woe_model.woe_units(x, hyp, null_hyp, pairs)
 
         # Calculate total WoE (sum of individual WoEs)
         total_woe = woes.sum()
@@ -541,7 +234,7 @@ class WoEExplainer:
             total_woe = woes.sum()
 
         # Create and return explanation
-        return WoEVisualisation(
+        return WoEResult(
             pred_y=hypothesis,
             h_entailed=hyp,
             h_contrast=null_hyp,
@@ -585,6 +278,110 @@ class WoEExplainer:
                 # Multiplicative dampening
                 woes[woes < 0] *= (sum_woes_neg - delta) / sum_woes_neg
 
+    def _unit_pairs(
+        self, units: str, num_features: int
+    ) -> Tuple[List[Tuple[np.ndarray, np.ndarray]], List[str]]:
+        """(S, T) index pairs and names of the explanation units.
+
+        Args:
+            units: Units for explanation ("group" or "features")
+            num_features: Number of features
+
+        Returns:
+            Tuple of (S, T) pairs and unit names
+        """
+        key = ("group" if "group" in units else "features", num_features)
+        if self._units is None:
+            self._units = {}
+        if key not in self._units:
+            if key[0] == "group":
+                groups = [np.asarray(idxs) for idxs in self.featgroup_idxs]
+                pairs = [
+                    (S, np.concatenate([T for j, T in enumerate(groups) if j != i]))
+                    for i, S in enumerate(groups)
+                ]
+                self._units[key] = (pairs, self.featgroup_names)
+            else:
+                features = np.arange(num_features)
+                pairs = [(np.array([i]), np.delete(features, i)) for i in features]
+                self._units[key] = (pairs, self.features)
+        return self._units[key]
+
+    def explain_batch(
+        self,
+        X: Union[np.ndarray, Any],
+        hypotheses: Optional[List[int]] = None,
+        units: str = "features",
+    ) -> "BatchExplanation":
+        """Compute one-vs-rest explanations for many examples at once.
+
+        Vectorized counterpart of calling explain_for_human(x, h, plot=False)
+        for every row x of X and every hypothesis h.
+
+        Args:
+            X: Input features [n_samples, n_features]
+            hypotheses: Hypothesis classes (all classes by default)
+            units: Units for explanation ("group", "features" or "chain")
+
+        Returns:
+            BatchExplanation with woes [n_samples, n_hypotheses, n_units]
+        """
+        if hypotheses is None:
+            hypotheses = list(range(len(self.classes)))
+        if units == "chain":
+            woes = self.woe_model.chain_woe_batch(
+                X, hypotheses, order=self.chain_order
+            )
+            names = self.features
+        else:
+            pairs, names = self._unit_pairs(units, X.shape[-1])
+            woes = self.woe_model.woe_batch(X, hypotheses, units=pairs)
+        if self.total_woe_correction:
+            woes = self._apply_woe_correction_batch(woes, X, hypotheses)
+
+        return BatchExplanation(
+            hypotheses=np.asarray(hypotheses),
+            attwoes=woes,
+            total_woe=woes.sum(axis=-1),
+            base_lods=self.woe_model.prior_lodds_batch(hypotheses),
+            attrib_names=names,
+        )
+
+    def _apply_woe_correction_batch(
+        self, woes: np.ndarray, X: Union[np.ndarray, Any], hypotheses: List[int]
+    ) -> np.ndarray:
+        """Batched _apply_woe_correction over samples and hypotheses.
+
+        Args:
+            woes: WoE values [n_samples, n_hypotheses, n_units]
+            X: Input features [n_samples, n_features]
+            hypotheses: Hypothesis classes
+
+        Returns:
+            Corrected WoE values
+        """
+        empirical_woe = self.woe_model.model_woe_batch(X, hypotheses)
+        delta = (woes.sum(axis=-1) - empirical_woe)[..., None]
+        tol = 1e-8
+
+        pos = woes > 0
+        neg = woes < 0
+        sum_pos = np.where(pos, woes, 0).sum(axis=-1, keepdims=True)
+        sum_neg = np.where(neg, woes, 0).sum(axis=-1, keepdims=True)
+        # Multiplicative dampening of the side that causes the discrepancy
+        scale_pos = np.divide(
+            sum_pos - delta, sum_pos, out=np.ones_like(sum_pos), where=sum_pos != 0
+        )
+        scale_neg = np.divide(
+            sum_neg - delta, sum_neg, out=np.ones_like(sum_neg), where=sum_neg != 0
+        )
+        woes = woes.copy()
+        fix_pos = pos & (delta > tol)
+        fix_neg = neg & (delta < -tol)
+        woes[fix_pos] *= np.broadcast_to(scale_pos, woes.shape)[fix_pos]
+        woes[fix_neg] *= np.broadcast_to(scale_neg, woes.shape)[fix_neg]
+        return woes
+
     def explain_for_human(
         self,
         x: np.ndarray,
@@ -601,8 +398,8 @@ class WoEExplainer:
         feature_path: Optional[str] = None,
         original_x: Optional[Any] = None,
         original_h: Optional[Any] = None,
-        Exp: Optional[Explainer] = None,
-    ) -> WoEVisualisation:
+        Exp: Optional["Explainer"] = None,
+    ) -> WoEResult:
         """Generate human-friendly explanation for a prediction.
 
         Args:
@@ -610,7 +407,7 @@ class WoEExplainer:
             hypothesis: Hypothesis class
             show_ranges: Whether to show ranges in the plot
             show_bayes: Whether to show Bayesian decomposition
-            units: Units for explanation ("attributes" or "features")
+            units: Units for explanation ("group", "features" or "chain")
             plot: Whether to generate plots
             save_path: Path to save plots
             data_type: Input data type ("tabular" or "image")
@@ -623,7 +420,7 @@ class WoEExplainer:
             Exp: Explainer object
 
         Returns:
-            WoEVisualisation object
+            WoEResult
         """
         # Generate explanation
         y_num = [hypothesis]
@@ -669,7 +466,7 @@ class WoEExplainer:
 
     def _generate_plots(
         self,
-        expl: WoEVisualisation,
+        expl: WoEResult,
         show_ranges: bool,
         show_bayes: bool,
         save_path: Optional[str] = None,
@@ -679,17 +476,22 @@ class WoEExplainer:
         feature_path: Optional[str] = None,
         original_x: Optional[Any] = None,
         original_h: Optional[Any] = None,
-        Exp: Optional[Explainer] = None,
+        Exp: Optional["Explainer"] = None,
     ) -> None:
         """Generate and display plots for the explanation.
 
         Args:
-            expl: WoEVisualisation object
+            expl: WoEResult to draw
             show_ranges: Whether to show ranges in the plot
             show_bayes: Whether to show Bayesian decomposition
             save_path: Path to save plots
             data_type: tabular or image
         """
+        import matplotlib.pyplot as plt
+        import matplotlib.gridspec as gridspec
+
+        expl = expl.visualisation()
+
         # Select attributes based on evidence_type
         attrib_ord = []
         woe = []
@@ -0,0 +1,354 @@
+"""Slim, inference-only WoE artifact.
+
+The pickled WoEExplainer carries the whole WoEGaussian, including the
+training matrix and the sklearn classifier. Inference only needs the priors,
+means and covariances, the conditional factors of the explained units, the
+bootstrap replicates and the classifier's parameters, so export_slim writes
+those arrays to an .npz file and everything else to a JSON file next to it.
+load_slim rebuilds a WoEExplainer from them with np.load(allow_pickle=False):
+no arbitrary code is unpickled.
+
+Usage:
+    python -m woe.slim [--version N]
+"""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Optional, Union, List, Tuple, Dict, Any
+
+import numpy as np
+import torch
+
+import params
+from .explainers import WoEExplainer
+from .woe import WoEGaussian
+
+FORMAT_VERSION = 1
+
+
+def slim_paths(path: Union[str, Path]) -> Tuple[Path, Path]:
+    """Array and metadata files of the slim export of an artifact.
+
+    Args:
+        path: Path of the pickled woeexplainer artifact
+
+    Returns:
+        Tuple of the .npz and .json paths
+    """
+    base = str(Path(path).with_suffix(""))
+    return Path(base + ".npz"), Path(base + ".json")
+
+
+def slim_is_current(path: Union[str, Path]) -> bool:
+    """Whether a slim export exists and is not older than the pickled artifact.
+
+    Args:
+        path: Path of the pickled woeexplainer artifact
+
+    Returns:
+        True if the slim export should be loaded
+    """
+    path = Path(path)
+    json_path = slim_paths(path)[1]
+    if not json_path.exists():
+        return False
+    return not path.exists() or json_path.stat().st_mtime >= path.stat().st_mtime
+
+
+class SlimClassifier:
+    """predict_proba / predict of a parametric concept classifier from arrays.
+
+    Supports GaussianNB ("gaussian_nb") and classifiers whose probabilities
+    are a softmax of a linear function, multinomial LogisticRegression and
+    LinearDiscriminantAnalysis ("linear_softmax").
+    """
+
+    def __init__(self, kind: str, arrays: Dict[str, np.ndarray]) -> None:
+        """Initialize from exported parameters.
+
+        Args:
+            kind: "gaussian_nb" or "linear_softmax"
+            arrays: Parameters of the classifier
+        """
+        self.kind = kind
+        self.arrays = arrays
+        self.classes_ = arrays["classes_"]
+
+    @staticmethod
+    def parameters(model: Any) -> Optional[Tuple[str, Dict[str, np.ndarray]]]:
+        """Exportable parameters of a fitted sklearn classifier.
+
+        Args:
+            model: Fitted classifier
+
+        Returns:
+            Tuple of kind and arrays, or None if the classifier is unsupported
+        """
+        name = type(model).__name__
+        if name == "GaussianNB":
+            return "gaussian_nb", {
+                "classes_": model.classes_,
+                "theta_": model.theta_,
+                "var_": model.var_,
+                "class_prior_": model.class_prior_,
+            }
+        multinomial = name in ("LogisticRegression", "LogisticRegressionCV") and (
+            getattr(model, "multi_class", "auto")
+            in ("multinomial", "auto", "deprecated")
+        )
+        if (multinomial or name == "LinearDiscriminantAnalysis") and len(
+            model.classes_
+        ) > 2:
+            return "linear_softmax", {
+                "classes_": model.classes_,
+                "coef_": model.coef_,
+                "intercept_": model.intercept_,
+            }
+        return None
+
+    def _log_scores(self, X: np.ndarray) -> np.ndarray:
+        a = self.arrays
+        if self.kind == "gaussian_nb":
+            # joint log likelihood, as GaussianNB._joint_log_likelihood
+            var = a["var_"]
+            return (
+                np.log(a["class_prior_"])
+                - 0.5 * np.log(2 * np.pi * var).sum(axis=1)
+                - 0.5 * (((X[:, None, :] - a["theta_"]) ** 2) / var).sum(axis=2)
+            )
+        return X @ a["coef_"].T + a["intercept_"]
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        scores = self._log_scores(np.asarray(X, dtype=np.float64))
+        scores -= scores.max(axis=1, keepdims=True)
+        probs = np.exp(scores)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def _mask(indices: np.ndarray) -> int:
+    return int(sum(1 << int(i) for i in indices))
+
+
+def _unmask(mask: int, d: int) -> np.ndarray:
+    return np.array([i for i in range(d) if mask >> i & 1], dtype=np.int64)
+
+
+def _queried_conditionals(woeexplainer: WoEExplainer) -> List[Tuple[Any, ...]]:
+    """Conditional factors of the units the explainer queries.
+
+    Only the per-feature units, the feature groups and the chain are
+    exported, not the full 2^d lattice: the other (S, T) pairs are
+    factorised on first use from the exported means and covariances.
+
+    Args:
+        woeexplainer: Explainer with a Gaussian WoE model
+
+    Returns:
+        Cache entries, (S, T, regression, chol, logdet) or (order, chol)
+    """
+    woe_model = woeexplainer.woe_model
+    cache = woe_model.conditionals
+    d = woe_model.d
+    pairs = list(woeexplainer._unit_pairs("features", d)[0])
+    if woeexplainer.featgroup_idxs is not None:
+        pairs += woeexplainer._unit_pairs("group", d)[0]
+    entries = {}
+    for S, T in pairs:
+        entry = cache.get(S, T)
+        entries[(_mask(entry[0]), _mask(entry[1]))] = entry
+    order = range(d) if woeexplainer.chain_order is None else woeexplainer.chain_order
+    return list(entries.values()) + [cache.chain(order)]
+
+
+def export_slim(
+    woeexplainer: WoEExplainer, path: Union[str, Path]
+) -> Tuple[Path, Path]:
+    """Write the inference-only state of a WoE explainer.
+
+    The conditional factors of the units the explainer queries are exported
+    with it, so loading does not factorise them.
+
+    Args:
+        woeexplainer: Explainer with a Gaussian WoE model
+        path: Path of the pickled artifact, the export goes next to it
+
+    Returns:
+        Tuple of the written .npz and .json paths
+    """
+    woe_model = woeexplainer.woe_model
+    if woe_model.density_backend is not None:
+        raise ValueError("Slim export supports the Gaussian WoE density only")
+
+    arrays = {
+        "priors": woe_model.priors.cpu().numpy(),
+        "means": woe_model.means.cpu().numpy(),
+        "covs": woe_model.covs.cpu().numpy(),
+    }
+    if woe_model.class_counts is not None:
+        arrays["class_counts"] = woe_model.class_counts.cpu().numpy()
+    if woe_model.bootstrap is not None:
+        for k, v in woe_model.bootstrap.items():
+            arrays["bootstrap_" + k] = v.cpu().numpy()
+
+    classifier = SlimClassifier.parameters(woe_model.model)
+    if classifier is None:
+        if woeexplainer.total_woe_correction:
+            raise ValueError(
+                "total_woe_correction needs the classifier, which cannot be "
+                "exported: {}".format(type(woe_model.model).__name__)
+            )
+        print("Classifier {} not exported".format(type(woe_model.model).__name__))
+    else:
+        arrays.update({"clf_" + k: v for k, v in classifier[1].items()})
+
+    conditionals = []
+    for entry in _queried_conditionals(woeexplainer):
+        if len(entry) == 2:
+            name = "chain_{}".format(len(conditionals))
+            arrays[name + "_chol"] = entry[1].cpu().numpy()
+            conditionals.append({"name": name, "order": entry[0].tolist()})
+        else:
+            S, T, regression, chol, logdet = entry
+            name = "cond_{}_{}".format(_mask(S), _mask(T))
+            arrays[name + "_regression"] = regression.cpu().numpy()
+            arrays[name + "_chol"] = chol.cpu().numpy()
+            arrays[name + "_logdet"] = logdet.cpu().numpy()
+            conditionals.append({"name": name, "S": _mask(S), "T": _mask(T)})
+
+    def indices(idxs: Any) -> Any:
+        if idxs is None:
+            return None
+        return [indices(i) if np.ndim(i) else int(i) for i in idxs]
+
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "classes": list(woeexplainer.classes),
+        "features": list(woeexplainer.features),
+        "total_woe_correction": bool(woeexplainer.total_woe_correction),
+        "featgroup_idxs": indices(woeexplainer.featgroup_idxs),
+        "featgroup_names": woeexplainer.featgroup_names,
+        "chain_order": indices(woeexplainer.chain_order),
+        "woe_model": {
+            "class_indices": [int(c) for c in woe_model.class_indices],
+            "d": int(woe_model.d),
+            "is_independent": bool(woe_model.is_independent),
+            "woe_clf": woe_model.woe_clf,
+        },
+        "classifier": None if classifier is None else classifier[0],
+        "conditionals": conditionals,
+    }
+
+    npz_path, json_path = slim_paths(path)
+    np.savez(npz_path, **arrays)
+    with open(json_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+    return npz_path, json_path
+
+
+def load_slim(
+    path: Union[str, Path], device: Optional[torch.device] = None
+) -> WoEExplainer:
+    """Rebuild an inference-only WoE explainer from its slim export.
+
+    The WoE model has no training data (X and y are None), its classifier
+    only provides predict_proba and predict.
+
+    Args:
+        path: Path of the pickled artifact the export was written next to
+        device: Device of the tensors (params.DEVICE)
+
+    Returns:
+        WoEExplainer
+    """
+    device = params.DEVICE if device is None else device
+    npz_path, json_path = slim_paths(path)
+    with open(json_path) as f:
+        metadata = json.load(f)
+    if metadata["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            "Unsupported slim WoE format {}".format(metadata["format_version"])
+        )
+
+    with np.load(npz_path, allow_pickle=False) as npz:
+        arrays = {k: npz[k] for k in npz.files}
+
+    def tensor(name: str) -> torch.Tensor:
+        return torch.as_tensor(arrays[name], device=device)
+
+    config = metadata["woe_model"]
+    woe_model = WoEGaussian.__new__(WoEGaussian)
+    woe_model.model = None
+    if metadata["classifier"] is not None:
+        woe_model.model = SlimClassifier(
+            metadata["classifier"],
+            {k[4:]: v for k, v in arrays.items() if k.startswith("clf_")},
+        )
+    woe_model.class_indices = config["class_indices"]
+    woe_model.is_independent = config["is_independent"]
+    woe_model.woe_clf = config["woe_clf"]
+    woe_model.d = config["d"]
+    woe_model.X = None
+    woe_model.y = None
+    woe_model.priors = tensor("priors")
+    woe_model.means = tensor("means")
+    woe_model.covs = tensor("covs")
+    if "class_counts" in arrays:
+        woe_model.class_counts = tensor("class_counts")
+    bootstrap = {
+        k[len("bootstrap_") :]: tensor(k) for k in arrays if k.startswith("bootstrap_")
+    }
+    if bootstrap:
+        woe_model.bootstrap = bootstrap
+
+    cache = woe_model.conditionals
+    d = woe_model.d
+    for entry in metadata["conditionals"]:
+        name = entry["name"]
+        if "order" in entry:
+            order = np.array(entry["order"], dtype=np.int64)
+            cache.entries[("chain", tuple(entry["order"]))] = (
+                order,
+                tensor(name + "_chol"),
+            )
+            continue
+        S = _unmask(entry["S"], d)
+        T = _unmask(entry["T"], d)
+        cache.entries[(frozenset(S.tolist()), frozenset(T.tolist()))] = (
+            S,
+            T,
+            tensor(name + "_regression"),
+            tensor(name + "_chol"),
+            tensor(name + "_logdet"),
+        )
+
+    woeexplainer = WoEExplainer(
+        woe_model,
+        classes=metadata["classes"],
+        features=metadata["features"],
+        total_woe_correction=metadata["total_woe_correction"],
+        featgroup_idxs=metadata["featgroup_idxs"],
+        featgroup_names=metadata["featgroup_names"],
+        chain_order=metadata["chain_order"],
+    )
+    return woeexplainer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a slim WoE artifact")
+    parser.add_argument("--version", type=int, default=None)
+    args = parser.parse_args()
+
+    path = params.artifact_path("woeexplainer", args.version)
+    woeexplainer = torch.load(
+        path, map_location=torch.device(params.DEVICE), weights_only=False
+    )
+    for written in export_slim(woeexplainer, path):
+        print(f"Saved: {written}")
+
+
+if __name__ == "__main__":
+    main()
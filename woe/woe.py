@@ -4,13 +4,18 @@ This module provides functionality for computing Weight of Evidence using Gaussi
 distributions, including both independent and dependent variable cases.
 """
 
+import os
+
 import numpy as np
 import torch
 from scipy.special import logsumexp
-import time
-from typing import Optional, Union, List, Tuple, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from pathlib import Path
+from typing import Optional, Union, List, Tuple, Dict, Any, Iterable
 
 import params
+from .densities import ClassConditionalDensity, make_density
 
 
 def gaussian_log_density(
@@ -113,6 +118,371 @@ def gaussian_mixture(
     return logsumexp(log_probs)
 
 
+class ConditionalCache(ClassConditionalDensity):
+    """Memoized factors of the class conditionals p_k(x_S | x_T).
+
+    For every (S, T) pair it keeps, stacked over classes, the regression
+    matrix B = cov_ST inv(cov_TT), the Cholesky factor L of the conditional
+    covariance cov_SS - B cov_TS and its log-determinant. Entries are computed
+    on first use, or for every subset S with T its complement by precompute.
+    Index order is irrelevant: entries are keyed by (frozenset S, frozenset T).
+    """
+
+    def __init__(
+        self, means: torch.Tensor, covs: torch.Tensor, is_independent: bool
+    ) -> None:
+        """Initialize an empty cache.
+
+        Args:
+            means: Class means [n_classes, n_features]
+            covs: Class covariances [n_classes, n_features, n_features]
+            is_independent: Whether to use independent Gaussian model
+        """
+        self.means = means.double()
+        self.covs = covs.double()
+        self.is_independent = is_independent
+        self.d = means.shape[1]
+        self.entries = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _factors(self, S: np.ndarray, T: np.ndarray) -> Tuple[torch.Tensor, ...]:
+        covs = self.covs
+        covSS = covs[:, S][:, :, S]
+        if self.is_independent:
+            # x_S does not depend on x_T, only the diagonal is used
+            var = torch.diagonal(covSS, dim1=-2, dim2=-1)
+            regression = covs.new_zeros(covs.shape[0], len(S), len(T))
+            chol = torch.diag_embed(torch.sqrt(var))
+        elif len(T) == 0:
+            regression = covs.new_zeros(covs.shape[0], len(S), 0)
+            chol = torch.linalg.cholesky(covSS)
+        else:
+            covST = covs[:, S][:, :, T]
+            covTT = covs[:, T][:, :, T]
+            regression = torch.linalg.solve(covTT, covST.transpose(-1, -2))
+            regression = regression.transpose(-1, -2)
+            conditional_cov = covSS - regression @ covST.transpose(-1, -2)
+            # symmetrise against round-off before factorising
+            conditional_cov = 0.5 * (
+                conditional_cov + conditional_cov.transpose(-1, -2)
+            )
+            chol = torch.linalg.cholesky(conditional_cov)
+        logdet = 2 * torch.log(torch.diagonal(chol, dim1=-2, dim2=-1)).sum(-1)
+        return regression, chol, logdet
+
+    def get(
+        self, S: Iterable[int], T: Iterable[int]
+    ) -> Tuple[np.ndarray, np.ndarray, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Factors of p(x_S | x_T) for every class.
+
+        Args:
+            S: Selected feature indices
+            T: Conditioning feature indices
+
+        Returns:
+            Tuple of sorted S, sorted T, regression matrices [n_classes, |S|, |T|],
+            Cholesky factors [n_classes, |S|, |S|] and log-determinants [n_classes]
+        """
+        key = (
+            frozenset(np.asarray(S).ravel().tolist()),
+            frozenset(np.asarray(T).ravel().tolist()),
+        )
+        entry = self.entries.get(key)
+        if entry is None:
+            S = np.array(sorted(key[0]), dtype=np.int64)
+            T = np.array(sorted(key[1]), dtype=np.int64)
+            entry = (S, T) + self._factors(S, T)
+            self.entries[key] = entry
+        return entry
+
+    def precompute(self) -> None:
+        """Fill the cache for every non-empty subset S with T its complement."""
+        features = set(range(self.d))
+        for mask in range(1, 2**self.d):
+            S = [i for i in range(self.d) if mask >> i & 1]
+            self.get(S, sorted(features.difference(S)))
+
+    def chain(self, order: Iterable[int]) -> Tuple[np.ndarray, torch.Tensor]:
+        """Cholesky factors of the covariances with features in chain order.
+
+        The factor is grown one concept at a time: appending feature j to the
+        ordered prefix A adds the row l = inv(L_A) cov_Aj with diagonal
+        sqrt(cov_jj - |l|^2), a triangular solve instead of a refactorisation,
+        so the whole chain costs O(d^3) per class.
+
+        Args:
+            order: Order in which the features enter the chain
+
+        Returns:
+            Tuple of the order and lower Cholesky factors [n_classes, d, d]
+        """
+        order = tuple(int(i) for i in order)
+        key = ("chain", order)
+        entry = self.entries.get(key)
+        if entry is None:
+            order_ = np.array(order, dtype=np.int64)
+            covs = self.covs
+            if self.is_independent:
+                var = torch.diagonal(covs, dim1=-2, dim2=-1)[:, order_]
+                chol = torch.diag_embed(torch.sqrt(var))
+            else:
+                chol = covs.new_zeros(covs.shape[0], len(order), len(order))
+                for i, j in enumerate(order_):
+                    sq_norm = 0
+                    if i:
+                        row = torch.linalg.solve_triangular(
+                            chol[:, :i, :i],
+                            covs[:, order_[:i], j][..., None],
+                            upper=False,
+                        )[..., 0]
+                        chol[:, i, :i] = row
+                        sq_norm = (row**2).sum(-1)
+                    chol[:, i, i] = torch.sqrt(covs[:, j, j] - sq_norm)
+            entry = (order_, chol)
+            self.entries[key] = entry
+        return entry
+
+    def chain_log_densities(
+        self, X: torch.Tensor, order: Iterable[int]
+    ) -> torch.Tensor:
+        """Log p_k(x_j | features before j in the chain) for every step.
+
+        Args:
+            X: Input data [n_samples, n_features]
+            order: Order in which the features enter the chain
+
+        Returns:
+            Log densities [n_samples, n_classes, n_features], in chain order
+        """
+        order, chol = self.chain(order)
+        X = torch.as_tensor(X).reshape(-1, self.d).to(self.means.device).double()
+        diff = (X[:, None, order] - self.means[None, :, order])[..., None]
+        y = torch.linalg.solve_triangular(chol[None], diff, upper=False)[..., 0]
+        log_sd = torch.log(torch.diagonal(chol, dim1=-2, dim2=-1))
+        return -0.5 * np.log(2 * np.pi) - log_sd[None] - 0.5 * y**2
+
+    def log_density(
+        self, X: torch.Tensor, S: Iterable[int], T: Iterable[int]
+    ) -> torch.Tensor:
+        """Log conditional density of x_S given x_T under every class.
+
+        Args:
+            X: Input data [n_samples, n_features]
+            S: Selected feature indices
+            T: Conditioning feature indices
+
+        Returns:
+            Log densities [n_samples, n_classes]
+        """
+        S, T, regression, chol, logdet = self.get(S, T)
+        X = torch.as_tensor(X).reshape(-1, self.d).to(self.means.device).double()
+        diff_T = X[:, None, T] - self.means[None, :, T]
+        conditional_mean = self.means[None, :, S] + torch.einsum(
+            "kst,nkt->nks", regression, diff_T
+        )
+        diff = (X[:, None, S] - conditional_mean)[..., None]
+        y = torch.linalg.solve_triangular(chol[None], diff, upper=False)[..., 0]
+        return -0.5 * (len(S) * np.log(2 * np.pi) + logdet[None] + (y**2).sum(-1))
+
+
+class GaussianSufficientStats:
+    """Per-class count, sum and sum of outer products, accumulated in float64.
+
+    Statistics of disjoint parts of the data merge by addition, so a fit can
+    run over a stream of batches or over shards in separate processes.
+    """
+
+    def __init__(self, class_indices: List[int], d: int) -> None:
+        """Initialize empty statistics.
+
+        Args:
+            class_indices: Class indices
+            d: Number of features
+        """
+        self.class_indices = list(class_indices)
+        self.d = d
+        n_classes = len(self.class_indices)
+        self.counts = np.zeros(n_classes, dtype=np.int64)
+        self.sums = np.zeros((n_classes, d))
+        self.outer = np.zeros((n_classes, d, d))
+
+    @classmethod
+    def from_moments(
+        cls,
+        class_indices: List[int],
+        counts: np.ndarray,
+        means: np.ndarray,
+        covs: np.ndarray,
+    ) -> "GaussianSufficientStats":
+        """Statistics reproducing given per-class means and (unbiased) covariances.
+
+        Args:
+            class_indices: Class indices
+            counts: Samples per class
+            means: Class means [n_classes, d]
+            covs: Class covariances [n_classes, d, d]
+
+        Returns:
+            GaussianSufficientStats
+        """
+        stats = cls(class_indices, means.shape[1])
+        counts = np.asarray(counts, dtype=np.int64)
+        means = np.asarray(means, dtype=np.float64)
+        n = counts[:, None, None].astype(np.float64)
+        stats.counts = counts
+        stats.sums = means * counts[:, None]
+        stats.outer = np.asarray(covs, dtype=np.float64) * np.maximum(n - 1, 0) + n * (
+            means[:, :, None] * means[:, None, :]
+        )
+        return stats
+
+    def update(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        y: Union[np.ndarray, torch.Tensor],
+        weights: Optional[np.ndarray] = None,
+    ) -> "GaussianSufficientStats":
+        """Accumulate one batch.
+
+        Args:
+            X: Features [n_samples, d]
+            y: Labels [n_samples]
+            weights: Integer multiplicity of every sample (bootstrap resamples)
+
+        Returns:
+            self
+        """
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        for k, c in enumerate(self.class_indices):
+            X_per_class = X[y == c]
+            if weights is None:
+                self.counts[k] += X_per_class.shape[0]
+                self.sums[k] += X_per_class.sum(axis=0)
+                self.outer[k] += X_per_class.T @ X_per_class
+            else:
+                w = np.asarray(weights)[y == c]
+                self.counts[k] += int(w.sum())
+                self.sums[k] += w @ X_per_class
+                self.outer[k] += (X_per_class * w[:, None]).T @ X_per_class
+        return self
+
+    def merge(self, other: "GaussianSufficientStats") -> "GaussianSufficientStats":
+        """Add the statistics of another shard.
+
+        Args:
+            other: Statistics of disjoint data with the same classes
+
+        Returns:
+            self
+        """
+        if other.class_indices != self.class_indices or other.d != self.d:
+            raise ValueError("Cannot merge statistics of different models.")
+        self.counts += other.counts
+        self.sums += other.sums
+        self.outer += other.outer
+        return self
+
+    def moments(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Priors, means and unbiased covariances (zero below two samples).
+
+        Returns:
+            Tuple of priors [n_classes], means [n_classes, d], covs [n_classes, d, d]
+        """
+        n = np.maximum(self.counts, 1).astype(np.float64)
+        priors = self.counts / max(self.counts.sum(), 1)
+        means = self.sums / n[:, None]
+        covs = self.outer - n[:, None, None] * (means[:, :, None] * means[:, None, :])
+        covs /= np.maximum(n - 1, 1)[:, None, None]
+        covs[self.counts <= 1] = 0
+        return priors, means, covs
+
+
+def _shift_spectrum(covs: np.ndarray, eps: float) -> np.ndarray:
+    """Shift every covariance so its smallest eigenvalue is at least eps.
+
+    Args:
+        covs: Covariances [n_classes, d, d], modified in place
+        eps: Smallest eigenvalue
+
+    Returns:
+        The covariances
+    """
+    for k in range(covs.shape[0]):
+        delta = max(eps - np.linalg.eigvalsh(covs[k]).min(), 0)
+        covs[k] += np.eye(covs.shape[1]) * delta
+    return covs
+
+
+def _bootstrap_moments(
+    class_indices: List[int],
+    X: np.ndarray,
+    y: np.ndarray,
+    seeds: List[int],
+    is_independent: bool,
+    eps: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Moments of bootstrap resamples of (X, y), run in a worker process.
+
+    Every replicate draws len(X) samples with replacement, as multinomial
+    sample weights on the sufficient statistics.
+
+    Args:
+        class_indices: Class indices
+        X: Features [n_samples, d]
+        y: Labels [n_samples]
+        seeds: One seed per replicate
+        is_independent: Whether to use independent Gaussian model
+        eps: Small constant for numerical stability
+
+    Returns:
+        Tuple of priors [b, n_classes], means [b, n_classes, d] and precision
+        matrices [b, n_classes, d, d] of the b replicates
+    """
+    n, d = X.shape
+    all_priors, all_means, all_precisions = [], [], []
+    for seed in seeds:
+        weights = np.random.default_rng(seed).multinomial(n, np.full(n, 1.0 / n))
+        stats = GaussianSufficientStats(class_indices, d).update(X, y, weights)
+        priors, means, covs = stats.moments()
+        covs = _shift_spectrum(covs, eps)
+        if is_independent:
+            covs = np.einsum("kii->ki", covs)[:, :, None] * np.eye(d)
+        all_priors.append(priors)
+        all_means.append(means)
+        all_precisions.append(np.linalg.inv(covs))
+    return np.stack(all_priors), np.stack(all_means), np.stack(all_precisions)
+
+
+def _shard_stats(
+    class_indices: List[int], d: int, X: Any, y: Any, model: Any = None
+) -> GaussianSufficientStats:
+    """Statistics of one shard, run in a worker process.
+
+    Args:
+        class_indices: Class indices
+        d: Number of features
+        X: Features or path of a .npy file
+        y: Labels or path of a .npy file
+        model: Classifier giving the labels, None to use y
+
+    Returns:
+        GaussianSufficientStats of the shard
+    """
+    if isinstance(X, (str, Path)):
+        X = np.load(X, mmap_mode="r")
+    if isinstance(y, (str, Path)):
+        y = np.load(y)
+    stats = GaussianSufficientStats(class_indices, d)
+    for i in range(0, len(X), 65536):
+        X_batch = np.asarray(X[i : i + 65536])
+        labels = y[i : i + 65536] if model is None else model.predict(X_batch)
+        stats.update(X_batch, labels)
+    return stats
+
+
 class WoEGaussian:
     """Weight of Evidence implementation using Gaussian distributions.
 
@@ -120,6 +490,13 @@ class WoEGaussian:
     supporting both independent and dependent variable cases.
     """
 
+    # class level defaults so models pickled before these were added still load
+    woe_clf = "original"
+    class_counts = None
+    _conditional_cache = None
+    density_backend = None
+    bootstrap = None
+
     def __init__(
         self,
         classifier_model: Any,
@@ -129,6 +506,9 @@ class WoEGaussian:
         woe_clf: str,
         class_indices: List[str],
         is_independent: bool = False,
+        keep_data: bool = True,
+        density: Optional[str] = None,
+        density_kwargs: Optional[Dict[str, Any]] = None,
     ) -> None:
         """Initialize WoE Gaussian model.
 
@@ -140,6 +520,10 @@ class WoEGaussian:
             woe_clf: Type of WoE classifier
             class_indices: Class indices
             is_independent: Whether to use independent Gaussian model
+            keep_data: Whether to keep X and y on the model after fitting
+            density: Class conditional density behind the WoE, "gaussian",
+                "gmm" or "kde" (params.WOE_DENSITY); priors stay Gaussian fits
+            density_kwargs: Arguments of the density backend
         """
         print("Processing WOE Gaussian model...")
         self.model = classifier_model
@@ -148,12 +532,120 @@ class WoEGaussian:
         self.X = X
         self.y = y
         self.d = no_features
+        self.woe_clf = woe_clf
+        self.density_backend = make_density(
+            params.WOE_DENSITY if density is None else density,
+            **(density_kwargs or {}),
+        )
 
         if woe_clf == "original":
             self.fit(self.X, self.y)
         else:
             y_preds = self.model.predict(self.X)
             self.fit(self.X, y_preds)
+        if not keep_data:
+            self.X = None
+            self.y = None
+
+    @classmethod
+    def from_stats(
+        cls,
+        classifier_model: Any,
+        stats: "GaussianSufficientStats",
+        woe_clf: str = "original",
+        is_independent: bool = False,
+        eps: float = 1e-6,
+        dtype: torch.dtype = torch.float32,
+    ) -> "WoEGaussian":
+        """Build a model from accumulated sufficient statistics.
+
+        The model holds only priors, means and regularised covariances, the
+        training data is not kept (X and y are None).
+
+        Args:
+            classifier_model: Base classifier model
+            stats: Per-class sufficient statistics
+            woe_clf: Type of WoE classifier the statistics were labelled with
+            is_independent: Whether to use independent Gaussian model
+            eps: Small constant for numerical stability
+            dtype: Dtype of the means and covariances
+
+        Returns:
+            Fitted WoEGaussian
+        """
+        woe_model = cls.__new__(cls)
+        woe_model.model = classifier_model
+        woe_model.class_indices = list(stats.class_indices)
+        woe_model.is_independent = is_independent
+        woe_model.X = None
+        woe_model.y = None
+        woe_model.d = stats.d
+        woe_model.woe_clf = woe_clf
+        woe_model._set_moments(stats, eps, dtype)
+        return woe_model
+
+    @classmethod
+    def fit_stream(
+        cls,
+        classifier_model: Any,
+        batches: Iterable[Tuple[np.ndarray, np.ndarray]],
+        no_features: int,
+        woe_clf: str,
+        class_indices: List[int],
+        **kwargs,
+    ) -> "WoEGaussian":
+        """Fit from a stream of (X, y) batches without materialising the data.
+
+        Args:
+            classifier_model: Base classifier model
+            batches: Iterable of (features, labels) batches
+            no_features: Number of features
+            woe_clf: Type of WoE classifier
+            class_indices: Class indices
+            **kwargs: Passed to from_stats
+
+        Returns:
+            Fitted WoEGaussian
+        """
+        stats = GaussianSufficientStats(class_indices, no_features)
+        for X, y in batches:
+            if woe_clf != "original":
+                y = classifier_model.predict(X)
+            stats.update(X, y)
+        return cls.from_stats(classifier_model, stats, woe_clf=woe_clf, **kwargs)
+
+    @classmethod
+    def fit_shards(
+        cls,
+        classifier_model: Any,
+        shards: List[Tuple[Any, Any]],
+        no_features: int,
+        woe_clf: str,
+        class_indices: List[int],
+        n_jobs: Optional[int] = None,
+        **kwargs,
+    ) -> "WoEGaussian":
+        """Fit shards in worker processes and merge their statistics.
+
+        Args:
+            classifier_model: Base classifier model
+            shards: (X, y) pairs of arrays or of .npy paths (memory-mapped)
+            no_features: Number of features
+            woe_clf: Type of WoE classifier
+            class_indices: Class indices
+            n_jobs: Number of worker processes
+            **kwargs: Passed to from_stats
+
+        Returns:
+            Fitted WoEGaussian
+        """
+        model = None if woe_clf == "original" else classifier_model
+        jobs = [(class_indices, no_features, X, y, model) for X, y in shards]
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            stats = reduce(
+                GaussianSufficientStats.merge, pool.map(_shard_stats, *zip(*jobs))
+            )
+        return cls.from_stats(classifier_model, stats, woe_clf=woe_clf, **kwargs)
 
     def fit(
         self,
@@ -168,42 +660,261 @@ class WoEGaussian:
             Y: Training labels
             eps: Small constant for numerical stability
         """
-        Y = self._process_hypothesis(Y)
-        self.priors = []
-        self.means = []
-        self.covs = []
-
-        for c in self.class_indices:
-            s = time.time()
-            # Priors
-            prior = (Y == c).sum() / len(Y)
-            self.priors.append(prior)
-
-            # Class data and compute mean
-            X_per_class = X[Y == c]
-            X_per_class = torch.tensor(X_per_class).to(device=params.DEVICE)
-            X_mean = X_per_class.mean(axis=0)
-            self.means.append(X_mean)
-
-            # Compute regularised covariance
-            if X_per_class.shape[0] <= 1:
-                X_covs = torch.zeros(self.d, self.d).to(device=params.DEVICE)
-            else:
-                X_covs = torch.cov(X_per_class.T)
-            delta = max(eps - torch.linalg.eigvalsh(X_covs).min(), 0)
-            X_covs += torch.eye(self.d).to(device=params.DEVICE) * delta
-            self.covs.append(X_covs)
-
-            t = time.time()
-            print(f"Prediction: {c}, {X_per_class.shape}, {t - s:.2f}s")
+        stats = GaussianSufficientStats(self.class_indices, self.d)
+        stats.update(X, self._process_hypothesis(Y))
+        dtype = torch.as_tensor(np.asarray(X[:1])).dtype
+        self._set_moments(stats, eps, dtype)
+        if self.density_backend is not None:
+            self.density_backend.fit(X, self._process_hypothesis(Y), self.class_indices)
+
+    def _set_moments(
+        self, stats: "GaussianSufficientStats", eps: float, dtype: torch.dtype
+    ) -> None:
+        """Set priors, means and regularised covariances from statistics.
 
-        self.priors = torch.tensor(self.priors, device=params.DEVICE)
-        self.means = torch.stack(self.means)
-        self.covs = torch.stack(self.covs)
+        Args:
+            stats: Per-class sufficient statistics
+            eps: Small constant for numerical stability
+            dtype: Dtype of the means and covariances
+        """
+        priors, means, covs = stats.moments()
+        covs = _shift_spectrum(covs, eps)
+        for k, c in enumerate(self.class_indices):
+            print(f"Prediction: {c}, {stats.counts[k]} samples")
+
+        self.class_counts = torch.tensor(stats.counts, device=params.DEVICE)
+        self.priors = torch.tensor(priors, device=params.DEVICE)
+        self.means = torch.tensor(means, dtype=dtype, device=params.DEVICE)
+        self.covs = torch.tensor(covs, dtype=dtype, device=params.DEVICE)
+        self._conditional_cache = None
         print("Priors: ", self.priors)
         print("Means: ", self.means)
         print("Covs: ", self.covs)
 
+    def sufficient_stats(self) -> "GaussianSufficientStats":
+        """Sufficient statistics equivalent to the fitted moments.
+
+        Returns:
+            GaussianSufficientStats of the training data
+        """
+        counts = self.class_counts
+        if counts is None:
+            Y = self._fit_labels(self.X, np.asarray(self.y))
+            counts = [(Y == c).sum() for c in self.class_indices]
+        return GaussianSufficientStats.from_moments(
+            self.class_indices,
+            np.asarray(torch.as_tensor(counts).cpu()),
+            self.means.cpu().numpy(),
+            self.covs.cpu().numpy(),
+        )
+
+    def _fit_labels(
+        self, X: Union[np.ndarray, torch.Tensor], y: np.ndarray
+    ) -> np.ndarray:
+        """Labels the Gaussians are fitted on, true labels or classifier predictions.
+
+        Args:
+            X: Features
+            y: True labels
+
+        Returns:
+            Numpy array of labels
+        """
+        if self.woe_clf == "original":
+            return self._process_hypothesis(y)
+        return self._process_hypothesis(self.model.predict(X))
+
+    def update(
+        self,
+        X_new: Union[np.ndarray, torch.Tensor],
+        y_new: Union[np.ndarray, torch.Tensor],
+        eps: float = 1e-6,
+    ) -> None:
+        """Update priors, means and covariances with newly labelled samples.
+
+        The statistics of the new samples are merged into those of the fitted
+        moments, so the old data is not revisited. The covariances already
+        carry the small diagonal loading added by fit, which is kept. X and y
+        are extended with the new samples when the model keeps them.
+
+        Args:
+            X_new: New features [n_samples, d]
+            y_new: New labels
+            eps: Small constant for numerical stability
+        """
+        X_new = np.asarray(X_new)
+        y_new = np.asarray(y_new)
+        new_stats = GaussianSufficientStats(self.class_indices, self.d)
+        new_stats.update(X_new, self._fit_labels(X_new, y_new))
+        stats = self.sufficient_stats().merge(new_stats)
+        for k, c in enumerate(self.class_indices):
+            if new_stats.counts[k]:
+                print(
+                    f"Updated: {c}, +{new_stats.counts[k]} samples, "
+                    f"{stats.counts[k]} total"
+                )
+        self._set_moments(stats, eps, self.means.dtype)
+        if self.X is not None:
+            self.X = np.concatenate([np.asarray(self.X), X_new])
+            self.y = np.concatenate([np.asarray(self.y), y_new])
+        if self.density_backend is not None:
+            # non-Gaussian densities have no sufficient statistics to merge
+            if self.X is None:
+                print("No stored features to refit the WoE density, kept unchanged")
+            else:
+                self.density_backend.fit(
+                    self.X, self._fit_labels(self.X, self.y), self.class_indices
+                )
+        if self.bootstrap is not None:
+            if self.X is None:
+                print("No stored features to refit the bootstrap, bands dropped")
+                self.bootstrap = None
+            else:
+                self.fit_bootstrap(self.bootstrap["priors"].shape[0], eps=eps)
+
+    def fit_bootstrap(
+        self,
+        n_replicates: int = 200,
+        n_jobs: Optional[int] = None,
+        seed: Optional[int] = None,
+        eps: float = 1e-6,
+    ) -> None:
+        """Fit bootstrap replicates of priors, means and covariances.
+
+        Replicates are fitted in worker processes and stored stacked, with the
+        covariances already inverted, so woe_intervals evaluates all of them
+        in one batched computation.
+
+        Args:
+            n_replicates: Number of bootstrap replicates B
+            n_jobs: Number of worker processes
+            seed: Seed of the resampling (params.SEED)
+            eps: Small constant for numerical stability
+        """
+        if self.X is None:
+            raise ValueError("Bootstrap needs the training data (keep_data=True)")
+        if self.density_backend is not None:
+            raise ValueError("Bootstrap supports the Gaussian WoE density only")
+        X = np.asarray(torch.as_tensor(self.X).cpu(), dtype=np.float64)
+        y = self._fit_labels(X, np.asarray(self.y))
+        seeds = np.random.SeedSequence(params.SEED if seed is None else seed)
+        seeds = [int(s.generate_state(1)[0]) for s in seeds.spawn(n_replicates)]
+        n_jobs = n_jobs or min(os.cpu_count() or 1, n_replicates)
+        chunks = [list(chunk) for chunk in np.array_split(seeds, n_jobs) if len(chunk)]
+        jobs = [
+            (self.class_indices, X, y, chunk, self.is_independent, eps)
+            for chunk in chunks
+        ]
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(_bootstrap_moments, *zip(*jobs)))
+
+        priors, means, precisions = (np.concatenate(p) for p in zip(*parts))
+        self.bootstrap = {
+            "priors": torch.tensor(priors, device=params.DEVICE),
+            "means": torch.tensor(means, device=params.DEVICE),
+            "precisions": torch.tensor(precisions, device=params.DEVICE),
+        }
+        print(f"Bootstrap: {n_replicates} replicates")
+
+    def woe_intervals(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        hypotheses: Optional[Iterable[int]] = None,
+        level: Optional[float] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Bootstrap confidence intervals of the one-vs-rest per-feature WoE.
+
+        Every replicate gives woe_batch(X) under its own parameters (feature
+        given all other features, no total WoE correction); the intervals are
+        the central quantiles over the replicates.
+
+        Args:
+            X: Input features [n_samples, n_features]
+            hypotheses: Class indices (all classes by default)
+            level: Coverage of the intervals (params.WOE_CI_LEVEL)
+
+        Returns:
+            Dictionary with "low" and "high" [n_samples, n_hypotheses,
+            n_features] and "total_low" and "total_high" [n_samples,
+            n_hypotheses]
+        """
+        if self.bootstrap is None:
+            raise ValueError("No bootstrap replicates, call fit_bootstrap first")
+        hypotheses = self._hypotheses_batch(hypotheses)
+        level = params.WOE_CI_LEVEL if level is None else level
+        priors = self.bootstrap["priors"]
+        means = self.bootstrap["means"]
+        precisions = self.bootstrap["precisions"]
+        X = torch.as_tensor(X).reshape(-1, self.d).to(means.device).double()
+
+        # x_i given the rest: variance 1 / P_ii, residual (P (x - mean))_i / P_ii
+        diff = X[:, None, None, :] - means[None]
+        z = torch.einsum("bkij,nbkj->nbki", precisions, diff)
+        p_diag = torch.diagonal(precisions, dim1=-2, dim2=-1)[None]
+        log_densities = 0.5 * torch.log(p_diag / (2 * np.pi)) - 0.5 * z**2 / p_diag
+
+        log_priors = torch.log(priors)[None, :, :, None]
+        n_classes = priors.shape[1]
+        others = ~torch.eye(n_classes, dtype=torch.bool, device=X.device)
+        others = others[torch.as_tensor(hypotheses, device=X.device)]
+        log_joint = (log_densities + log_priors)[:, :, None]
+        log_joint = log_joint.expand(-1, -1, len(hypotheses), -1, -1)
+        log_mixture = torch.logsumexp(
+            log_joint.masked_fill(~others[None, None, :, :, None], -np.inf), dim=3
+        )
+        woes = log_densities[:, :, hypotheses] - log_mixture
+
+        q = torch.tensor(
+            [(1 - level) / 2, (1 + level) / 2], dtype=woes.dtype, device=X.device
+        )
+        bands = torch.quantile(woes, q, dim=1).cpu().numpy()
+        totals = torch.quantile(woes.sum(-1), q, dim=1).cpu().numpy()
+        return {
+            "low": bands[0],
+            "high": bands[1],
+            "total_low": totals[0],
+            "total_high": totals[1],
+        }
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # the conditional cache is derived data, rebuilt on first use
+        state = self.__dict__.copy()
+        state.pop("_conditional_cache", None)
+        return state
+
+    @property
+    def conditionals(self) -> ClassConditionalDensity:
+        """Class conditionals: the density backend, or the Gaussian factor cache."""
+        if self.density_backend is not None:
+            return self.density_backend
+        cache = self._conditional_cache
+        if cache is None or cache.is_independent != self.is_independent:
+            cache = ConditionalCache(self.means, self.covs, self.is_independent)
+            self._conditional_cache = cache
+        return cache
+
+    def precompute_conditionals(self, max_features: Optional[int] = None) -> bool:
+        """Precompute the conditionals of all 2^d feature subsets when d is small.
+
+        A density backend prepares its per-feature conditionals instead (the
+        mixture components of a GMM), whatever d.
+
+        Args:
+            max_features: Largest d to precompute for (params.WOE_LATTICE_MAX_D)
+
+        Returns:
+            Whether the conditionals were precomputed
+        """
+        if self.density_backend is not None:
+            self.density_backend.precompute()
+            return True
+        if max_features is None:
+            max_features = params.WOE_LATTICE_MAX_D
+        if self.d > max_features:
+            return False
+        self.conditionals.precompute()
+        return True
+
     def _process_hypothesis(
         self, y: Union[int, List[int], np.ndarray, set]
     ) -> np.ndarray:
@@ -302,31 +1013,46 @@ class WoEGaussian:
         """
         x, y1, y2, S = self._process_inputs(x, y1, y2, S)
 
-        ll_num = gaussian_log_density(
-            x=x,
-            S=S,
-            T=T,
-            hypothesis=y1,
-            means=self.means,
-            covs=self.covs,
-            is_independent=self.is_independent,
-        )
-
-        ll_denom = gaussian_mixture(
-            x=x,
-            S=S,
-            T=T,
-            Y=y2,
-            priors=self.priors,
-            means=self.means,
-            covs=self.covs,
-            is_independent=self.is_independent,
+        log_density = self.conditionals.log_density(x, S, T)[0]
+        ll_num = log_density[y1]
+        ll_denom = torch.logsumexp(
+            torch.log(self.priors[y2].double()) + log_density[y2], dim=0
         )
 
         ll_num = self._convert_type_to_number(ll_num)
         ll_denom = self._convert_type_to_number(ll_denom)
         return ll_num - ll_denom
 
+    def woe_units(
+        self,
+        x: Union[np.ndarray, torch.Tensor],
+        y1: Union[int, List[int], np.ndarray],
+        y2: Union[int, List[int], np.ndarray],
+        units: List[Tuple[np.ndarray, np.ndarray]],
+    ) -> np.ndarray:
+        """Compute Weight of Evidence of several units for one example.
+
+        Equals [woe(x, y1, y2, S, T) for S, T in units], with the conditionals
+        of all units evaluated in one call.
+
+        Args:
+            x: Input features
+            y1: Primary hypothesis
+            y2: Alternative hypothesis
+            units: (S, T) index pairs
+
+        Returns:
+            WoE values [n_units]
+        """
+        x, y1, y2, _ = self._process_inputs(x, y1, y2)
+
+        log_density = self.conditionals.log_densities(x, units)[0]
+        ll_num = log_density[int(np.ravel(y1)[0])]
+        ll_denom = torch.logsumexp(
+            torch.log(self.priors[y2].double())[:, None] + log_density[y2], dim=0
+        )
+        return (ll_num - ll_denom).cpu().numpy()
+
     def _model_woe(
         self,
         x: Union[np.ndarray, torch.Tensor],
@@ -425,3 +1151,165 @@ class WoEGaussian:
             odds_den = odds_den.cpu()
 
         return np.log(odds_num / odds_den)
+
+    def _hypotheses_batch(
+        self, hypotheses: Optional[Iterable[int]] = None
+    ) -> np.ndarray:
+        if hypotheses is None:
+            return np.arange(len(self.class_indices))
+        return np.asarray(list(hypotheses), dtype=np.int64)
+
+    def woe_batch(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        hypotheses: Optional[Iterable[int]] = None,
+        units: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None,
+    ) -> np.ndarray:
+        """Compute one-vs-rest WoE for many samples at once.
+
+        For every sample, hypothesis h and unit (S, T) this equals
+        woe(x, h, <all other classes>, S, T).
+
+        Args:
+            X: Input features [n_samples, n_features]
+            hypotheses: Class indices (all classes by default)
+            units: (S, T) index pairs (one per feature by default)
+
+        Returns:
+            WoE values [n_samples, n_hypotheses, n_units]
+        """
+        hypotheses = self._hypotheses_batch(hypotheses)
+        if units is None:
+            features = np.arange(self.d)
+            units = [(np.array([i]), np.delete(features, i)) for i in features]
+        X = torch.as_tensor(X).reshape(-1, self.d).to(self.means.device).double()
+        log_densities = self.conditionals.log_densities(X, units)
+
+        # denominator: mixture over every class but h, unnormalised priors
+        log_joint = log_densities + torch.log(self.priors.double())[None, :, None]
+        n_classes = log_joint.shape[1]
+        others = ~torch.eye(n_classes, dtype=torch.bool, device=X.device)
+        others = others[torch.as_tensor(hypotheses, device=X.device)]
+        log_joint = log_joint[:, None].expand(-1, len(hypotheses), -1, -1)
+        log_mixture = torch.logsumexp(
+            log_joint.masked_fill(~others[None, :, :, None], -np.inf), dim=2
+        )
+        woes = log_densities[:, hypotheses] - log_mixture
+        return woes.cpu().numpy()
+
+    def chain_woe_batch(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        hypotheses: Optional[Iterable[int]] = None,
+        order: Optional[Iterable[int]] = None,
+        null_hypotheses: Optional[List[Iterable[int]]] = None,
+    ) -> np.ndarray:
+        """Sequential (chain rule) WoE decomposition.
+
+        Feature j gets the WoE of x_j given the features before it in the
+        chain, under the hypothesis against the prior weighted mixture of the
+        null classes. The terms telescope, so for every sample and hypothesis
+        they sum exactly to log p(x | h) - log p(x | null), the total WoE of
+        the Gaussian model (not of the classifier; WoEExplainer rescales them
+        with total_woe_correction like the other units).
+
+        Args:
+            X: Input features [n_samples, n_features]
+            hypotheses: Class indices (all classes by default)
+            order: Order in which features enter the chain (index order)
+            null_hypotheses: Null classes per hypothesis (all others by default)
+
+        Returns:
+            WoE values [n_samples, n_hypotheses, n_features], in feature order
+        """
+        hypotheses = self._hypotheses_batch(hypotheses)
+        if order is None:
+            order = range(self.d)
+        order = np.asarray(list(order), dtype=np.int64)
+        X = torch.as_tensor(X).reshape(-1, self.d).to(self.means.device).double()
+        steps = self.conditionals.chain_log_densities(X, order)
+
+        # log pi_k + log p_k(first i features of the chain), for i = 0..d
+        prefix = torch.cumsum(steps, dim=-1)
+        prefix = torch.cat([torch.zeros_like(prefix[..., :1]), prefix], dim=-1)
+        log_joint = prefix + torch.log(self.priors.double())[None, :, None]
+
+        n_classes = log_joint.shape[1]
+        device = log_joint.device
+        if null_hypotheses is None:
+            null = ~torch.eye(n_classes, dtype=torch.bool, device=device)
+            null = null[torch.as_tensor(hypotheses, device=device)]
+        else:
+            null = torch.zeros(
+                len(hypotheses), n_classes, dtype=torch.bool, device=device
+            )
+            for i, y2 in enumerate(null_hypotheses):
+                null[i, torch.as_tensor(list(y2), device=device)] = True
+        per_hypothesis = log_joint[:, None].expand(-1, len(hypotheses), -1, -1)
+        log_null = torch.logsumexp(
+            per_hypothesis.masked_fill(~null[None, :, :, None], -np.inf), dim=2
+        )
+        log_ratio = log_joint[:, hypotheses] - log_null
+        steps_woe = torch.diff(log_ratio, dim=-1)
+
+        woes = torch.empty_like(steps_woe)
+        woes[..., order] = steps_woe
+        return woes.cpu().numpy()
+
+    def prior_lodds_batch(
+        self, hypotheses: Optional[Iterable[int]] = None
+    ) -> np.ndarray:
+        """Compute one-vs-rest prior log odds for several hypotheses.
+
+        Args:
+            hypotheses: Class indices (all classes by default)
+
+        Returns:
+            Prior log odds [n_hypotheses]
+        """
+        hypotheses = self._hypotheses_batch(hypotheses)
+        priors = self.priors.double().cpu().numpy()
+        return np.log(priors[hypotheses] / (priors.sum() - priors[hypotheses]))
+
+    def posterior_lodds_batch(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        hypotheses: Optional[Iterable[int]] = None,
+        eps: float = 1e-12,
+    ) -> np.ndarray:
+        """Compute one-vs-rest posterior log odds with one predict_proba call.
+
+        Args:
+            X: Input features [n_samples, n_features]
+            hypotheses: Class indices (all classes by default)
+            eps: Small constant for numerical stability
+
+        Returns:
+            Posterior log odds [n_samples, n_hypotheses]
+        """
+        hypotheses = self._hypotheses_batch(hypotheses)
+        X = torch.as_tensor(X).reshape(-1, self.d).cpu().numpy()
+        probs = self.model.predict_proba(X)
+        odds_num = probs[:, hypotheses]
+        odds_den = probs.sum(axis=1, keepdims=True) - odds_num
+        odds_num = np.clip(odds_num, eps, 1 - eps)
+        odds_den = np.clip(odds_den, eps, 1 - eps)
+        return np.log(odds_num / odds_den)
+
+    def model_woe_batch(
+        self,
+        X: Union[np.ndarray, torch.Tensor],
+        hypotheses: Optional[Iterable[int]] = None,
+    ) -> np.ndarray:
+        """Batched counterpart of _model_woe for one-vs-rest hypotheses.
+
+        Args:
+            X: Input features [n_samples, n_features]
+            hypotheses: Class indices (all classes by default)
+
+        Returns:
+            Model WoE [n_samples, n_hypotheses]
+        """
+        return self.posterior_lodds_batch(X, hypotheses) - self.prior_lodds_batch(
+            hypotheses
+        )